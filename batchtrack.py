@@ -0,0 +1,262 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import optparse
+import os
+import re
+import shutil
+import time
+from kinematics import Speed
+import bufferpool
+import detection
+import framewriter
+import frameloader
+import pipeline
+import spritestore
+import trialdata
+import videostore
+
+###########################
+#   HEADLESS TRACKING     #
+###########################
+# runs the detection and Speed computation of track() over recorded footage,
+# with no windows and no camera, as fast as frames can be decoded:
+#   python batchtrack.py [options] VIDEO_OR_FOLDER [...]
+# a source is a video file, a folder of images (taken in frame number order),
+# or a saved trial folder (whose recorded timesteps are reused unless --fps is given)
+# each source becomes a trial folder under --output, holding background.png
+# and Data.bin, and the frames too with --frames
+DEFAULT_FPS = 30.0
+IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"]
+
+# number in a file name, so frame_2.png sorts before frame_10.png
+def frame_number(name):
+    numbers = re.findall(r"\d+", name)
+    if numbers:
+	return int(numbers[-1])
+    return -1
+
+# image files of a folder, in frame number order
+def image_files(folder):
+    names = []
+    for name in os.listdir(folder):
+	if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+	    names.append((frame_number(name), name))
+    names.sort()
+    return [os.path.join(folder, name) for number, name in names]
+
+# whether folder was written by the recorder (frame_<n>.png files, a container
+# or sprites)
+def is_trial_folder(folder):
+    return (videostore.has_container(folder) or spritestore.has_sprites(folder) or trialdata.is_trial(folder)
+	    or os.path.exists(os.path.join(folder, "frame_0.png")))
+
+# frames of a video file as (image, timestamp) pairs, timed by fps
+# (the file's own frame rate if fps is None)
+def video_frames(path, fps = None):
+    capture = cv.CaptureFromFile(path)
+    if not capture:
+	raise IOError("could not open video " + path)
+    if not fps:
+	fps = cv.GetCaptureProperty(capture, cv.CV_CAP_PROP_FPS)
+	# some containers report nothing, or nonsense
+	if not fps > 0 or fps > 1000:
+	    fps = DEFAULT_FPS
+    index = 0
+    while True:
+	frame = cv.QueryFrame(capture)
+	if not frame:
+	    break
+	yield frame, index / float(fps)
+	index += 1
+
+# frames of a folder of images as (image, timestamp) pairs, timed by fps
+def sequence_frames(folder, fps = None):
+    fps = fps or DEFAULT_FPS
+    for index, path in enumerate(image_files(folder)):
+	img = cv.LoadImage(path, cv.CV_LOAD_IMAGE_COLOR)
+	if img is not None:
+	    yield img, index / float(fps)
+
+# frames of a saved trial as (image, timestamp) pairs, frame 0 (the background) first
+# timestamps come from the times the trial's frames were recorded at (see
+# trialdata.frame_times) when they cover the saved frames, and from fps
+# (DEFAULT_FPS if None) otherwise
+def trial_frames(folder, fps = None):
+    if videostore.has_container(folder):
+	reader = videostore.ContainerReader(folder)
+	num_frames = reader.num_frames()
+	reader.close()
+    elif spritestore.has_sprites(folder):
+	reader = spritestore.SpriteReader(folder)
+	num_frames = reader.num_frames()
+	reader.close()
+    else:
+	numbers = [frame_number(path) for path in image_files(folder) if os.path.basename(path).startswith("frame_")]
+	num_frames = max(numbers + [-1]) + 1
+    times = None
+    if fps is None and trialdata.is_trial(folder):
+	times = trialdata.frame_times(folder)
+	if times is not None and len(times) != num_frames:
+	    times = None
+    fps = fps or DEFAULT_FPS
+    frames = frameloader.FrameSource(folder, num_frames, cache_size = 32)
+    try:
+	for index in range(num_frames):
+	    img = frames.get(index)
+	    # frames dropped while recording
+	    if img is None:
+		continue
+	    if times is not None:
+		yield img, float(times[index])
+	    else:
+		yield img, index / float(fps)
+    finally:
+	frames.close()
+
+# (image, timestamp) pairs of any kind of source
+def source_frames(source, fps = None):
+    if os.path.isdir(source):
+	if is_trial_folder(source):
+	    return trial_frames(source, fps)
+	return sequence_frames(source, fps)
+    if not os.path.exists(source):
+	raise IOError("no such file or folder: " + source)
+    return video_frames(source, fps)
+
+# detection function of the kind track() uses, from the command line options:
+# detect(frame, hsv, thresh, displacement) -> (x, y, area)
+def make_detector(options):
+    lookup = None
+    if options.lookup:
+	lookup = detection.ColorLookup()
+    region = detection.RegionSearch()
+    pyramid = detection.PyramidSearch(options.levels)
+    def detect(frame, hsv, thresh, displacement):
+	if options.mode == "roi":
+	    return region.detect(frame, hsv, thresh, options.low_color, options.high_color, options.min_sv, options.max_sv, displacement, lookup)
+	elif options.mode == "pyramid":
+	    return pyramid.detect(frame, hsv, thresh, options.low_color, options.high_color, options.min_sv, options.max_sv, lookup)
+	return detection.detect_full(frame, hsv, thresh, options.low_color, options.high_color, options.min_sv, options.max_sv, lookup)
+    return detect
+
+# what to record about how a trial was tracked (see trialdata.save_trial)
+def tracking_settings(source, options):
+    return {"source": os.path.abspath(source),
+	    "low_color": options.low_color,
+	    "high_color": options.high_color,
+	    "min_sv": options.min_sv,
+	    "max_sv": options.max_sv,
+	    "detection": options.mode,
+	    "conversion_factor": options.conversion_factor}
+
+# track the object through one source, as track() does while recording: the
+# first frame is the background, and every later frame the object is found in
+# becomes a sample
+# if out_folder is given, background.png and Data.bin are written there (and
+# the frames, if options.frames is "png", "mjpeg" or "sprites")
+# returns (tracker, number of frames read)
+def track_source(source, options, out_folder = None):
+    detect = make_detector(options)
+    tracker = Speed(streaming = True)
+    tracker.out_folder = out_folder
+    buffers = bufferpool.BufferPool()
+    writer = None
+    frame_index = 0
+    last_time = None
+    num_frames = 0
+    try:
+	for frame, timestamp in source_frames(source, options.fps):
+	    num_frames += 1
+	    if last_time is None:
+		last_time = timestamp
+		tracker.start_time = timestamp
+		if out_folder:
+		    cv.SaveImage(os.path.join(out_folder, "background.png"), frame)
+		    # no time pressure here, so wait for the writer instead of dropping frames
+		    if options.frames == "mjpeg":
+			writer = videostore.ContainerWriter(out_folder, max_wait = None)
+		    elif options.frames == "png":
+			writer = framewriter.FrameWriter(out_folder, max_wait = None)
+		    elif options.frames == "sprites":
+			writer = spritestore.SpriteWriter(out_folder, max_wait = None)
+		    if writer and not writer.sprites:
+			writer.write(frame_index, frame)
+		continue
+	    buffers.fit(frame)
+	    hsv = buffers.frame_sized("hsv", 3)
+	    thresh = buffers.frame_sized("thresh", 1)
+	    x, y, area = detect(frame, hsv, thresh, tracker.next_step())
+	    if area > 0:
+		tracker.add_pos(x, y, timestamp - last_time)
+		last_time = timestamp
+		if writer:
+		    frame_index += 1
+		    if writer.sprites:
+			box = detection.mask_box(thresh, pipeline.SPRITE_MARGIN)
+			writer.write(frame_index, frame, [box])
+		    else:
+			writer.write(frame_index, frame)
+    finally:
+	if writer:
+	    writer.close(wait = True)
+    tracker.stop_time = last_time or 0.0
+    tracker.update()
+    if out_folder:
+	trialdata.save_trial(tracker, out_folder, tracking_settings(source, options))
+    return tracker, num_frames
+
+# trial folder a source is saved to: output/Trial_<source name>
+def trial_folder_for(source, output):
+    name = os.path.basename(os.path.normpath(source))
+    if not os.path.isdir(source):
+	name = os.path.splitext(name)[0]
+    if not name.startswith("Trial_"):
+	name = "Trial_" + name
+    return os.path.join(output, name)
+
+def option_parser():
+    parser = optparse.OptionParser(usage = "python batchtrack.py [options] VIDEO_OR_FOLDER [...]")
+    parser.add_option("--low", dest = "low_color", type = "int", default = 2, help = "start of the hue range (0-179) [%default]")
+    parser.add_option("--high", dest = "high_color", type = "int", default = 6, help = "end of the hue range (0-179) [%default]")
+    parser.add_option("--min-sv", dest = "min_sv", type = "int", default = 110, help = "minimum saturation and value [%default]")
+    parser.add_option("--max-sv", dest = "max_sv", type = "int", default = 255, help = "maximum saturation and value [%default]")
+    parser.add_option("--conversion", dest = "conversion_factor", type = "float", default = 1.0, help = "meters per pixel, from calibration [%default]")
+    parser.add_option("--fps", dest = "fps", type = "float", default = None, help = "frame rate of the footage (default: from the video, the trial's own timesteps, or 30)")
+    parser.add_option("--mode", dest = "mode", type = "choice", choices = ["full", "roi", "pyramid"], default = "full", help = "detection: full, roi or pyramid [%default]")
+    parser.add_option("--levels", dest = "levels", type = "int", default = 2, help = "pyramid levels for --mode pyramid [%default]")
+    parser.add_option("--lookup", dest = "lookup", action = "store_true", default = False, help = "threshold through a color lookup table")
+    parser.add_option("--frames", dest = "frames", type = "choice", choices = ["none", "png", "mjpeg", "sprites"], default = "none", help = "also save the tracked frames: none, png, mjpeg or sprites (the object only) [%default]")
+    parser.add_option("--output", dest = "output", default = "Videos", help = "folder to create trial folders in [%default]")
+    parser.add_option("--overwrite", dest = "overwrite", action = "store_true", default = False, help = "replace trial folders that already exist")
+    return parser
+
+def main():
+    parser = option_parser()
+    options, sources = parser.parse_args()
+    if not sources:
+	parser.error("no video file or folder given")
+    if not os.path.exists(options.output):
+	os.mkdir(options.output)
+    for source in sources:
+	out_folder = trial_folder_for(source, options.output)
+	if os.path.abspath(out_folder) == os.path.abspath(source):
+	    print "skipped " + source + " (its trial folder is the source itself; use another --output)"
+	    continue
+	if os.path.exists(out_folder):
+	    if not options.overwrite:
+		print "skipped " + source + " (" + out_folder + " exists; use --overwrite)"
+		continue
+	    shutil.rmtree(out_folder)
+	os.mkdir(out_folder)
+	start = time.time()
+	tracker, num_frames = track_source(source, options, out_folder)
+	elapsed = max(time.time() - start, 1e-6)
+	footage = tracker.stop_time - tracker.start_time
+	print "%s: %d frames in %.1f s (%.1f fps, %.1fx real time), %d samples, distance %.3f, top speed %.3f" % (
+	    out_folder, num_frames, elapsed, num_frames / elapsed, footage / elapsed, tracker.num_samples(),
+	    tracker.total_distance * options.conversion_factor, tracker.top_speed * options.conversion_factor)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python2.6
+
+# compares the per-frame work of the track() loop (threshold, moments, and
+# shrinking frame and mask for display) with images allocated fresh every
+# frame, as the loops used to, against images borrowed from a BufferPool:
+# allocations per frame and frame time jitter
+# frames are synthetic: a noisy background with an orange ball moving across it
+# (a short clip played over and over, so large resolutions fit in memory)
+# usage: python benchmarks/bench_buffer_pool.py [num_frames] [width height]
+import cv
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import bufferpool
+import detection
+
+DISPLAY_SIZE = (480, 360)
+
+def synthetic_frames(width, height, num_frames = 30):
+    background = cv.CreateImage((width, height), 8, 3)
+    rng = cv.RNG(0)
+    cv.RandArr(rng, background, cv.CV_RAND_NORMAL, cv.Scalar(120, 120, 120), cv.Scalar(20, 20, 20))
+    frames = []
+    for n in range(num_frames):
+	frame = cv.CloneImage(background)
+	x = int(width * (n + 0.5) / num_frames)
+	cv.Circle(frame, (x, height / 2), max(4, width / 40), cv.CV_RGB(255, 60, 0), thickness = -1)
+	frames.append(frame)
+    return frames
+
+# stands in for cv.CreateImage, counting calls
+class CountingAllocator(object):
+
+    def __init__(self):
+	self.count = 0
+
+    def __call__(self, size, depth, channels):
+	self.count += 1
+	return cv.CreateImage(size, depth, channels)
+
+# the loop as it was: every scratch image is new
+def fresh_frame(frame, create_image, pool):
+    size = cv.GetSize(frame)
+    hsv = create_image(size, 8, 3)
+    thresh = create_image(size, 8, 1)
+    result = detection.detect_full(frame, hsv, thresh, 2, 6, 110, 255)
+    small_thresh = create_image(DISPLAY_SIZE, 8, 1)
+    cv.Resize(thresh, small_thresh)
+    small_frame = create_image(DISPLAY_SIZE, 8, 3)
+    cv.Resize(frame, small_frame)
+    return result
+
+# the loop with a buffer pool
+def pooled_frame(frame, create_image, pool):
+    pool.fit(frame)
+    hsv = pool.frame_sized("hsv", 3)
+    thresh = pool.frame_sized("thresh", 1)
+    result = detection.detect_full(frame, hsv, thresh, 2, 6, 110, 255)
+    small_thresh = pool.get("small_thresh", DISPLAY_SIZE, 1)
+    cv.Resize(thresh, small_thresh)
+    small_frame = pool.get("small_frame", DISPLAY_SIZE, 3)
+    cv.Resize(frame, small_frame)
+    return result
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# returns (allocations per frame, mean, standard deviation, median and
+# 99th percentile frame time in milliseconds)
+def measure(process, frames, num_frames):
+    allocate = CountingAllocator()
+    pool = bufferpool.BufferPool(allocate)
+    times = []
+    for n in range(num_frames):
+	frame = frames[n % len(frames)]
+	start = time.time()
+	process(frame, allocate, pool)
+	times.append((time.time() - start) * 1000.0)
+    mean = sum(times) / len(times)
+    deviation = math.sqrt(sum([(t - mean) ** 2 for t in times]) / len(times))
+    return float(allocate.count) / num_frames, mean, deviation, percentile(times, 0.5), percentile(times, 0.99)
+
+def main():
+    num_frames = 500
+    if len(sys.argv) > 1:
+	num_frames = int(sys.argv[1])
+    sizes = [(640, 480), (1280, 960), (1920, 1080)]
+    if len(sys.argv) > 3:
+	sizes = [(int(sys.argv[2]), int(sys.argv[3]))]
+    print "%12s %8s %12s %10s %10s %10s %10s" % ("resolution", "images", "allocs/frame", "mean ms", "std ms", "p50 ms", "p99 ms")
+    for width, height in sizes:
+	frames = synthetic_frames(width, height)
+	for name, process in [("fresh", fresh_frame), ("pooled", pooled_frame)]:
+	    allocs, mean, deviation, median, worst = measure(process, frames, num_frames)
+	    print "%12s %8s %12.2f %10.2f %10.2f %10.2f %10.2f" % ("%dx%d" % (width, height), name, allocs, mean, deviation, median, worst)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python2.6
+
+# compares saving a recording as one PNG per frame against the single-file
+# MJPEG container and sprites (only the box around the ball in each frame):
+# encode throughput (frames per second) and size on disk
+# frames are synthetic: a noisy background with an orange ball moving across it
+# usage: python benchmarks/bench_frame_storage.py [num_frames] [width] [height]
+import cv
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import framewriter
+import pipeline
+import spritestore
+import videostore
+
+# returns the frames and the box around the ball in each
+def synthetic_frames(num_frames, width, height):
+    background = cv.CreateImage((width, height), 8, 3)
+    rng = cv.RNG(0)
+    cv.RandArr(rng, background, cv.CV_RAND_NORMAL, cv.Scalar(120, 120, 120), cv.Scalar(20, 20, 20))
+    frames = []
+    boxes = []
+    radius = max(4, width / 40)
+    for n in range(num_frames):
+	frame = cv.CloneImage(background)
+	x = int(width * (n + 0.5) / num_frames)
+	y = int(height / 2)
+	cv.Circle(frame, (x, y), radius, cv.CV_RGB(255, 120, 0), thickness = -1)
+	frames.append(frame)
+	# as pipeline.TrackingPipeline.object_boxes would find it
+	reach = radius + pipeline.SPRITE_MARGIN
+	left = max(0, x - reach)
+	top = max(0, y - reach)
+	boxes.append((left, top, min(width, x + reach + 1) - left, min(height, y + reach + 1) - top))
+    return frames, boxes
+
+def folder_size(folder):
+    return sum([os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)])
+
+# returns (frames per second, bytes on disk) for one writer class
+def measure(writer_class, frames, boxes):
+    folder = tempfile.mkdtemp()
+    try:
+	# a generous queue so nothing is dropped and encoding speed is what we time
+	start = time.time()
+	writer = writer_class(folder, max_pending = len(frames) + 1, max_wait = 10)
+	for n, frame in enumerate(frames):
+	    if writer.sprites:
+		writer.write(n, frame, [boxes[n]])
+	    else:
+		writer.write(n, frame)
+	writer.close(wait = True)
+	elapsed = time.time() - start
+	return len(frames) / elapsed, folder_size(folder)
+    finally:
+	shutil.rmtree(folder)
+
+def main():
+    num_frames = 300
+    if len(sys.argv) > 1:
+	num_frames = int(sys.argv[1])
+    sizes = [(640, 480), (1280, 960)]
+    if len(sys.argv) > 3:
+	sizes = [(int(sys.argv[2]), int(sys.argv[3]))]
+    print "%12s %8s %12s %14s" % ("resolution", "format", "encode fps", "MB on disk")
+    for width, height in sizes:
+	frames, boxes = synthetic_frames(num_frames, width, height)
+	for name, writer_class in [("png", framewriter.FrameWriter), ("mjpeg", videostore.ContainerWriter),
+				   ("sprites", spritestore.SpriteWriter)]:
+	    fps, size = measure(writer_class, frames, boxes)
+	    print "%12s %8s %12.1f %14.1f" % ("%dx%d" % (width, height), name, fps, size / (1024.0 * 1024.0))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python2.6
+
+# compares the vectorized kinematics engine against the per-sample loop
+# that Speed.update() used to run, at 1k, 100k and 1M samples
+# usage: python benchmarks/bench_kinematics.py [num_samples ...]
+import math
+import os
+import random
+import sys
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import kinematics
+
+# the original Speed.update() loop, kept here as the reference
+def loop_metrics(x, y, t):
+    metrics = {}
+    for p in kinematics.METRIC_NAMES:
+	metrics[p] = [0.0]
+    x_s = zip(x, x[1:])
+    y_s = zip(y, y[1:])
+    for n, timestep in enumerate(t):
+	metrics["x_pos"].append(x_s[n][0])
+	metrics["y_pos"].append(y_s[n][0])
+	curr_vx = float(x_s[n][1] - x_s[n][0]) / float(timestep)
+	curr_vy = float(y_s[n][1] - y_s[n][0]) / float(timestep)
+	metrics["v_x"].append(curr_vx)
+	metrics["v_y"].append(curr_vy)
+	v_net = math.sqrt(math.pow(curr_vx, 2) + math.pow(curr_vy, 2))
+	metrics["v_net"].append(v_net)
+	metrics["a_x"].append((curr_vx - metrics["v_x"][-2])/timestep)
+	metrics["a_y"].append((curr_vy - metrics["v_y"][-2])/timestep)
+	metrics["a_net"].append(math.sqrt(math.pow(curr_vx, 2) + math.pow(curr_vy, 2)))
+	avg_v = (v_net + metrics["v_net"][-2])/2.0
+	metrics["distance"].append(avg_v * timestep)
+	metrics["time"].append(timestep)
+    return metrics
+
+# a ball wandering around a 640x480 frame at roughly 30 fps
+def random_trial(num_samples):
+    x = [0.0]
+    y = [0.0]
+    t = []
+    px, py = 320.0, 240.0
+    for i in xrange(num_samples):
+	px = min(max(px + random.gauss(0, 5), 0), 640)
+	py = min(max(py + random.gauss(0, 5), 0), 480)
+	x.append(px)
+	y.append(py)
+	t.append(random.uniform(0.025, 0.040))
+    return x, y, t
+
+def best_of(repeats, func, *args):
+    best = None
+    for r in range(repeats):
+	start = time.time()
+	result = func(*args)
+	elapsed = time.time() - start
+	if best is None or elapsed < best:
+	    best = elapsed
+    return best, result
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or [1000, 100000, 1000000]
+    print "%10s %12s %12s %10s %12s" % ("samples", "loop (s)", "numpy (s)", "speedup", "max error")
+    for num_samples in sizes:
+	x, y, t = random_trial(num_samples)
+	repeats = max(1, min(5, 1000000 / num_samples))
+	loop_time, expected = best_of(repeats, loop_metrics, x, y, t)
+	numpy_time, actual = best_of(repeats, kinematics.compute_metrics, x, y, t)
+	error = max([numpy.abs(numpy.asarray(expected[p]) - actual[p]).max() for p in kinematics.METRIC_NAMES])
+	print "%10d %12.4f %12.4f %9.1fx %12.3g" % (num_samples, loop_time, numpy_time, loop_time / numpy_time, error)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python2.6
+
+# compares the memory and pickled size of the buffer-backed Speed against
+# the original list-based class, after recording and updating a trial
+# each variant runs in its own process so peak RSS is measured separately
+# usage: python benchmarks/bench_memory.py [num_samples]
+import os
+import pickle
+import random
+import resource
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import kinematics
+from bench_kinematics import loop_metrics
+
+# the original list-based Speed class (old-style, as it was pickled)
+class ListSpeed:
+    def __init__(self):
+	self.start_time = 0.0
+	self.stop_time = 0.0
+	self.out_folder = ""
+	self.x = [0.0]
+	self.y = [0.0]
+	self.t = []
+
+    def add_pos(self, x_val, y_val, timestep):
+	self.x.append(float(x_val))
+	self.y.append(float(y_val))
+	self.t.append(float(timestep))
+
+    def update(self):
+	self.metrics = loop_metrics(self.x, self.y, self.t)
+
+# peak resident set size of this process, in MB
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def measure(variant, num_samples):
+    random.seed(0)
+    before = peak_rss()
+    if variant == "list":
+	tracker = ListSpeed()
+    else:
+	tracker = kinematics.Speed()
+    for i in xrange(num_samples):
+	tracker.add_pos(random.uniform(0, 640), random.uniform(0, 480), random.uniform(0.025, 0.040))
+    tracker.update()
+    used = peak_rss() - before
+    # track() pickles with the default protocol
+    pickled = len(pickle.dumps(tracker)) / (1024.0 * 1024.0)
+    print "%s %f %f" % (variant, used, pickled)
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--variant":
+	measure(sys.argv[2], int(sys.argv[3]))
+	return
+    num_samples = 1000000
+    if len(sys.argv) > 1:
+	num_samples = int(sys.argv[1])
+    print "%d samples" % num_samples
+    print "%10s %14s %14s" % ("class", "peak RSS (MB)", "pickle (MB)")
+    for variant in ["list", "compact"]:
+	out = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--variant", variant, str(num_samples)],
+			       stdout=subprocess.PIPE).communicate()[0]
+	name, used, pickled = out.split()
+	print "%10s %14.1f %14.1f" % (name, float(used), float(pickled))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python2.6
+
+# compares full-frame detection against coarse-to-fine (pyramid) detection at
+# several camera resolutions: frames per second of detection alone, and how far
+# the pyramid centroid lands from the full-frame moments centroid
+# frames are synthetic: a noisy background with an orange ball moving across it
+# usage: python benchmarks/bench_pyramid.py [num_frames] [width height]
+import cv
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import detection
+
+# the tracking range track() starts with (orange ping-pong ball)
+LOW_COLOR = 2
+HIGH_COLOR = 6
+MED_SV = 110
+MAX_SV = 255
+
+def synthetic_frames(num_frames, width, height):
+    background = cv.CreateImage((width, height), 8, 3)
+    rng = cv.RNG(0)
+    cv.RandArr(rng, background, cv.CV_RAND_NORMAL, cv.Scalar(120, 120, 120), cv.Scalar(20, 20, 20))
+    frames = []
+    for n in range(num_frames):
+	frame = cv.CloneImage(background)
+	x = int(width * (n + 0.5) / num_frames)
+	y = int(height / 2 + height / 4 * math.sin(n * 0.1))
+	cv.Circle(frame, (x, y), max(4, width / 40), cv.CV_RGB(255, 60, 0), thickness = -1)
+	frames.append(frame)
+    return frames
+
+# returns (frames per second, [(x, y, area) per frame]) for one detector
+def measure(detect, frames):
+    size = cv.GetSize(frames[0])
+    hsv = cv.CreateImage(size, 8, 3)
+    thresh = cv.CreateImage(size, 8, 1)
+    results = []
+    start = time.time()
+    for frame in frames:
+	results.append(detect(frame, hsv, thresh, LOW_COLOR, HIGH_COLOR, MED_SV, MAX_SV))
+    elapsed = time.time() - start
+    return len(frames) / elapsed, results
+
+# mean and largest centroid distance, in full-resolution pixels
+def centroid_error(expected, actual):
+    errors = []
+    for (x_0, y_0, area_0), (x_1, y_1, area_1) in zip(expected, actual):
+	if area_0 > 0 and area_1 > 0:
+	    errors.append(math.hypot(x_1 - x_0, y_1 - y_0))
+    if not errors:
+	return 0.0, 0.0
+    return sum(errors) / len(errors), max(errors)
+
+def main():
+    num_frames = 200
+    if len(sys.argv) > 1:
+	num_frames = int(sys.argv[1])
+    sizes = [(640, 480), (1280, 960), (1920, 1080), (2592, 1944)]
+    if len(sys.argv) > 3:
+	sizes = [(int(sys.argv[2]), int(sys.argv[3]))]
+    print "%12s %10s %10s %10s %12s %12s" % ("resolution", "method", "fps", "speedup", "mean error", "max error")
+    for width, height in sizes:
+	frames = synthetic_frames(num_frames, width, height)
+	full_fps, expected = measure(detection.detect_full, frames)
+	print "%12s %10s %10.1f %9.1fx %12s %12s" % ("%dx%d" % (width, height), "full", full_fps, 1.0, "-", "-")
+	for levels in [1, 2, 3]:
+	    search = detection.PyramidSearch(levels)
+	    fps, actual = measure(search.detect, frames)
+	    mean_error, max_error = centroid_error(expected, actual)
+	    print "%12s %10s %10.1f %9.1fx %12.3g %12.3g" % ("", "pyramid/%d" % levels, fps, fps / full_fps, mean_error, max_error)
+
+if __name__ == '__main__':
+    main()
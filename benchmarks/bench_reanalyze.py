@@ -0,0 +1,64 @@
+#!/usr/bin/env python2.6
+
+# times re-analysis of a synthetic archive with 1, 2, 4, ... worker processes
+# (up to the number of cores) to show how it scales
+# usage: python benchmarks/bench_reanalyze.py [num_trials] [samples_per_trial]
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from kinematics import Speed
+import reanalyze
+import trialdata
+
+# an archive folder of trials, each a ball wandering around a 640x480 frame at about 30 fps
+def synthetic_archive(num_trials, num_samples):
+    archive = tempfile.mkdtemp()
+    for n in range(num_trials):
+	folder = os.path.join(archive, "Trial_" + str(n))
+	os.mkdir(folder)
+	speed = Speed()
+	px, py = 320.0, 240.0
+	for i in xrange(num_samples):
+	    px = min(max(px + random.gauss(0, 5), 0), 640)
+	    py = min(max(py + random.gauss(0, 5), 0), 480)
+	    speed.add_pos(px, py, random.uniform(0.025, 0.040))
+	speed.update()
+	trialdata.save_trial(speed, folder)
+    return archive
+
+def main():
+    num_trials = 200
+    num_samples = 20000
+    if len(sys.argv) > 1:
+	num_trials = int(sys.argv[1])
+    if len(sys.argv) > 2:
+	num_samples = int(sys.argv[2])
+    archive = synthetic_archive(num_trials, num_samples)
+    try:
+	cores = multiprocessing.cpu_count()
+	counts = [1]
+	while counts[-1] * 2 <= cores:
+	    counts.append(counts[-1] * 2)
+	if counts[-1] != cores:
+	    counts.append(cores)
+	print "%d trials of %d samples, %d cores" % (num_trials, num_samples, cores)
+	print "%8s %10s %12s %10s" % ("jobs", "time (s)", "trials/s", "speedup")
+	base = None
+	for jobs in counts:
+	    start = time.time()
+	    rows = reanalyze.analyze_archive([archive], jobs = jobs)
+	    elapsed = time.time() - start
+	    if base is None:
+		base = elapsed
+	    print "%8d %10.2f %12.1f %9.1fx" % (jobs, elapsed, len(rows) / elapsed, base / elapsed)
+    finally:
+	shutil.rmtree(archive)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python2.6
+
+# end-to-end benchmark on synthetic footage (see synthetic.py), timing each
+# stage a trial goes through with no camera or window:
+#   detection  every detection mode, against the drawn centroid
+#   kinematics Speed.recompute() over the whole trial and streaming add_pos,
+#              against the analytic velocity of the path
+#   replay     min_max as display_video calls it, the per-step values, colors
+#              and text StepValues works out when a replay loads, writing
+#              the text panels, ReplayRenderer.render in each draw mode, and
+#              jumping to random steps
+# each stage reports frames per second and p50/p90/p99 latency per call
+# usage: python benchmarks/bench_suite.py [options]
+import cv
+import math
+import optparse
+import os
+import sys
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from kinematics import Speed, min_max
+import detection
+import replay
+from synthetic import SyntheticVideo
+
+# the tracking range track() starts with (orange ping-pong ball)
+LOW_COLOR = 2
+HIGH_COLOR = 6
+MED_SV = 110
+MAX_SV = 255
+DETECTION_MODES = ["full", "roi", "pyramid", "lookup"]
+DRAW_MODES = ["circle", "line", "v_path"]
+
+# (p50, p90, p99) of a list of call times, in milliseconds
+def percentiles(times):
+    ms = numpy.array(times) * 1000.0
+    return numpy.percentile(ms, 50), numpy.percentile(ms, 90), numpy.percentile(ms, 99)
+
+def print_header():
+    print "%-22s %7s %10s %8s %8s %8s   %s" % ("stage", "calls", "fps", "p50 ms", "p90 ms", "p99 ms", "error")
+    print "-" * 90
+
+def print_row(name, times, error = ""):
+    p50, p90, p99 = percentiles(times)
+    total = sum(times)
+    fps = 0.0
+    if total > 0:
+	fps = len(times) / total
+    print "%-22s %7d %10.1f %8.3f %8.3f %8.3f   %s" % (name, len(times), fps, p50, p90, p99, error)
+
+# detect(frame, hsv, thresh, displacement) -> (x, y, area) for one mode
+def make_detector(mode):
+    lookup = None
+    if mode == "lookup":
+	lookup = detection.ColorLookup()
+    region = detection.RegionSearch()
+    pyramid = detection.PyramidSearch()
+    def detect(frame, hsv, thresh, displacement):
+	if mode == "roi":
+	    return region.detect(frame, hsv, thresh, LOW_COLOR, HIGH_COLOR, MED_SV, MAX_SV, displacement)
+	elif mode == "pyramid":
+	    return pyramid.detect(frame, hsv, thresh, LOW_COLOR, HIGH_COLOR, MED_SV, MAX_SV)
+	return detection.detect_full(frame, hsv, thresh, LOW_COLOR, HIGH_COLOR, MED_SV, MAX_SV, lookup)
+    return detect
+
+# detect the ball in every frame after the first (the background), feeding a
+# streaming Speed as track() does
+# returns (detection times, add_pos times, tracker, sample frames, centroid errors)
+# sample frames are the frame numbers that became samples, after frame 0 (the
+# background), so sample_frames[k] is the frame of sample k as replay numbers them
+def run_detection(video, frames, mode):
+    detect = make_detector(mode)
+    size = video.size
+    hsv = cv.CreateImage(size, 8, 3)
+    thresh = cv.CreateImage(size, 8, 1)
+    tracker = Speed(streaming = True)
+    detect_times = []
+    add_times = []
+    errors = []
+    sample_frames = [0]
+    last_time = video.time(0)
+    for n in range(1, len(frames)):
+	displacement = None
+	if mode == "roi":
+	    displacement = tracker.next_step()
+	start = time.time()
+	x, y, area = detect(frames[n], hsv, thresh, displacement)
+	detect_times.append(time.time() - start)
+	if area <= 0:
+	    continue
+	truth_x, truth_y = video.position(video.time(n))
+	errors.append(math.hypot(x - truth_x, y - truth_y))
+	start = time.time()
+	tracker.add_pos(x, y, video.time(n) - last_time)
+	add_times.append(time.time() - start)
+	last_time = video.time(n)
+	sample_frames.append(n)
+    return detect_times, add_times, tracker, sample_frames, errors
+
+# mean and max distance of the measured velocity from the path's own velocity
+# at the middle of each timestep (the first sample has no velocity yet)
+def velocity_error(video, tracker, sample_frames):
+    v_x = tracker.metrics["v_x"]
+    v_y = tracker.metrics["v_y"]
+    errors = []
+    for k in range(2, tracker.num_samples() + 1):
+	truth_x, truth_y = video.velocity(0.5 * (video.time(sample_frames[k - 1]) + video.time(sample_frames[k])))
+	errors.append(math.hypot(v_x[k] - truth_x, v_y[k] - truth_y))
+    if not errors:
+	return "no samples"
+    return "velocity mean %.2f, max %.2f px/s" % (numpy.mean(errors), numpy.max(errors))
+
+def describe_centroid(errors, num_frames):
+    if not errors:
+	return "never found"
+    return "centroid mean %.2f, max %.2f px, found %d/%d" % (numpy.mean(errors), numpy.max(errors), len(errors), num_frames)
+
+# whole-trial recompute on a copy of the tracker's samples, repeats times
+def time_recompute(tracker, repeats):
+    n = tracker.num_samples()
+    times = []
+    for r in range(repeats):
+	speed = Speed()
+	speed.use_buffer(numpy.array(tracker.buffer()), n, 0.0, 0.0)
+	start = time.time()
+	speed.recompute()
+	times.append(time.time() - start)
+    return times, speed
+
+# the outlier scan ReplayRenderer runs once per replay
+def time_min_max(tracker, repeats):
+    times = []
+    for r in range(repeats):
+	start = time.time()
+	for f in replay.FIELDS:
+	    if f is not "v_net" and f is not "a_net":
+		min_max(tracker.metrics[f], f, which_vals = "neg")
+	    min_max(tracker.metrics[f], f, which_vals = "pos")
+	times.append(time.time() - start)
+    return times
+
+# the tables StepValues builds once per replay
+def time_step_values(tracker, repeats):
+    times = []
+    for r in range(repeats):
+	start = time.time()
+	replay.StepValues(tracker)
+	times.append(time.time() - start)
+    return times
+
+# every step of a replay written to the text panels alone
+def time_panels(tracker):
+    font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 1.0, 1.0, 0, 1, cv.CV_AA)
+    values = replay.StepValues(tracker)
+    panels = replay.ReplayPanels(font)
+    times = []
+    for img_index in range(1, tracker.num_frames()):
+	start = time.time()
+	panels.write(img_index, values)
+	times.append(time.time() - start)
+    return times
+
+# every step of a replay in one draw mode, drawing over the recorded frames as
+# "Show full video" does
+def time_replay(tracker, frames, sample_frames, draw_mode):
+    recorded = [frames[n] for n in sample_frames]
+    renderer = replay.ReplayRenderer(tracker, recorded[0])
+    times = []
+    shown = 0
+    for img_index in range(1, len(recorded)):
+	start = time.time()
+	if renderer.render(img_index, recorded[img_index], draw_mode, 10, (0, 255, 255)):
+	    shown += 1
+	times.append(time.time() - start)
+    return times, shown
+
+# jumps to random steps, each drawn in "v_path" mode as the seek bar does
+def time_seek(tracker, frames, sample_frames, repeats, seed):
+    recorded = [frames[n] for n in sample_frames]
+    renderer = replay.ReplayRenderer(tracker, recorded[0])
+    rng = numpy.random.RandomState(seed)
+    times = []
+    for img_index in rng.randint(1, len(recorded), repeats):
+	start = time.time()
+	renderer.seek(img_index)
+	renderer.render(img_index, recorded[img_index], "v_path", 10, (0, 255, 255))
+	times.append(time.time() - start)
+    return times
+
+def option_parser():
+    parser = optparse.OptionParser(usage = "python benchmarks/bench_suite.py [options]")
+    parser.add_option("--width", dest = "width", type = "int", default = 640, help = "frame width [%default]")
+    parser.add_option("--height", dest = "height", type = "int", default = 480, help = "frame height [%default]")
+    parser.add_option("--fps", dest = "fps", type = "float", default = 30.0, help = "frame rate of the footage [%default]")
+    parser.add_option("--frames", dest = "num_frames", type = "int", default = 300, help = "frames of footage [%default]")
+    parser.add_option("--noise", dest = "noise", type = "float", default = 8.0, help = "standard deviation of the pixel noise [%default]")
+    parser.add_option("--radius", dest = "radius", type = "int", default = None, help = "ball radius in pixels (default: width / 40)")
+    parser.add_option("--seed", dest = "seed", type = "int", default = 0, help = "random seed [%default]")
+    parser.add_option("--repeats", dest = "repeats", type = "int", default = 50, help = "repeats of the whole-trial stages [%default]")
+    parser.add_option("--modes", dest = "modes", default = ",".join(DETECTION_MODES), help = "detection modes to run [%default]")
+    return parser
+
+def main():
+    options, args = option_parser().parse_args()
+    video = SyntheticVideo(options.width, options.height, options.fps, options.num_frames, options.radius, options.noise, seed = options.seed)
+    # rendered up front, so generating the footage is not timed
+    frames = [video.render(n) for n in range(video.num_frames)]
+    print "%d frames of %dx%d at %.0f fps, ball radius %d, noise %.1f" % (
+	video.num_frames, video.size[0], video.size[1], video.fps, video.radius, video.noise)
+    print_header()
+    tracker = None
+    sample_frames = None
+    for mode in options.modes.split(","):
+	detect_times, add_times, mode_tracker, mode_frames, errors = run_detection(video, frames, mode)
+	print_row("detect/" + mode, detect_times, describe_centroid(errors, len(frames) - 1))
+	if tracker is None and add_times:
+	    print_row("speed.add_pos", add_times, velocity_error(video, mode_tracker, mode_frames))
+	    tracker = mode_tracker
+	    sample_frames = mode_frames
+    if tracker is None:
+	print "the ball was never found, nothing to replay"
+	return
+    times, speed = time_recompute(tracker, options.repeats)
+    print_row("speed.recompute", times, velocity_error(video, speed, sample_frames))
+    print_row("min_max", time_min_max(tracker, options.repeats))
+    print_row("replay/step values", time_step_values(tracker, options.repeats))
+    print_row("replay/panels", time_panels(tracker))
+    for draw_mode in DRAW_MODES:
+	times, shown = time_replay(tracker, frames, sample_frames, draw_mode)
+	print_row("replay/" + draw_mode, times, "%d/%d steps shown" % (shown, len(times)))
+    print_row("replay/seek", time_seek(tracker, frames, sample_frames, options.repeats, options.seed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python2.6
+
+# synthetic footage with a known ground truth, for benchmarks that need no
+# camera: a colored disk moving along a Lissajous path over a noisy gray
+# background, at any resolution, noise level and frame rate
+import cv
+import math
+
+# BGR color the default tracking range (hue 2 to 6, orange) picks up
+BALL_COLOR = cv.CV_RGB(255, 40, 0)
+# sub-pixel bits for drawing, so the disk's center is not rounded to a whole pixel
+SHIFT = 4
+
+class SyntheticVideo(object):
+
+    # noise is the standard deviation of the per-frame pixel noise (0 for none)
+    # the disk crosses the frame in about period seconds
+    def __init__(self, width = 640, height = 480, fps = 30.0, num_frames = 300, radius = None, noise = 8.0, period = 4.0, seed = 0):
+	self.size = (width, height)
+	self.fps = float(fps)
+	self.num_frames = num_frames
+	self.radius = radius or max(4, width / 40)
+	self.noise = noise
+	self.period = period
+	self.background = cv.CreateImage(self.size, 8, 3)
+	cv.RandArr(cv.RNG(seed), self.background, cv.CV_RAND_NORMAL, cv.Scalar(120, 120, 120), cv.Scalar(20, 20, 20))
+	self.rng = cv.RNG(seed + 1)
+	self.noise_img = cv.CreateImage(self.size, 8, 3)
+
+    # time of frame n, in seconds
+    def time(self, n):
+	return n / self.fps
+
+    # x and y angular frequencies of the path
+    def frequencies(self):
+	w = 2 * math.pi / self.period
+	return w, 1.6 * w
+
+    # ground truth center (x, y) at time t, in pixels
+    def position(self, t):
+	w_x, w_y = self.frequencies()
+	a_x = 0.5 * self.size[0] - 2 * self.radius
+	a_y = 0.5 * self.size[1] - 2 * self.radius
+	return (0.5 * self.size[0] + a_x * math.sin(w_x * t),
+		0.5 * self.size[1] + a_y * math.sin(w_y * t + math.pi / 4))
+
+    # ground truth velocity (v_x, v_y) at time t, in pixels per second
+    def velocity(self, t):
+	w_x, w_y = self.frequencies()
+	a_x = 0.5 * self.size[0] - 2 * self.radius
+	a_y = 0.5 * self.size[1] - 2 * self.radius
+	return (a_x * w_x * math.cos(w_x * t),
+		a_y * w_y * math.cos(w_y * t + math.pi / 4))
+
+    # render frame n into out (an 8-bit, 3-channel image of this video's size)
+    def frame(self, n, out):
+	cv.Copy(self.background, out)
+	x, y = self.position(self.time(n))
+	scale = 1 << SHIFT
+	cv.Circle(out, (int(round(x * scale)), int(round(y * scale))), self.radius * scale, BALL_COLOR, -1, cv.CV_AA, SHIFT)
+	if self.noise > 0:
+	    # zero-mean noise, stored around 128 since the image is unsigned
+	    cv.RandArr(self.rng, self.noise_img, cv.CV_RAND_NORMAL, cv.Scalar(128, 128, 128), cv.Scalar(self.noise, self.noise, self.noise))
+	    cv.AddWeighted(out, 1.0, self.noise_img, 1.0, -128.0, out)
+	return out
+
+    # a new image holding frame n
+    def render(self, n):
+	return self.frame(n, cv.CreateImage(self.size, 8, 3))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+
+###########################
+#   SHARED IMAGE BUFFERS  #
+###########################
+# scratch images shared by the capture loops, so nothing is allocated per frame
+# an image is asked for by name, size and channel count, and the same IplImage
+# comes back every time for the same request; a loop that asks for the same
+# images each frame only allocates on its first frame
+# every image is dropped when a frame of a different size arrives (the camera
+# or its resolution changed), since most of them are sized after the frame
+class BufferPool(object):
+
+    def __init__(self, create_image = cv.CreateImage):
+	self.create_image = create_image
+	# (name, size, channels, depth) -> image
+	self.images = {}
+	self.frame_size = None
+	# counts, for measuring allocation churn
+	self.allocations = 0
+	self.requests = 0
+
+    # note the size of the frame just captured, dropping every image if it changed
+    # returns the frame size
+    def fit(self, frame):
+	size = cv.GetSize(frame)
+	if size != self.frame_size:
+	    self.clear()
+	    self.frame_size = size
+	return size
+
+    # the image called name with the given size and channel count
+    # contents are whatever the last user left there
+    def get(self, name, size, channels, depth = 8):
+	key = (name, tuple(size), channels, depth)
+	self.requests += 1
+	img = self.images.get(key)
+	if img is None:
+	    img = self.create_image(key[1], depth, channels)
+	    self.images[key] = img
+	    self.allocations += 1
+	return img
+
+    # an image the size of the last frame passed to fit()
+    def frame_sized(self, name, channels, depth = 8):
+	return self.get(name, self.frame_size, channels, depth)
+
+    def clear(self):
+	self.images = {}
+	self.frame_size = None
+
+    # human-readable summary of the pool's use
+    def report(self):
+	return "%d images allocated for %d requests" % (self.allocations, self.requests)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import math
+import numpy
+from timing import NO_TIMER
+
+###########################
+#     OBJECT DETECTION    #
+###########################
+# threshold frame (or the ROI set on it) into thresh by hue, saturation and value
+# hsv is scratch space the same size as frame
+# timer (a timing.StageTimer) times the conversion and the range check
+def threshold_hsv(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, timer = NO_TIMER):
+    started = timer.start()
+    cv.CvtColor(frame, hsv, cv.CV_BGR2HSV)
+    started = timer.lap("CvtColor", started)
+    cv.InRangeS(hsv, cv.Scalar(low_color, min_sv, min_sv), cv.Scalar(high_color, max_sv, max_sv), thresh)
+    timer.stop("InRangeS", started)
+
+# threshold with the lookup table if one is given, otherwise by converting to HSV
+# (a lookup table is kept in step with the range through label 0)
+def threshold(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, lookup = None, timer = NO_TIMER):
+    if lookup is None:
+	threshold_hsv(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, timer)
+    else:
+	started = timer.start()
+	lookup.set_range(0, low_color, high_color, min_sv, max_sv)
+	lookup.mask(frame, thresh)
+	timer.stop("lookup", started)
+
+# precomputed BGR -> in-range lookup table
+# each BGR channel is quantized to bits bits, and every quantized color is
+# converted to HSV and range-checked once, when the table is built; a frame is
+# then thresholded with one table lookup per pixel and no HSV conversion
+# up to 8 ranges (labels) share one table, each setting its own bit in an entry,
+# so the three angle() markers are found in a single pass
+# the table is rebuilt lazily, on first use after a range has changed
+class ColorLookup(object):
+
+    def __init__(self, bits = 6):
+	self.bits = bits
+	self.ranges = {}
+	self.table = None
+	# scratch space for the table indices, grown to the largest frame (or ROI) seen
+	self.indices = None
+
+    # set the range of one label: hue in [low_color, high_color), saturation and
+    # value in [min_sv, max_sv), as cv.InRangeS checks them
+    def set_range(self, label, low_color, high_color, min_sv, max_sv):
+	new_range = (low_color, high_color, min_sv, max_sv)
+	if self.ranges.get(label) != new_range:
+	    self.ranges[label] = new_range
+	    self.table = None
+
+    # build the table: bit (1 << label) is set for colors in that label's range
+    def build(self):
+	bits = self.bits
+	levels = 1 << bits
+	shift = 8 - bits
+	# the center of every quantization bin, in table order (b, g, r)
+	centers = (numpy.arange(levels) << shift) + ((1 << shift) >> 1)
+	index = numpy.arange(levels ** 3)
+	bgr = numpy.empty((levels ** 3, 1, 3), dtype=numpy.uint8)
+	bgr[:, 0, 0] = centers[index >> (2 * bits)]
+	bgr[:, 0, 1] = centers[(index >> bits) & (levels - 1)]
+	bgr[:, 0, 2] = centers[index & (levels - 1)]
+	hsv = cv.CreateMat(levels ** 3, 1, cv.CV_8UC3)
+	cv.CvtColor(cv.fromarray(bgr), hsv, cv.CV_BGR2HSV)
+	hsv = numpy.asarray(hsv).reshape(-1, 3)
+	h = hsv[:, 0]
+	sat = hsv[:, 1]
+	val = hsv[:, 2]
+	table = numpy.zeros(levels ** 3, dtype=numpy.uint8)
+	for label, (low_color, high_color, min_sv, max_sv) in self.ranges.items():
+	    inside = (h >= low_color) & (h < high_color)
+	    inside &= (sat >= min_sv) & (sat < max_sv) & (val >= min_sv) & (val < max_sv)
+	    table[inside] |= 1 << label
+	self.table = table
+
+    # table entry (label bits) for every pixel of frame (or of its ROI)
+    # written into out if given
+    def labels(self, frame, out = None):
+	if self.table is None:
+	    self.build()
+	pixels = numpy.asarray(cv.GetMat(frame))
+	shape = pixels.shape[:2]
+	count = shape[0] * shape[1]
+	if self.indices is None or len(self.indices) < count:
+	    self.indices = numpy.empty(count, dtype=numpy.intp)
+	indices = self.indices[:count].reshape(shape)
+	bits = self.bits
+	shift = 8 - bits
+	indices[...] = pixels[:, :, 0] >> shift
+	indices <<= bits
+	indices |= pixels[:, :, 1] >> shift
+	indices <<= bits
+	indices |= pixels[:, :, 2] >> shift
+	return self.table.take(indices, out=out)
+
+    # 0/255 mask of the pixels in a label's range, written into the 8-bit image thresh
+    def mask(self, frame, thresh, label = 0):
+	found = numpy.asarray(cv.GetMat(thresh))
+	self.labels(frame, found)
+	mask_from_labels(found, found, label)
+
+# 0/255 mask for one label of a labels() result, written into out
+def mask_from_labels(labels, out, label):
+    numpy.bitwise_and(labels, 1 << label, out)
+    numpy.not_equal(out, 0, out)
+    numpy.multiply(out, 255, out)
+
+# object position from the moments of a binary image, as (x, y, area)
+# (position is (0, 0) when nothing was found, offset by (dx, dy) otherwise)
+def centroid(thresh, dx = 0, dy = 0, timer = NO_TIMER):
+    started = timer.start()
+    moments = cv.Moments(cv.GetMat(thresh))
+    timer.stop("Moments", started)
+    area = cv.GetCentralMoment(moments, 0, 0)
+    if area > 0:
+	x = cv.GetSpatialMoment(moments, 1, 0) / area + dx
+	y = cv.GetSpatialMoment(moments, 0, 1) / area + dy
+	return x, y, area
+    return 0, 0, area
+
+# connected components of a 0/255 mask, largest first, as a list of (x, y, area)
+# with area in pixels (not weighted by 255 as centroid's is); components smaller
+# than min_area pixels are left out
+# scratch is an image like thresh, since FindContours draws over its input
+def find_blobs(thresh, scratch, min_area = 16):
+    cv.Copy(thresh, scratch)
+    storage = cv.CreateMemStorage()
+    contour = cv.FindContours(scratch, storage, cv.CV_RETR_EXTERNAL, cv.CV_CHAIN_APPROX_SIMPLE)
+    blobs = []
+    while contour:
+	moments = cv.Moments(contour)
+	# the area of a contour is signed by its direction
+	area = cv.GetSpatialMoment(moments, 0, 0)
+	if abs(area) >= min_area:
+	    x = cv.GetSpatialMoment(moments, 1, 0) / area
+	    y = cv.GetSpatialMoment(moments, 0, 1) / area
+	    blobs.append((x, y, abs(area)))
+	contour = contour.h_next()
+    blobs.sort(key=lambda blob: -blob[2])
+    return blobs
+
+# bounding box (x, y, width, height) of the largest connected component of a
+# 0/255 mask, or None if the mask is empty
+# scratch is an image like thresh, since FindContours draws over its input
+def largest_blob_box(thresh, scratch):
+    cv.Copy(thresh, scratch)
+    storage = cv.CreateMemStorage()
+    contour = cv.FindContours(scratch, storage, cv.CV_RETR_EXTERNAL, cv.CV_CHAIN_APPROX_SIMPLE)
+    best = None
+    best_size = None
+    while contour:
+	box = cv.BoundingRect(contour)
+	# contours one pixel wide enclose no area, so their boxes break ties
+	size = (abs(cv.ContourArea(contour)), box[2] * box[3])
+	if best is None or size > best_size:
+	    best = box
+	    best_size = size
+	contour = contour.h_next()
+    return best
+
+# bounding box (x, y, width, height) of the set pixels of a 0/255 mask, grown
+# by margin pixels on each side (within the mask), or None if none are set
+# window, an (x, y, width, height), limits the pixels looked at
+def mask_box(thresh, margin = 0, window = None):
+    found = numpy.asarray(cv.GetMat(thresh))
+    height, width = found.shape[:2]
+    left = top = 0
+    if window is not None:
+	left = max(0, window[0])
+	top = max(0, window[1])
+	found = found[top:window[1] + window[3], left:window[0] + window[2]]
+    rows = numpy.flatnonzero(found.any(axis=1))
+    if not len(rows):
+	return None
+    cols = numpy.flatnonzero(found.any(axis=0))
+    right = min(width, left + cols[-1] + 1 + margin)
+    bottom = min(height, top + rows[-1] + 1 + margin)
+    left = max(0, left + cols[0] - margin)
+    top = max(0, top + rows[0] - margin)
+    return (int(left), int(top), int(right - left), int(bottom - top))
+
+# the detection track() has always done: threshold and take moments over the whole frame
+# (lookup optionally supplies a ColorLookup to threshold with, and timer a
+# timing.StageTimer to time each step with)
+def detect_full(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, lookup = None, timer = NO_TIMER):
+    threshold(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, lookup, timer)
+    return centroid(thresh, timer = timer)
+
+# coarse-to-fine search for high-resolution cameras
+# the frame is shrunk by 2 ** levels and thresholded whole at that size to find
+# the blob; the centroid is then taken at full resolution, but only inside the
+# bounding box of the largest coarse blob (grown by one coarse pixel and margin
+# full pixels on each side), with the rest of thresh left black, so specks of
+# noise elsewhere in the frame do not stretch the window
+# the whole frame is searched when nothing shows up at the coarse level, since
+# an object smaller than a coarse pixel can vanish there
+class PyramidSearch(object):
+
+    def __init__(self, levels = 2, margin = 4):
+	self.levels = levels
+	self.margin = margin
+	# coarse level scratch images, for the last frame size seen
+	self.size = None
+	self.small = None
+	self.small_hsv = None
+	self.small_thresh = None
+	self.small_scratch = None
+	self.window = None
+	self.full_searches = 0
+	self.window_searches = 0
+
+    def allocate(self, size):
+	if size == self.size:
+	    return
+	scale = 1 << self.levels
+	small_size = (max(1, size[0] / scale), max(1, size[1] / scale))
+	self.size = size
+	self.small = cv.CreateImage(small_size, 8, 3)
+	self.small_hsv = cv.CreateImage(small_size, 8, 3)
+	self.small_thresh = cv.CreateImage(small_size, 8, 1)
+	self.small_scratch = cv.CreateImage(small_size, 8, 1)
+
+    # (x, y, width, height) at full resolution around the largest blob found at
+    # the coarse level, or None if nothing was found
+    def locate(self, frame, low_color, high_color, min_sv, max_sv, lookup = None, timer = NO_TIMER):
+	size = cv.GetSize(frame)
+	self.allocate(size)
+	started = timer.start()
+	# area averaging keeps small objects from being skipped over
+	cv.Resize(frame, self.small, cv.CV_INTER_AREA)
+	# apart from the display loop's own "Resize"
+	timer.stop("pyramid Resize", started)
+	threshold(self.small, self.small_hsv, self.small_thresh, low_color, high_color, min_sv, max_sv, lookup, timer)
+	box = largest_blob_box(self.small_thresh, self.small_scratch)
+	if box is None:
+	    return None
+	small_size = cv.GetSize(self.small)
+	scale_x = float(size[0]) / small_size[0]
+	scale_y = float(size[1]) / small_size[1]
+	left = max(0, int((box[0] - 1) * scale_x) - self.margin)
+	top = max(0, int((box[1] - 1) * scale_y) - self.margin)
+	right = min(size[0], int((box[0] + box[2] + 1) * scale_x) + self.margin)
+	bottom = min(size[1], int((box[1] + box[3] + 1) * scale_y) + self.margin)
+	return (left, top, right - left, bottom - top)
+
+    # find the object, refining inside the coarse bounding box
+    # returns (x, y, area) like detect_full
+    def detect(self, frame, hsv, thresh, low_color, high_color, min_sv, max_sv, lookup = None, timer = NO_TIMER):
+	window = self.locate(frame, low_color, high_color, min_sv, max_sv, lookup, timer)
+	self.window = window
+	if window is None:
+	    self.full_searches += 1
+	    return detect_full(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, lookup, timer)
+	self.window_searches += 1
+	cv.SetZero(thresh)
+	for img in [frame, hsv, thresh]:
+	    cv.SetImageROI(img, window)
+	try:
+	    threshold(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, lookup, timer)
+	    return centroid(thresh, window[0], window[1], timer)
+	finally:
+	    for img in [frame, hsv, thresh]:
+		cv.ResetImageROI(img)
+
+# predictive region-of-interest search
+# the object is looked for in a window around where it should be now, going by its
+# last position and velocity; only that window is converted and thresholded (the
+# rest of thresh is left black), and the whole frame is searched whenever the
+# object was not found last time, is not found in the window, or looks cut off by it
+class RegionSearch(object):
+
+    def __init__(self, min_half_size = 24, size_factor = 3.0, speed_margin = 1.5, min_area_ratio = 0.5):
+	# smallest half-width of the window, in pixels
+	self.min_half_size = min_half_size
+	# half-width of the window in multiples of the object's radius
+	self.size_factor = size_factor
+	# extra room for the distance moved per frame, which is only an estimate
+	self.speed_margin = speed_margin
+	# fall back when less than this fraction of last frame's area is found
+	self.min_area_ratio = min_area_ratio
+	self.reset()
+
+    # forget the object, so the next search covers the whole frame
+    def reset(self):
+	self.last = None
+	self.last_area = 0
+	self.step = (0.0, 0.0)
+	self.window = None
+	self.full_searches = 0
+	self.window_searches = 0
+
+    # (x, y, width, height) to search in a frame of the given size, or None for all of it
+    # displacement is the expected movement since the last frame, in pixels
+    # (velocity * timestep from Speed); without it the last observed step is used
+    def predict(self, size, displacement = None):
+	if self.last is None:
+	    return None
+	if displacement is None:
+	    displacement = self.step
+	dx, dy = displacement
+	# moments of a 0/255 mask weigh every pixel 255
+	radius = math.sqrt(self.last_area / 255.0 / math.pi)
+	center_x = self.last[0] + dx
+	center_y = self.last[1] + dy
+	half_w = max(self.min_half_size, self.size_factor * radius + self.speed_margin * abs(dx))
+	half_h = max(self.min_half_size, self.size_factor * radius + self.speed_margin * abs(dy))
+	left = max(0, int(center_x - half_w))
+	top = max(0, int(center_y - half_h))
+	right = min(size[0], int(center_x + half_w) + 1)
+	bottom = min(size[1], int(center_y + half_h) + 1)
+	if right - left < 2 or bottom - top < 2:
+	    return None
+	return (left, top, right - left, bottom - top)
+
+    # find the object, searching the predicted window first
+    # returns (x, y, area) like detect_full
+    def detect(self, frame, hsv, thresh, low_color, high_color, min_sv, max_sv, displacement = None, lookup = None, timer = NO_TIMER):
+	window = self.predict(cv.GetSize(frame), displacement)
+	self.window = window
+	result = None
+	if window:
+	    cv.SetZero(thresh)
+	    for img in [frame, hsv, thresh]:
+		cv.SetImageROI(img, window)
+	    try:
+		threshold(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, lookup, timer)
+		result = centroid(thresh, window[0], window[1], timer)
+	    finally:
+		for img in [frame, hsv, thresh]:
+		    cv.ResetImageROI(img)
+	    self.window_searches += 1
+	    if result[2] <= 0 or result[2] < self.min_area_ratio * self.last_area:
+		result = None
+	if result is None:
+	    self.window = None
+	    self.full_searches += 1
+	    result = detect_full(frame, hsv, thresh, low_color, high_color, min_sv, max_sv, lookup, timer)
+	self.observe(result)
+	return result
+
+    # remember where the object was found
+    def observe(self, result):
+	x, y, area = result
+	if area <= 0:
+	    self.last = None
+	    self.last_area = 0
+	    self.step = (0.0, 0.0)
+	    return
+	if self.last is not None:
+	    self.step = (x - self.last[0], y - self.last[1])
+	self.last = (x, y)
+	self.last_area = area
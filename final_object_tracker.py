@@ -4,10 +4,23 @@
 import cv
 import math
 import os
-import pickle
 import sys
 import time
 import csv
+import numpy
+from kinematics import Speed
+import bufferpool
+import detection
+import framewriter
+import frameloader
+import multitrack
+import pipeline
+import replay
+import replayview
+import spritestore
+import timing
+import trialdata
+import videostore
 # interface libraries
 from PySide.QtCore import *
 from PySide.QtGui import *
@@ -15,125 +28,18 @@ from PySide.QtGui import *
 ###########################
 #     MOTION TRACKING     #
 ###########################
-# data structure to store velocity, acceleration, distance traveled, and any other computer parameters 
-class Speed():
-    # minimum requirements to keep the speed object lightweight for the recording phase
-    def __init__(self):
-	self.start_time = 0.0
-	self.stop_time = 0.0
-        # folder in which we will save this object
-	self.out_folder = ""
-	# object's x-coordinate and y-coordinate, and time, respectively 
-	self.x = [0.0]
-	self.y = [0.0]
-	self.t = []
-
-    # append values to the appropriate lists
-    def add_pos(self, x_val, y_val, timestep):
-	self.x.append(float(x_val))
-	self.y.append(float(y_val))
-	self.t.append(float(timestep))
-
-    # based on the amount of time that has passed, update all fields
-    # timestep is a decimal amount of time in seconds	
-    def update(self):
-	self.metrics = {}
-	parameters_to_track = ["x_pos", "y_pos", "v_x", "v_y", "a_x", "a_y", "distance", "time", "v_net", "a_net"]
-	# in first time step, everything is set to 0
-	for p in parameters_to_track:
-	    self.metrics[p] = [0.0] 
-	# pair up coordinates so we have initial and final position for each timestep
-	x_s = zip(self.x, self.x[1:])
-	y_s = zip(self.y, self.y[1:])
-	# object starts still, so initial velocity is zero	
-	#self.metrics["v_x"] = [0.0]
-	#self.metrics["v_y"] = [0.0]
-	#self.metrics["v_net"] =[0.0]
-	# initialize a list for everything else
-#	for p in ["x_pos", "y_pos", "a_x", "a_y", "distance", "time", "a_net"]:
-#	    self.metrics[p] = []
-	for n, timestep in enumerate(self.t):
-	    # store current (x, y) position 
-	    self.metrics["x_pos"].append(x_s[n][0])
- 	    self.metrics["y_pos"].append(y_s[n][0])	
-	    # x and y velocity is the difference in position divided by the amount of time
-	    curr_vx = float(x_s[n][1] - x_s[n][0]) / float(timestep)
-	    curr_vy = float(y_s[n][1] - y_s[n][0]) / float(timestep)
-	    self.metrics["v_x"].append(curr_vx)
-	    self.metrics["v_y"].append(curr_vy)
-	    v_net = resultant(curr_vx, curr_vy)
-	    self.metrics["v_net"].append(v_net)
-	    # x and y acceleration is the difference in velocity divided by the amount of time
-	    curr_ax = (curr_vx - self.metrics["v_x"][-2])/timestep
-	    curr_ay = (curr_vy - self.metrics["v_y"][-2])/timestep
-	    self.metrics["a_x"].append(curr_ax)
-	    self.metrics["a_y"].append(curr_ay)
-	    a_net = resultant(curr_vx, curr_vy)
-	    self.metrics["a_net"].append(a_net)
-	    # approximate distance traveled in that timestep
-	    # based on average of initial and final velocity in timestep 
-	    avg_v = (v_net + self.metrics["v_net"][-2])/2.0
-	    self.metrics["distance"].append(avg_v * timestep) 	
-	    # amount of time that has passed since last recorded position
-	    self.metrics["time"].append(timestep)
-	 
-    # helper methods for retrieving velocity/acceleration
-    # at a given time
-    def current_vx(self):
-	return self.metrics["v_x"][-1]
-
-    def current_vy(self):
-	return self.metrics["v_y"][-1]
-
-    # technically this is speed (always positive)
-    def current_v(self):
-	return math.sqrt(math.pow(self.current_vx(), 2) + math.pow(self.current_vy(), 2))
- 
-    def current_ax(self):
-	return self.metrics["a_x"][-1]
+# Speed (the data structure storing velocity, acceleration, distance traveled,
+# and any other computed parameters) lives in kinematics.py
 
-    def current_ay(self):
-	return self.metrics["a_y"][-1]
-
-    def current_a(self):
-	return math.sqrt(math.pow(self.current_ax(), 2) + math.pow(self.current_ay(), 2))
-    
-    # return number of frames
-    def num_frames(self):
-	return len(self.metrics["time"])
+# ways of finding the object, in the order of the detection options: the whole
+# frame, near its last position, coarse-to-fine, or every blob of its color
+# (the first three are batchtrack.py's --mode choices)
+DETECTION_MODES = ["full", "roi", "pyramid", "multi"]
 
 ##################################
 #     GENERAL HELPER METHODS     #
 ##################################
 
-# returns (min, max)  of chosen sign (pos, neg, or all by default) values
-# for a given field (v_x, x_pos, etc.)
-def min_max(vals, which_field, which_vals = "all"):
-	# accounts for the initial zero in the vector: position isn't
-	# accurate until the first value, velocity until it compares two accurate positions
-	# (hence in the second value), and acceleration needs to accurate velocities
-	# (hence in the third value)
-	offset = 1
-	if which_field == "v_x" or which_field == "v_y" or which_field == "v_net":
-	    offset = 2
-	if which_field == "a_x" or which_field == "a_y" or which_field == "a_net":
-	    offset = 3
-	candidate_values = vals[offset:]
-	max_v = min_v = 0
-	if which_vals == "all":
-	    max_v = max(candidate_values)
-	    min_v = min(candidate_values)
-	# treating these as absolute values
-	elif which_vals == "neg":
-	    neg_vals = filter(lambda x: x <= 0, candidate_values)
-	    max_v = min(neg_vals)
-	    min_v = max(neg_vals)
-	else:
-	    pos_vals = filter(lambda x: x > 0, candidate_values)
-	    max_v = max(pos_vals)
-	    min_v = min(pos_vals)
-	return [min_v, max_v]
-		
 # helper method to find the norm of two vector components
 def resultant(x, y):
      return math.sqrt(float(math.pow(x, 2)) + float(math.pow(y, 2)))
@@ -178,9 +84,17 @@ class ObjectTracker(QMainWindow):
 	# which camera is active
 	# (0 is built in, 1 is external USB camera)
 	self.camera_index = 0
+	# how each camera finds the object, one of DETECTION_MODES: in the whole
+	# frame, near its last position, at a shrunken size first and refined at
+	# full size (worthwhile for the high-resolution external camera), or as
+	# every blob of its color (see multitrack.py)
+	# chosen when tracking starts, not while it runs
+	self.detection_mode = {0: "full", 1: "full"}
 	# video display size #
 	self.fit_camera_width = 480
 	self.fit_camera_height = 360
+	# scratch images reused from frame to frame by every capture loop
+	self.buffers = bufferpool.BufferPool()
 	# initial tracking range (optimized for orange ping-pong ball)
 	self.low_color = 2
 	self.high_color = 6
@@ -194,18 +108,33 @@ class ObjectTracker(QMainWindow):
 	self.end_record = False
 	# enables UI to run in parallel with video #
 	self.busy_updating = False
-	self.show_video = False 
-	self.video_active = True
+	# the open replay (see replayview.py), if any
+	self.player = None
 	# by default, store all frames
 	# change to False to only track position #
+	# (this, video_format and sprites_only are set together by the
+	# save options, see set_save_options)
 	self.full_video_mode = True
+	# "png" saves one image per frame, "mjpeg" a single indexed video file
+	self.video_format = "png"
+	# save only the box around the object in each frame (composited back
+	# over the background on replay) instead of whole frames
+	self.sprites_only = False
+	# threshold through a precomputed color lookup table instead of converting to HSV
+	self.use_color_lookup = False
+	self.color_lookup = detection.ColorLookup()
+	# time each stage of the capture loops (saved with every trial as Timing.json)
+	self.time_stages = True
+	# show the frame rate and stage timings on the video
+	self.timing_overlay = False
 	# folder for selecting saved video 
 	self.video_folder = ""
         # default folder to store saved video 
 	self.output_folder = "Videos"
 	
 	# INITIAL PLAYBACK SETTINGS #	
-	self.playback_speed = 1000
+	# replays play at this multiple of the recorded speed
+	self.playback_speed = 1.0
 	self.object_color = cv.CV_RGB(0, 255, 0)	
 	self.marker_rad = 4
   	self.draw_mode = "circle"
@@ -287,9 +216,60 @@ class ObjectTracker(QMainWindow):
 	horiz_rec_buttons.addWidget(save_as)
 	start_layout.addLayout(horiz_rec_buttons)
 
-	full_color_vid = QCheckBox("Save movement only (not full video)")
-        full_color_vid.stateChanged.connect(self.recording_settings)
-        start_layout.addWidget(full_color_vid)
+	# how frames are saved (one choice, see set_save_options) #
+	save_label = QLabel("Save each trial as:")
+	start_layout.addWidget(save_label)
+	self.save_options = QButtonGroup()
+	png_vid = QRadioButton("Every frame as an image (PNG)", self)
+	single_file_vid = QRadioButton("Frames as one video file (MJPEG)", self)
+	sprites_vid = QRadioButton("Only the object in each frame (not the background)", self)
+	full_color_vid = QRadioButton("Movement only (not full video)", self)
+	self.save_options.addButton(png_vid, 1)
+	self.save_options.addButton(single_file_vid, 2)
+	self.save_options.addButton(sprites_vid, 3)
+	self.save_options.addButton(full_color_vid, 4)
+	png_vid.clicked.connect(self.set_save_options)
+	single_file_vid.clicked.connect(self.set_save_options)
+	sprites_vid.clicked.connect(self.set_save_options)
+	full_color_vid.clicked.connect(self.set_save_options)
+	# whole frames as images by default #
+	png_vid.setChecked(True)
+	start_layout.addWidget(png_vid)
+	start_layout.addWidget(single_file_vid)
+	start_layout.addWidget(sprites_vid)
+	start_layout.addWidget(full_color_vid)
+	fast_threshold = QCheckBox("Fast color thresholding (lookup table)")
+	fast_threshold.stateChanged.connect(self.color_lookup_settings)
+	start_layout.addWidget(fast_threshold)
+	# how the object is found (one choice, see set_detection_options) #
+	detection_label = QLabel("Find the object (for this camera):")
+	start_layout.addWidget(detection_label)
+	self.detection_options = QButtonGroup()
+	full_search = QRadioButton("In the whole frame", self)
+	fast_tracking = QRadioButton("Near its last position (fast tracking)", self)
+	coarse_search = QRadioButton("Coarse-to-fine (for high-resolution cameras)", self)
+	multi_object = QRadioButton("Every object of this color", self)
+	self.detection_options.addButton(full_search, 1)
+	self.detection_options.addButton(fast_tracking, 2)
+	self.detection_options.addButton(coarse_search, 3)
+	self.detection_options.addButton(multi_object, 4)
+	full_search.clicked.connect(self.set_detection_options)
+	fast_tracking.clicked.connect(self.set_detection_options)
+	coarse_search.clicked.connect(self.set_detection_options)
+	multi_object.clicked.connect(self.set_detection_options)
+	# whole frame by default #
+	full_search.setChecked(True)
+	start_layout.addWidget(full_search)
+	start_layout.addWidget(fast_tracking)
+	start_layout.addWidget(coarse_search)
+	start_layout.addWidget(multi_object)
+	time_stages = QCheckBox("Time each stage (report saved with the trial)")
+	time_stages.setChecked(self.time_stages)
+	time_stages.stateChanged.connect(self.timing_settings)
+	start_layout.addWidget(time_stages)
+	timing_overlay = QCheckBox("Show frame rate and stage timings on the video")
+	timing_overlay.stateChanged.connect(self.overlay_settings)
+	start_layout.addWidget(timing_overlay)
 
 	# a note on units #
 	unit_instruct = QVBoxLayout()
@@ -305,13 +285,24 @@ class ObjectTracker(QMainWindow):
 	self.vid_layout.addWidget(load_vid)
 	
 	quick_buttons = QHBoxLayout()         
+	step_back = QPushButton("<")
+	step_back.clicked.connect(self.step_back_video)
+	quick_buttons.addWidget(step_back)
 	play = QPushButton("Play")
 	play.clicked.connect(self.play_video)
 	quick_buttons.addWidget(play)	
 	pause = QPushButton("Pause")
 	pause.clicked.connect(self.pause_video)
 	quick_buttons.addWidget(pause)	
+	step_forward = QPushButton(">")
+	step_forward.clicked.connect(self.step_forward_video)
+	quick_buttons.addWidget(step_forward)
 	self.vid_layout.addLayout(quick_buttons)
+	# seek bar, set to the length of the video when it opens #
+	self.seek_slider = QSlider(Qt.Horizontal)
+	self.seek_slider.setRange(1, 1)
+	self.seek_slider.valueChanged.connect(self.seek_video)
+	self.vid_layout.addWidget(self.seek_slider)
 	stop_vid = QPushButton("Done")
 	stop_vid.clicked.connect(self.quit_video)
 	self.vid_layout.addWidget(stop_vid)
@@ -324,6 +315,9 @@ class ObjectTracker(QMainWindow):
         playback_slider.setSliderPosition(1000)
         playback_slider.valueChanged.connect(self.set_playback_speed) 
  	self.vid_layout.addWidget(playback_slider)
+	# achieved against target frame rate of the playing replay
+	self.playback_rate = QLabel("")
+	self.vid_layout.addWidget(self.playback_rate)
 
 	# display options #
 	display_options_label = QLabel("Tracking display options:")
@@ -443,13 +437,26 @@ class ObjectTracker(QMainWindow):
 	self.busy_updating = False
     
     # implement law of cosines to find angle
-    def angle(self, img):
+    # timer (a timing.StageTimer) times the color conversion, thresholding and moments
+    def angle(self, img, timer = timing.NO_TIMER):
 	# extract position of red blue yellow markers
 	# find distance between pairs
 	# return angle from inverse cosine
 	
-	imgHSV = cv.CreateImage(cv.GetSize(img), 8, 3)
-	cv.CvtColor(img, imgHSV, cv.CV_BGR2HSV)
+	markers = [self.red_hues, self.yellow_hues, self.blue_hues]
+	# the lookup table finds all three markers in one pass
+	# (labels 1 to 3, label 0 being the tracked object)
+	labels = None
+	started = timer.start()
+	if self.use_color_lookup:
+	    for label, (h_low, h_high, col) in enumerate(markers):
+		self.color_lookup.set_range(label + 1, h_low, h_high, 70, 255)
+	    labels = self.color_lookup.labels(img)
+	    timer.stop("lookup", started)
+	else:
+	    imgHSV = self.buffers.frame_sized("hsv", 3)
+	    cv.CvtColor(img, imgHSV, cv.CV_BGR2HSV)
+	    timer.stop("CvtColor", started)
 	cv.NamedWindow("red", cv.CV_WINDOW_AUTOSIZE)
 	cv.MoveWindow("red", 800, 0)
 	cv.NamedWindow("blue", cv.CV_WINDOW_AUTOSIZE)
@@ -458,15 +465,23 @@ class ObjectTracker(QMainWindow):
 	cv.MoveWindow("yellow", 800, 200)
 	
 	dot_coords = []
+	# the markers take turns with one threshold image (each is shown before the next is made)
+	imgThresh = self.buffers.frame_sized("thresh", 1)
+	small_thresh = self.buffers.get("small_thresh", (self.fit_camera_width, self.fit_camera_height), 1)
 	# use the corresponding thresholds for each color of marker #
-	for h_low, h_high, col in [self.red_hues, self.yellow_hues, self.blue_hues]:
-	    imgThresh = cv.CreateImage(cv.GetSize(img), 8, 1)
-	    cv.InRangeS(imgHSV, cv.Scalar(h_low, 70, 70), cv.Scalar(h_high, 255, 255), imgThresh)
+	for label, (h_low, h_high, col) in enumerate(markers):
+	    started = timer.start()
+	    if labels is not None:
+		detection.mask_from_labels(labels, numpy.asarray(cv.GetMat(imgThresh)), label + 1)
+		started = timer.lap("mask", started)
+	    else:
+		cv.InRangeS(imgHSV, cv.Scalar(h_low, 70, 70), cv.Scalar(h_high, 255, 255), imgThresh)
+		started = timer.lap("InRangeS", started)
  	    moments = cv.Moments(cv.GetMat(imgThresh))
+	    timer.stop("Moments", started)
 	    x_mov = cv.GetSpatialMoment(moments, 1, 0)
 	    y_mov = cv.GetSpatialMoment(moments, 0, 1)
 	    area = cv.GetCentralMoment(moments, 0, 0)
-            small_thresh = cv.CreateImage((self.fit_camera_width, self.fit_camera_height), 8, 1)
 	    cv.Resize(imgThresh, small_thresh)
 
 	    if col == "r":
@@ -519,12 +534,18 @@ class ObjectTracker(QMainWindow):
     	# keep a running average for 100 reads
 	total = 0
 	num_reads = 0
+	timer = self.stage_timer()
+	overlay_font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 0.4, 0.4, 0, 1, cv.CV_AA)
 	while camera_on:
 	    if (not self.busy_updating):
+		timer.enabled = self.time_stages or self.timing_overlay
+		started = timer.start()
 		frame = cv.QueryFrame(capture)
 		if not frame:
 	   	    break	
-		deg_found = self.angle(frame)	
+		timer.stop("QueryFrame", started)
+		self.buffers.fit(frame)
+		deg_found = self.angle(frame, timer)	
 		# if an angle is detected, update the running average
 		if deg_found != 0:
 		    total += deg_found
@@ -538,10 +559,18 @@ class ObjectTracker(QMainWindow):
 		    to_text = str(degrees_shown) + " degrees"
 		    self.act_angle.setText(to_text)
 		
-		small_frame = cv.CreateImage((self.fit_camera_width, self.fit_camera_height), 8, 3)
+		started = timer.start()
+		small_frame = self.buffers.get("small_frame", (self.fit_camera_width, self.fit_camera_height), 3)
 		cv.Resize(frame, small_frame)
+		started = timer.lap("Resize", started)
+		if self.timing_overlay:
+		    timing.draw_overlay(small_frame, timer, overlay_font)
+		    started = timer.lap("draw", started)
 		cv.ShowImage("Video", small_frame)	
+		started = timer.lap("ShowImage", started)
 		k = cv.WaitKey(1)
+		timer.stop("WaitKey", started)
+		timer.tick()
 		
 		# press q or escape to quit camera view
 		if k == 27 or k == 113 or self.end_record:
@@ -562,6 +591,8 @@ class ObjectTracker(QMainWindow):
 	    self.camera_index = 0
 	else:
 	    self.camera_index = 1
+	mode = self.detection_mode[self.camera_index]
+	self.detection_options.button(DETECTION_MODES.index(mode) + 1).setChecked(True)
 
     # convert pixels/second to user's choice of units/second
     # (meters recommended)
@@ -571,11 +602,11 @@ class ObjectTracker(QMainWindow):
     # find dominant hue of selected image
     def histogram(self, src):
 	# Convert to HSV
-    	hsv = cv.CreateImage(cv.GetSize(src), 8, 3)
+	hsv = self.buffers.get("hsv", cv.GetSize(src), 3)
     	cv.CvtColor(src, hsv, cv.CV_BGR2HSV)
-	h_plane = cv.CreateMat(cv.GetSize(src)[1], cv.GetSize(src)[0], cv.CV_8UC1)
-	s_plane = cv.CreateMat(cv.GetSize(src)[1], cv.GetSize(src)[0], cv.CV_8UC1)
-	v_plane = cv.CreateMat(cv.GetSize(src)[1], cv.GetSize(src)[0], cv.CV_8UC1)
+	h_plane = self.buffers.get("h_plane", cv.GetSize(src), 1)
+	s_plane = self.buffers.get("s_plane", cv.GetSize(src), 1)
+	v_plane = self.buffers.get("v_plane", cv.GetSize(src), 1)
 	cv.Split(hsv, h_plane, s_plane, v_plane, None)
         planes = [h_plane, s_plane]
         h_bins = 30
@@ -589,7 +620,7 @@ class ObjectTracker(QMainWindow):
         ranges = [h_ranges, s_ranges]
         scale = 10
         hist = cv.CreateHist([h_bins, s_bins], cv.CV_HIST_ARRAY, ranges, 1)
-        cv.CalcHist([cv.GetImage(i) for i in planes], hist)
+	cv.CalcHist(planes, hist)
 	max_val = cv.GetMinMaxHistValue(hist)[3]
 	max_hue_bin = max_val[0]
 	max_sat_bin = max_val[1]
@@ -601,7 +632,7 @@ class ObjectTracker(QMainWindow):
 	BGR_color = HSV_to_RGB(hue)
 	cv.NamedWindow("About this color?", cv.CV_WINDOW_AUTOSIZE)
         cv.MoveWindow("About this color?", 620, 530)
-        color_swatch = cv.CreateImage((200, 140), 8, 3)
+	color_swatch = self.buffers.get("swatch", (200, 140), 3)
         cv.Set(color_swatch, BGR_color)
         cv.ShowImage("About this color?", color_swatch)
 	return BGR_color, hue
@@ -643,31 +674,61 @@ class ObjectTracker(QMainWindow):
 	self.busy_updating = False	
 
     # sets playback speed
-    # subtracting from 2100 to make higher slider values
-    # correspond intuitively to faster speeds
+    # from a tenth of the recorded speed (slider at 100) to twice it (at 2000)
     def set_playback_speed(self, pos):
-        self.playback_speed = 2100 - pos
+	self.playback_speed = pos / 1000.0
+	if self.player:
+	    self.player.set_speed(self.playback_speed)
+
+    # frames the replay shows per second against what the recording calls for
+    def show_playback_rates(self, achieved, target, skipped):
+	self.playback_rate.setText("Showing %.1f of %.1f frames per second (%d skipped)" % (achieved, target, skipped))
 
     # play button
     def play_video(self):
-	self.busy_updating = True
-	self.show_video = True
-	self.busy_updating = False 
+	if self.player:
+	    self.player.play()
 
     # pause button
     def pause_video(self):
-	self.busy_updating = True
-	self.show_video = False
-	self.busy_updating = False
+	if self.player:
+	    self.player.pause()
+
+    # step buttons: pause and move one frame back or forward
+    def step_back_video(self):
+	if self.player:
+	    self.player.step(-1)
+
+    def step_forward_video(self):
+	if self.player:
+	    self.player.step(1)
+
+    # seek bar: jump to a frame (playing on from there if playing)
+    def seek_video(self, pos):
+	if self.player:
+	    self.player.seek(pos)
+
+    # move the seek bar to img_index without it asking for a jump
+    def show_seek_position(self, img_index):
+	self.seek_slider.blockSignals(True)
+	self.seek_slider.setValue(img_index)
+	self.seek_slider.blockSignals(False)
 
     # quit button
     def quit_video(self):
-        self.busy_updating = True
-        self.video_active = False
-        self.show_video = False
-        self.busy_updating = False
+	if self.player:
+	    self.player.close()
         cv.DestroyAllWindows()
 
+    # the replay windows were closed (with q or escape, or the quit button)
+    def replay_closed(self):
+	self.player = None
+	self.playback_rate.setText("")
+
+    # how replays draw each step: (draw mode, marker radius, object color)
+    def replay_style(self):
+	return self.draw_mode, self.marker_rad, self.object_color
+
     # start recording button
     def record_video(self):
         self.busy_updating = True
@@ -680,12 +741,53 @@ class ObjectTracker(QMainWindow):
         self.end_record = True
         self.busy_updating = False
 
-    # determines if we're recording every frame, or first frame + subsequent position
-    def recording_settings(self):
-        if self.full_video_mode:
-	    self.full_video_mode = False 
-        else:
-	    self.full_video_mode = True 
+    # determines how frames are saved: every frame as an image, one video
+    # file, the object alone (see spritestore.py), or only the first frame
+    # and the positions after it
+    def set_save_options(self):
+	self.busy_updating = True
+	button_id = self.save_options.checkedId()
+	self.full_video_mode = (button_id != 4)
+	self.sprites_only = (button_id == 3)
+	if button_id == 2:
+	    self.video_format = "mjpeg"
+	else:
+	    self.video_format = "png"
+	self.busy_updating = False
+
+    # determines how the current camera finds the object (see DETECTION_MODES)
+    def set_detection_options(self):
+	self.busy_updating = True
+	button_id = self.detection_options.checkedId()
+	self.detection_mode[self.camera_index] = DETECTION_MODES[button_id - 1]
+	self.busy_updating = False
+
+    # let the detection options be changed, or not
+    def set_detection_enabled(self, enabled):
+	for b in self.detection_options.buttons():
+	    b.setEnabled(enabled)
+
+    # determines if thresholding uses the color lookup table
+    def color_lookup_settings(self):
+	self.use_color_lookup = not self.use_color_lookup
+
+    # the lookup table to threshold with, or None to convert to HSV
+    def active_lookup(self):
+	if self.use_color_lookup:
+	    return self.color_lookup
+	return None
+
+    # determines if the capture loops time their stages
+    def timing_settings(self, state):
+	self.time_stages = (state == Qt.Checked)
+
+    # determines if the stage timings are drawn on the video
+    def overlay_settings(self, state):
+	self.timing_overlay = (state == Qt.Checked)
+
+    # timer for one capture loop (the overlay needs timings even when they are not saved)
+    def stage_timer(self):
+	return timing.StageTimer(enabled = self.time_stages or self.timing_overlay)
 
     # "Save as..." (something more memorable) button	
     def save_file(self):
@@ -714,7 +816,7 @@ class ObjectTracker(QMainWindow):
         self.low_color = pos
         cv.NamedWindow("Start at color", cv.CV_WINDOW_AUTOSIZE)
         cv.MoveWindow("Start at color", 520, 0)
-        color_swatch = cv.CreateImage((200, 140), 8, 3)
+	color_swatch = self.buffers.get("swatch", (200, 140), 3)
         cv.Set(color_swatch, HSV_to_RGB(self.low_color))
         cv.ShowImage("Start at color", color_swatch)
 	self.busy_updating = False
@@ -725,7 +827,7 @@ class ObjectTracker(QMainWindow):
         self.high_color = pos
         cv.NamedWindow("End at color", cv.CV_WINDOW_AUTOSIZE)
         cv.MoveWindow("End at color", 750, 0)
-        color_swatch = cv.CreateImage((200, 140), 8, 3)
+	color_swatch = self.buffers.get("swatch", (200, 140), 3)
         cv.Set(color_swatch, HSV_to_RGB(self.high_color))
         cv.ShowImage("End at color", color_swatch)
 	self.busy_updating = False
@@ -736,16 +838,9 @@ class ObjectTracker(QMainWindow):
     def display_video(self):
         if not self.upload_file():
 	    return
-        self.video_active = True
-    	# hand-tuned, apologies
-	cv.NamedWindow("Velocity", cv.CV_WINDOW_AUTOSIZE)
-        cv.MoveWindow("Velocity", 0, 590)   
-        cv.NamedWindow("Acceleration", cv.CV_WINDOW_AUTOSIZE)
-        cv.MoveWindow("Acceleration", 415, 590)
-        cv.NamedWindow("Replay", cv.CV_WINDOW_AUTOSIZE) 
-        cv.MoveWindow("Replay", 610, 20)
-        cv.NamedWindow("Overall", cv.CV_WINDOW_AUTOSIZE)
-        cv.MoveWindow("Overall", 880, 590)
+	# one replay at a time
+	if self.player:
+	    self.player.close()
 
         # load background
         input_background = str(self.video_folder) + "/background.png"
@@ -753,182 +848,44 @@ class ObjectTracker(QMainWindow):
 	if not background: 
 	    QMessageBox.information(self, "Open video", "No such video")  
    	    return	
-        cv.ShowImage("Replay", background)
-   	size = cv.GetSize(background)
-	screen_width = size[0]
-	screen_height = size[1] 
         
 	# load position data
-        input_data = str(self.video_folder) + "/Data"
-        f_in = open(input_data, 'r')
-	data = pickle.load(f_in)
-	f_in.close()
-	if not data:
+	# (memory-mapped Data.bin, or the pickled Data file of older trials)
+	try:
+	    data = trialdata.open_trial(self.video_folder)
+	except (IOError, ValueError):
 	    QMessageBox.information(self, "Loading video", "Unable to load data")
+	    return
         # Data knows it's a Speed object.
 	# this is why Python ROCKS.
-	num_frames = data.num_frames()
+	# draws each step (see replay.py), with every object of trials that
+	# tracked several (see multitrack.py), into images Qt can show as they are
+	tracks = trialdata.load_tracks(self.video_folder)
+	if tracks:
+	    renderer = replay.MultiReplayRenderer(tracks, background, self.conversion_factor, channels = 4,
+						  frame_times = trialdata.frame_times(self.video_folder),
+						  start_time = trialdata.recording_start(self.video_folder))
+	else:
+	    renderer = replay.ReplayRenderer(data, background, self.conversion_factor, channels = 4)
+	num_frames = renderer.num_frames()
  
-	top_speed = 0
-	dist = 0.0
-        # getting images
-	imgArr = []
-        img_name = str(self.video_folder) + "/frame_"
-	
+	# frames are decoded on demand (and read ahead) rather than all up front
+	frames = None
 	# if we saved the full video (as opposed to just the position info)
         if self.full_video_mode:
- 	    for frame in range(1, num_frames):
-		full_img = str(img_name) + str(frame) + ".png"
-		img = cv.LoadImage(full_img)
-		imgArr.append(img)
-        font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 1.0, 1.0, 0, 1, cv.CV_AA)
-	# all parameters we want to track
-        params = ["x_pos", "y_pos", "v_x", "v_y", "a_x", "a_y", "distance", "v_net", "a_net"]
-        # values for which we want to scale display color with relative magnitude
-	fields = ["v_x", "v_y", "a_x", "a_y", "v_net", "a_net"]
-
-        # for velocity and acceleration, there is min max for pos and neg
-        # returns (min, max)
-        neg_outliers = {}
-	pos_outliers = {}
-	pos_color = cv.CV_RGB(0, 255, 0) # green
-        neg_color = cv.CV_RGB(255, 0, 0) # red
-    
-	for f in fields:
-	    if f is not "v_net" and f is not "a_net":
-	    	neg_outliers[f] = min_max(data.metrics[f], f, which_vals = "neg")
-	    pos_outliers[f] = min_max(data.metrics[f], f, which_vals = "pos")
-
-        next_image = cv.CloneImage(background)
-	# ignore the first values for everything
-	# (since velocity/acceleration will not be accurate)
-	img_index = 1
-
-	line_list = []
-	color_list = []
-        while not self.busy_updating and self.video_active:
-	    # enables pause button functionality
-	    if not self.video_active:
-	        break
-	    qr = cv.WaitKey(10)
-  	    # if we're done with the video
-	    if img_index >= num_frames:
-	        break
-	    	    	   
-            if self.show_video:
-	      # loop around when video done
-	      if img_index == num_frames - 1:
-	  	   img_index = 0
-		   dist = 0.0
-		   top_speed = 0.0
-		   line_list = []
-		   color_list = []
-	      if img_index < num_frames -1:
-		# advance to next image
-	        if self.full_video_mode: 
-	            next_image = imgArr[img_index]
-		# values are one ahead of the frames
-	        img_index += 1
-		# make white canvases for writing values
-    	        speed_img = cv.CreateImage((400, 140), 8, 3)
-	        cv.Set(speed_img, cv.CV_RGB(255, 255, 255))
-	        accl_img = cv.CreateImage((450, 140), 8, 3)
-	        cv.Set(accl_img, cv.CV_RGB(255, 255, 255))
-	        overall_img = cv.CreateImage((390, 140), 8, 3)
-	        cv.Set(overall_img, cv.CV_RGB(255, 255, 255))
-
-                x_coord = data.metrics["x_pos"][img_index]
-	        y_coord = data.metrics["y_pos"][img_index]
-	        data_for_step = []
-		# the below will eventually be [v_net, a_net, v_x, v_y, a_x, a_y]
-   	        colors_for_step = []
-	        # convert all data to real units
-	        # and determine red/green display color
-	        for p in params:
-		    raw_pixel_val = data.metrics[p][img_index]
-		    val = self.to_real_units(raw_pixel_val)
-		    if val < 0:
-		        if p == "x_pos" or p == "y_pos" or p == "distance":
-			    colors_for_step.append(neg_color)
-		        else:
-			    colors_for_step.append(scale_color(raw_pixel_val, neg_outliers[p][0], neg_outliers[p][1], "R"))
-		    else:
-		        if p == "x_pos" or p == "y_pos" or p == "distance":
-			    colors_for_step.append(pos_color)
-		        else:	    
-			    colors_for_step.append(scale_color(raw_pixel_val, pos_outliers[p][0], pos_outliers[p][1], "G"))
-		    data_for_step.append(val)		
-	   
-	       # track top speed after first three steps (since these are less precise)
-		v_net = data_for_step[7]
-	        if abs(v_net) > abs(top_speed) and img_index > 3:
-	 	    top_speed = v_net
-	
-	        # display all velocities/accelerations
-	        x_speed = "Horizontal: " +  str(round(data_for_step[2], 1))
-	        y_speed = "Vertical: " + str(round(data_for_step[3], 1))
-	        total_speed = "Net: " + str(round(data_for_step[7], 1))
-	        x_accl = "Horizontal: " +  str(round(data_for_step[4], 1))
-	        y_accl = "Vertical: " + str(round(data_for_step[5], 1))
-	        total_accl = "Net: " + str(round(data_for_step[8], 1))  
-	        if img_index > 1:
-	    	    dist += data_for_step[6]
-	        dist_traveled = "Distance: " + str(round(dist, 1))
-	        top_speed_so_far = "Top speed: " + str(round(top_speed, 1))   
-
-	        # add to speed window
-	        cv.PutText(speed_img, x_speed, (10, 40), font, colors_for_step[2]) 
-	        cv.PutText(speed_img, y_speed, (10, 80), font, colors_for_step[3]) 
-	        cv.PutText(speed_img, total_speed, (10, 120), font, colors_for_step[7]) 
-	        # add to accl window
-	        cv.PutText(accl_img, x_accl, (10, 40), font, colors_for_step[4])
-	        cv.PutText(accl_img, y_accl, (10, 80), font, colors_for_step[5])
-	        cv.PutText(accl_img, total_accl, (10, 120), font, colors_for_step[8])
-	        # add to overall window
-	        cv.PutText(overall_img, dist_traveled, (10, 60), font, cv.Scalar(0, 255, 0))
-	        cv.PutText(overall_img, top_speed_so_far, (10, 120), font, cv.Scalar(0, 255, 0))
-	        # if the object fits on the screen, display it as a green circle 
-	        if x_coord < screen_width and y_coord < screen_height:
-		    if self.draw_mode == "circle":
-			cv.Circle(next_image, (int(x_coord), int(y_coord)), self.marker_rad, self.object_color, thickness = -1)
-		    elif self.draw_mode == "line":
-			if img_index > 1:
-			    x_0 = data.metrics["x_pos"][img_index - 1]
-			    y_0 = data.metrics["y_pos"][img_index - 1]
-			    line_list.append([int(x_0), int(y_0), int(x_coord), int(y_coord)])
-		   	    for l in line_list:
-				cv.Line(next_image, (l[0], l[1]), (l[2], l[3]), self.object_color, thickness = self.marker_rad)
-		    elif self.draw_mode == "v_path":
-			# v-dependent path #
-			### colors for step at 7 ###
-		    	if img_index > 1:
-			    x_0 = data.metrics["x_pos"][img_index - 1]
-			    y_0 = data.metrics["y_pos"][img_index - 1]
-			    line_list.append([int(x_0), int(y_0), int(x_coord), int(y_coord)])
-			    color_list.append(colors_for_step[7])
-		   	    for index, l in enumerate(line_list):
-				cv.Line(next_image, (l[0], l[1]), (l[2], l[3]), color_list[index], thickness = self.marker_rad)
-		    else:
-			# a-dependent path
-			### colors for step at 8 ###
-		    	if img_index > 1:
-			    x_0 = data.metrics["x_pos"][img_index - 1]
-			    y_0 = data.metrics["y_pos"][img_index - 1]
-			    line_list.append([int(x_0), int(y_0), int(x_coord), int(y_coord)])
-			    color_list.append(colors_for_step[8])
-		   	    for index, l in enumerate(line_list):
-				cv.Line(next_image, (l[0], l[1]), (l[2], l[3]), color_list[index], thickness = self.marker_rad)
-		    cv.ShowImage("Replay", next_image)
-		    cv.ShowImage("Velocity", speed_img)
-		    cv.ShowImage("Acceleration", accl_img)
-		    cv.ShowImage("Overall", overall_img)
-	   	    k = cv.WaitKey(self.playback_speed)
-		    # press q or escape to quit
-		    if k == 113 or k == 27:
-		        self.show_video = False
-			cv.DestroyAllWindows()
-		        break
-        self.show_video = False 
+	    frames = frameloader.FrameSource(self.video_folder, num_frames)
+
+	# played at the recorded pace times the playback speed, by a timer on
+	# the Qt event loop (see replayview.py), starting paused on the
+	# background; the buttons and seek bar control it
+	self.player = replayview.ReplayPlayer(renderer, background, frames, self.replay_style, self.playback_speed)
+	self.player.moved.connect(self.show_seek_position)
+	self.player.rates.connect(self.show_playback_rates)
+	self.player.closed.connect(self.replay_closed)
+	# the seek bar covers every step of this video
+	self.seek_slider.setRange(1, max(1, num_frames - 1))
+	self.show_seek_position(1)
+	self.player.show()
       
     # allows user to calibrate pixel to actual distance ratio
     # by simply holding up an object of known area (that is
@@ -949,29 +906,43 @@ class ObjectTracker(QMainWindow):
         cv.CreateTrackbar("Start at color", "hold up object at preferred distance from camera", self.low_color, 179, self.update_low_color)
         cv.CreateTrackbar("End at color", "hold up object at preferred distance from camera", self.high_color, 179, self.update_high_color)
         camera_on = True
+	timer = self.stage_timer()
+	overlay_font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 0.4, 0.4, 0, 1, cv.CV_AA)
         while camera_on:
 	    if (not self.busy_updating):
+		timer.enabled = self.time_stages or self.timing_overlay
+		started = timer.start()
 		frame = cv.QueryFrame(capture)
 		if not frame:
 	    		break
+		timer.stop("QueryFrame", started)
 		# convert color to hue space for easier tracking
-		imgHSV = cv.CreateImage(cv.GetSize(frame), 8, 3)
-		cv.CvtColor(frame, imgHSV, cv.CV_BGR2HSV)
-		imgThresh = cv.CreateImage(cv.GetSize(frame), 8, 1)
+		self.buffers.fit(frame)
+		imgHSV = self.buffers.frame_sized("hsv", 3)
+		imgThresh = self.buffers.frame_sized("thresh", 1)
 		# interactive thresholding
-		cv.InRangeS(imgHSV, cv.Scalar(self.low_color, self.MED_SV, self.MED_SV), cv.Scalar(self.high_color, self.MAX_SV, self.MAX_SV), imgThresh)
+		detection.threshold(frame, imgHSV, imgThresh, self.low_color, self.high_color, self.MED_SV, self.MAX_SV, self.active_lookup(), timer)
   	
+		started = timer.start()
 		moments = cv.Moments(cv.GetMat(imgThresh))
 		self.calibration_area = cv.GetCentralMoment(moments, 0, 0)
+		started = timer.lap("Moments", started)
 		# shrink images for display
-		small_thresh = cv.CreateImage((self.fit_camera_width, self.fit_camera_height), 8, 1)
+		small_thresh = self.buffers.get("small_thresh", (self.fit_camera_width, self.fit_camera_height), 1)
 		cv.Resize(imgThresh, small_thresh)
-		small_frame = cv.CreateImage((self.fit_camera_width, self.fit_camera_height), 8, 3)
+		small_frame = self.buffers.get("small_frame", (self.fit_camera_width, self.fit_camera_height), 3)
 		cv.Resize(frame, small_frame)
+		started = timer.lap("Resize", started)
+		if self.timing_overlay:
+		    timing.draw_overlay(small_frame, timer, overlay_font)
+		    started = timer.lap("draw", started)
 		cv.ShowImage("hold up object at preferred distance from camera", small_frame)
 		cv.ShowImage("select for max visibility", small_thresh)
+		started = timer.lap("ShowImage", started)
 
 		k = cv.WaitKey(1)
+		timer.stop("WaitKey", started)
+		timer.tick()
 		# press q or escape to quit camera view
 		if k == 27 or k == 113 or self.end_record:
 		    camera_on = False
@@ -997,116 +968,227 @@ class ObjectTracker(QMainWindow):
     def track(self):
         # in case something else is still open
         cv.DestroyAllWindows()
-        tracker = Speed()
-    	imgArr = []
+	tracker = Speed(streaming = True)
         capture = cv.CaptureFromCAM(self.camera_index)
         if not capture:
 	    QMessageBox.information(self, "Camera Error", "Camera not found")
 	    return
 	cv.NamedWindow("Video", cv.CV_WINDOW_AUTOSIZE)
-    	cv.MoveWindow("Video", 320, 0)
-    	cv.NamedWindow("Tracking", cv.CV_WINDOW_AUTOSIZE)
-    	cv.MoveWindow("Tracking", 800, 82)
-    	moments = 0
-    	cv.CreateTrackbar("Start at color", "Video", self.low_color, 179, self.update_low_color)
-    	cv.CreateTrackbar("End at color", "Video", self.high_color, 179, self.update_high_color)
-    
-	start_time = 0   
-        camera_on = True
-        tracking = False
+	cv.MoveWindow("Video", 320, 0)
+	cv.NamedWindow("Tracking", cv.CV_WINDOW_AUTOSIZE)
+	cv.MoveWindow("Tracking", 800, 82)
+	# the detection mode runs the whole time the camera view is open, so
+	# it cannot be changed until it closes
+	mode = self.detection_mode[self.camera_index]
+	self.set_detection_enabled(False)
+	# predictive search window, used in "roi" mode
+	region = detection.RegionSearch()
+	# coarse-to-fine search, used in "pyramid" mode
+	pyramid = detection.PyramidSearch()
+	cv.CreateTrackbar("Start at color", "Video", self.low_color, 179, self.update_low_color)
+	cv.CreateTrackbar("End at color", "Video", self.high_color, 179, self.update_high_color)
+
+	# with several objects, every blob gets its own track (see multitrack.py)
+	objects = None
+	if mode == "multi":
+	    objects = multitrack.MultiTracker()
+	blob_buffers = bufferpool.BufferPool()
+
+	# implement interactive thresholding, then find image moments
+	# and compute object position by dividing by area
+	# (runs on the pipeline's detection thread, see pipeline.py)
+	def detect(frame, hsv, thresh, displacement, params):
+	    low_color, high_color, lookup = params
+	    if objects is not None:
+		# the blobs of the whole frame, one per object
+		detection.threshold(frame, hsv, thresh, low_color, high_color, self.MED_SV, self.MAX_SV, lookup, timer)
+		blob_buffers.fit(frame)
+		started = timer.start()
+		blobs = detection.find_blobs(thresh, blob_buffers.frame_sized("blobs", 1))
+		timer.stop("FindContours", started)
+		return blobs
+	    elif mode == "roi":
+		return region.detect(frame, hsv, thresh, low_color, high_color, self.MED_SV, self.MAX_SV, displacement, lookup, timer)
+	    elif mode == "pyramid":
+		return pyramid.detect(frame, hsv, thresh, low_color, high_color, self.MED_SV, self.MAX_SV, lookup, timer)
+	    return detection.detect_full(frame, hsv, thresh, low_color, high_color, self.MED_SV, self.MAX_SV, lookup, timer)
+
+	# every thread of the pipeline times its stages with the same timer
+	timer = self.stage_timer()
+	# frames are captured and tracked on their own threads; this loop only shows them
+	stages = pipeline.TrackingPipeline(capture, detect, tracker, timer = timer, objects = objects)
+	stages.set_params(self.detection_params())
+	stages.start()
 	needs_saving = False
-	background = 0
-        while camera_on:
-	    if (not self.busy_updating):
-		frame = cv.QueryFrame(capture)
-		if not frame:
-	   	    break	
-		#convert color to hue space for easier tracking
-		imgHSV = cv.CreateImage(cv.GetSize(frame), 8, 3)
-	 	cv.CvtColor(frame, imgHSV, cv.CV_BGR2HSV)
-		imgThresh = cv.CreateImage(cv.GetSize(frame), 8, 1)
-		# implement interactive thresholding
-		cv.InRangeS(imgHSV, cv.Scalar(self.low_color, self.MED_SV, self.MED_SV), cv.Scalar(self.high_color, self.MAX_SV, self.MAX_SV), imgThresh)
- 		 		
-		# find image momentsm, compute object position 
-		# by dividing by area
-		moments = cv.Moments(cv.GetMat(imgThresh))
-		x_mov = cv.GetSpatialMoment(moments, 1, 0)
-		y_mov = cv.GetSpatialMoment(moments, 0, 1)
-		area = cv.GetCentralMoment(moments, 0, 0)
-		# size is 480 360 for webcam
-		# 324, 243 for massive-imaged external camera
-		small_thresh = cv.CreateImage((self.fit_camera_width, self.fit_camera_height), 8, 1)
-		cv.Resize(imgThresh, small_thresh)
-		small_frame = cv.CreateImage((self.fit_camera_width, self.fit_camera_height), 8, 3)
-		cv.Resize(frame, small_frame)
-		cv.ShowImage("Tracking", small_thresh)	
-		cv.ShowImage("Video", small_frame)
+	writer = None
+	font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 0.6, 0.6, 0, 1, cv.CV_AA)
+	overlay_font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 0.4, 0.4, 0, 1, cv.CV_AA)
+	# size is 480 360 for webcam
+	# 324, 243 for massive-imaged external camera
+	display_size = (self.fit_camera_width, self.fit_camera_height)
+	try:
+	    while not stages.finished:
+		timer.enabled = self.time_stages or self.timing_overlay
+		slot = stages.next_frame(0.05)
+		if slot:
+		    started = timer.start()
+		    small_thresh = self.buffers.get("small_thresh", display_size, 1)
+		    cv.Resize(slot.thresh, small_thresh)
+		    small_frame = self.buffers.get("small_frame", display_size, 3)
+		    cv.Resize(slot.frame, small_frame)
+		    started = timer.lap("Resize", started)
+		    # live readout of the values computed so far
+		    if slot.readout:
+			self.draw_live_readout(small_frame, slot.readout, font)
+		    if slot.objects:
+			scale = float(display_size[0]) / cv.GetSize(slot.frame)[0]
+			self.draw_object_labels(small_frame, slot.objects, scale, overlay_font)
+		    if self.timing_overlay:
+			header = ["tracked %.1f fps, %d dropped" % (stages.fps(), stages.dropped)]
+			timing.draw_overlay(small_frame, timer, overlay_font, header)
+		    started = timer.lap("draw", started)
+		    stages.release(slot)
+		    cv.ShowImage("Tracking", small_thresh)
+		    cv.ShowImage("Video", small_frame)
+		    timer.stop("ShowImage", started)
+		    timer.tick()
+
+		started = timer.start()
+		k = cv.WaitKey(1)
+		timer.stop("WaitKey", started)
+		# the trackbars may have moved the color range
+		stages.set_params(self.detection_params())
 
- 		k = cv.WaitKey(1)
-			
 		# press q or escape to quit camera view
+		# (a recording still going is saved, as "Stop!" would)
 		if k == 27 or k == 113:
-		    camera_on = False
-		    tracking = False
-		    cv.DestroyAllWindows()
-		    break; 
+		    break
 
-		# click "Record!" or  press "g" to start tracking speed/recording 	
+		# click "Record!" or  press "g" to start tracking speed/recording
 		elif k == 103 or self.start_record:
-		    needs_saving = True
-		    start_time = time.clock()
-		    tracking = True
-		    # store background in memory and proceed to recording
-		    background = cv.CloneImage(frame)
-		    tracker.start_time = start_time
- 		    self.start_record = False
-		    imgArr.append(background)
+		    self.start_record = False
+		    if not needs_saving:
+			needs_saving = True
+			tracker.out_folder = self.new_trial_folder(time.time())
+			# frames are saved in the background while recording continues
+			if self.full_video_mode:
+			    if self.sprites_only:
+				writer = spritestore.SpriteWriter(tracker.out_folder)
+			    elif self.video_format == "mjpeg":
+				writer = videostore.ContainerWriter(tracker.out_folder)
+			    else:
+				writer = framewriter.FrameWriter(tracker.out_folder)
+			# the next frame tracked is saved as the background image
+			stages.start_recording(writer, tracker.out_folder)
+			# the timing report covers the trial only
+			timer.reset()
 		# click "Stop recording" or press "d" to stop tracking speed/recording
 		# save everything in the proper format and close recording windows
 		elif k == 100 or self.end_record:
-		  if needs_saving:
-		    tracking = False
-		    tracker.stop_time = time.clock()
-		    curr_dir = os.listdir(".")
-		    # create the output folder if it doesn't already exist
-		    if self.output_folder not in curr_dir:
-		        path_var = "./" + str(self.output_folder)
-			os.mkdir(path_var)
-		    # default saving directory is output_folder/Trial_<start time of trial>
-		    new_vid_folder =  "./" + str(self.output_folder) + "/Trial_" + str(start_time)
-		    os.mkdir(new_vid_folder)
-		    tracker.out_folder = new_vid_folder 
-		    # save the first frame of the film as the background image
-		    background_name = str(tracker.out_folder) + "/background.png"
-	   	    cv.SaveImage(background_name, background)	
- 		    index = 0
-		    for img in imgArr:
-			output_name = str(tracker.out_folder) + "/frame_" + str(index) + ".png"
-			cv.SaveImage(output_name, img)			
-	    	   	index += 1 
-		   # compute velocity and acceleration values	
-		    tracker.update()
-		    # save the tracking done so far (by pickling)
-		    # can later be exported as a text file
-		    tracker_file = str(tracker.out_folder) + "/Data"
-		    f = open(tracker_file, 'w')
-		    pickle.dump(tracker, f)
-		    f.close()
-		    cv.DestroyAllWindows()		    
-		    break
-		  else:
-		    cv.DestroyAllWindows()
+		    self.end_record = False
 		    break
-		if tracking:
-		    # store object position
-		    if area > 0:
-			posX = float(x_mov)/float(area)
-			posY = float(y_mov)/float(area)
-			curr_time = time.clock()
-		       	tracker.add_pos(posX, posY, curr_time - start_time)
-			start_time = curr_time 			
-			imgArr.append(cv.CloneImage(frame))
+	    # however the camera view was closed, a trial that was started is
+	    # saved (rather than left as a folder of frames with no data)
+	    if needs_saving:
+		self.save_recording(stages, tracker, objects, writer, timer, mode)
+	finally:
+	    stages.stop()
+	    cv.DestroyAllWindows()
+	    self.set_detection_enabled(True)
+	    # let the writer threads exit however the camera view was closed
+	    if writer:
+		writer.close()
+	if stages.error is not None:
+	    QMessageBox.information(self, "Tracking Error", str(stages.error))
+
+    # save the trial being recorded by stages (see track()) to its folder
+    def save_recording(self, stages, tracker, objects, writer, timer, mode):
+	# every frame captured so far is tracked before saving
+	stages.stop()
+	# and every frame queued is saved: containers are only
+	# indexed once the writer finishes, and a trial is not
+	# found by replay (or lost on exit) until they are
+	if writer:
+	    writer.close(wait = True)
+	tracker.stop_time = stages.last_time
+	settings = self.trial_settings(mode)
+	if objects is not None:
+	    # every object gets its own track file; the one followed
+	    # longest is also saved as Data.bin, for single-object tools
+	    # its samples are only the frames it was matched in, which the
+	    # header says (see trialdata.save_trial) and the frame log maps
+	    objects.finish()
+	    trialdata.save_tracks(objects.tracks, tracker.out_folder, settings, objects.start_time)
+	    primary = objects.primary()
+	    if primary is not None:
+		primary.speed.out_folder = tracker.out_folder
+		tracker = primary.speed
+		settings["primary_track"] = primary.id
+		stages.frame_log.assign_samples(primary.frames)
+	# compute velocity and acceleration values
+	# (a no-op for streaming trackers, which are already up to date)
+	tracker.update()
+	# save the tracking done so far as columns (see trialdata.py)
+	# can later be exported as a text file
+	# with the grab time and latency of every frame recorded
+	trialdata.save_trial(tracker, tracker.out_folder, settings, stages.frame_log)
+	if self.time_stages:
+	    timer.save(tracker.out_folder, {"pipeline": stages.counts()})
+	cv.DestroyAllWindows()
+	# frames dropped because the disk could not keep up, and frames that
+	# could not be encoded or written (a full disk, say)
+	if writer and (writer.dropped or writer.failed):
+	    QMessageBox.information(self, "Recording", "Not every frame was saved: " + writer.report())
+
+    # how a trial was tracked, saved with its data (see trialdata.save_trial)
+    # mode is the detection mode it ran with (see DETECTION_MODES)
+    def trial_settings(self, mode):
+	return {"source": "camera " + str(self.camera_index),
+		"low_color": self.low_color,
+		"high_color": self.high_color,
+		"min_sv": self.MED_SV,
+		"max_sv": self.MAX_SV,
+		"detection": mode,
+		"multi_object": mode == "multi",
+		"conversion_factor": self.conversion_factor}
+
+    # settings the detection thread tracks with
+    # (read on the Qt thread, handed over through TrackingPipeline.set_params)
+    def detection_params(self):
+	return (self.low_color, self.high_color, self.active_lookup())
+
+    # create output_folder/Trial_<start time of trial> (and output_folder
+    # itself if it doesn't already exist) and return its path
+    def new_trial_folder(self, start_time):
+	curr_dir = os.listdir(".")
+	if self.output_folder not in curr_dir:
+	    path_var = "./" + str(self.output_folder)
+	    os.mkdir(path_var)
+	new_vid_folder = "./" + str(self.output_folder) + "/Trial_" + str(start_time)
+	os.mkdir(new_vid_folder)
+	return new_vid_folder
+
+    # write current velocity, acceleration, distance and top speed
+    # (as computed by the detection thread) onto the live video
+    def draw_live_readout(self, img, readout, font):
+	color = cv.CV_RGB(0, 255, 0)
+	velocity, acceleration, distance, top_speed = readout
+	lines = ["Velocity: " + str(round(self.to_real_units(velocity), 2)),
+		 "Acceleration: " + str(round(self.to_real_units(acceleration), 2)),
+		 "Distance: " + str(round(self.to_real_units(distance), 2)),
+		 "Top speed: " + str(round(self.to_real_units(top_speed), 2))]
+	for n, text in enumerate(lines):
+	    cv.PutText(img, text, (10, 20 + 20 * n), font, color)
+
+    # mark every object being tracked (id, x, y at full size) on the shrunken
+    # live video, scale being its size over the full size
+    def draw_object_labels(self, img, objects, scale, font):
+	for track_id, x, y in objects:
+	    # the colors the replay draws each track in
+	    color = replay.TRACK_COLORS[(track_id - 1) % len(replay.TRACK_COLORS)]
+	    center = (int(x * scale), int(y * scale))
+	    cv.Circle(img, center, 4, color, thickness = -1)
+	    cv.PutText(img, str(track_id), (center[0] + 6, center[1] - 6), font, color)
 
     # mouse function for click & select
     # in color calibration
@@ -1116,11 +1198,13 @@ class ObjectTracker(QMainWindow):
 	    self.mouse_start = [x, y]
 	elif event == cv.CV_EVENT_MOUSEMOVE:
 	    if self.mouse_start:
-	        img_with_rect = cv.CloneImage(self.frame)
+		img_with_rect = self.buffers.frame_sized("selection", 3)
+		cv.Copy(self.frame, img_with_rect)
 	        cv.Rectangle(img_with_rect, (self.mouse_start[0], self.mouse_start[1]), (x, y), cv.Scalar(0, 255, 0), 2, 8, 0) 
 	        cv.ShowImage("click & drag to select object", img_with_rect)	
 	elif event == cv.CV_EVENT_LBUTTONUP:
-	    img_with_rect = cv.CloneImage(self.frame)
+	    img_with_rect = self.buffers.frame_sized("selection", 3)
+	    cv.Copy(self.frame, img_with_rect)
 	    cv.Rectangle(img_with_rect, (self.mouse_start[0], self.mouse_start[1]), (x, y), cv.Scalar(0, 255, 0), 2, 8, 0) 
 	    cv.ShowImage("click & drag to select object", img_with_rect)
 	    best_color, hue = self.histogram(self.frame)
@@ -1145,6 +1229,7 @@ class ObjectTracker(QMainWindow):
 		frame = cv.QueryFrame(capture)
 		if not frame:
 	    		break
+		self.buffers.fit(frame)
 		cv.ShowImage("click & drag to select object", frame)
 		self.frame = frame
 		k = cv.WaitKey(1)
@@ -1203,27 +1288,5 @@ def HSV_to_RGB(hue_part):
 	B = int(255 * float(360 - hue)/float(60))
     return cv.Scalar(B, G, R)
 
-# max value should be max brightness, min value should be min brightness, etc.
-# val/val range = text_color/color_range
-def scale_color(val, min_, max_, color):
-    min_red = 120
-    red_interval = 125
-    green_interval = 205
-    min_green = 50
-    val_offset = abs(val - min_) 
-    if val_offset > max_:
-	val_offset = max_ 
-    val_ratio = float(val_offset)/float((abs(max_ - min_)))
-    if val_ratio < 0:
-	val_ratio = 0
-    elif val_ratio > 1:
-	val_ratio = 1
-    if color == "R":
-    	scaled = min_red + int(val_ratio * float(red_interval))    
-   	return cv.CV_RGB(min(scaled, 255), 0, 0)
-    else:
-	scaled = min_green + int(val_ratio * float(green_interval))     
-	return cv.CV_RGB(0, min(scaled, 255), 0)    
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import os
+import spritestore
+import threading
+import videostore
+
+###########################
+#   ON-DEMAND FRAME I/O   #
+###########################
+# frames of a saved trial, decoded only when needed
+# a read-ahead thread decodes the next read_ahead frames after the one last
+# asked for (wrapping around at the end, since replay loops), and decoded
+# frames are kept in a cache of at most cache_size frames, least recently used
+# going first; frames are never modified in the cache, so copy before drawing
+# trials saved as sprites (see spritestore.py) are cached as their sprites,
+# which are pasted over the background on every get(), so the cache stays small
+class FrameSource(object):
+
+    def __init__(self, folder, num_frames, cache_size = 128, read_ahead = 16):
+	self.folder = str(folder)
+	self.num_frames = num_frames
+	self.cache_size = max(cache_size, read_ahead + 1)
+	self.read_ahead = read_ahead
+	self.reader = None
+	self.sprites = None
+	if videostore.has_container(self.folder):
+	    self.reader = videostore.ContainerReader(self.folder)
+	elif spritestore.has_sprites(self.folder):
+	    self.reader = self.sprites = spritestore.SpriteReader(self.folder)
+	# frame index -> [image, time of last use]
+	self.cache = {}
+	self.clock = 0
+	self.cache_lock = threading.Lock()
+	# container reads share one file handle
+	self.decode_lock = threading.Lock()
+	self.wanted = threading.Condition()
+	self.position = None
+	self.active = True
+	self.prefetcher = None
+	if read_ahead > 0 and num_frames > 1:
+	    self.prefetcher = threading.Thread(target=self.prefetch, name="FrameSource")
+	    self.prefetcher.setDaemon(True)
+	    self.prefetcher.start()
+
+    # decode frame index straight from disk (None if it was not saved)
+    # (just its sprites for trials saved as sprites)
+    def decode(self, index):
+	if self.reader:
+	    self.decode_lock.acquire()
+	    try:
+		return self.reader.read(index)
+	    finally:
+		self.decode_lock.release()
+	return cv.LoadImage(os.path.join(self.folder, "frame_" + str(index) + ".png"))
+
+    def cached(self, index):
+	self.cache_lock.acquire()
+	try:
+	    entry = self.cache.get(index)
+	    if entry is None:
+		return None
+	    self.clock += 1
+	    entry[1] = self.clock
+	    return entry[0]
+	finally:
+	    self.cache_lock.release()
+
+    def remember(self, index, img):
+	self.cache_lock.acquire()
+	try:
+	    self.clock += 1
+	    self.cache[index] = [img, self.clock]
+	    while len(self.cache) > self.cache_size:
+		oldest = min(self.cache, key=lambda i: self.cache[i][1])
+		del self.cache[oldest]
+	finally:
+	    self.cache_lock.release()
+
+    def contains(self, index):
+	self.cache_lock.acquire()
+	try:
+	    return index in self.cache
+	finally:
+	    self.cache_lock.release()
+
+    # the image for frame index, or None if it was never saved
+    # also moves the read-ahead window to start after index
+    def get(self, index):
+	img = self.cached(index)
+	if img is None:
+	    img = self.decode(index)
+	    if img is not None:
+		self.remember(index, img)
+	self.wanted.acquire()
+	self.position = index
+	self.wanted.notify()
+	self.wanted.release()
+	if self.sprites and img is not None:
+	    return self.sprites.compose(img)
+	return img
+
+    # the image for frame index, or for the last frame before it that was
+    # saved (frames dropped while recording repeat the previous one); None if
+    # there is none
+    def latest(self, index):
+	while index > 0:
+	    img = self.get(index)
+	    if img is not None:
+		return img
+	    index -= 1
+	return None
+
+    # read-ahead thread: keep the frames after the current position decoded
+    def prefetch(self):
+	while True:
+	    self.wanted.acquire()
+	    while self.active and self.position is None:
+		self.wanted.wait()
+	    position = self.position
+	    self.position = None
+	    self.wanted.release()
+	    if not self.active:
+		return
+	    for step in range(1, self.read_ahead + 1):
+		# frames run from 1 to num_frames - 1
+		index = (position + step - 1) % (self.num_frames - 1) + 1
+		# stop early if playback has moved on
+		if self.position is not None or not self.active:
+		    break
+		if not self.contains(index):
+		    img = self.decode(index)
+		    if img is not None:
+			self.remember(index, img)
+
+    def close(self):
+	self.wanted.acquire()
+	self.active = False
+	self.wanted.notify()
+	self.wanted.release()
+	if self.prefetcher:
+	    self.prefetcher.join()
+	if self.reader:
+	    self.reader.close()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import os
+import threading
+import Queue
+
+###########################
+#   BACKGROUND FRAME I/O  #
+###########################
+# saves frames to disk on a pool of encoder threads while recording continues
+# frames wait in a bounded queue: when it is full, write() blocks for at most
+# max_wait seconds (backpressure) and then drops the frame, so memory stays flat
+# no matter how long the recording runs
+class FrameWriter(object):
+
+    # whether write() takes the boxes around the objects in the frame, saving
+    # only what is inside them (see spritestore.SpriteWriter)
+    sprites = False
+
+    def __init__(self, folder, num_threads = 2, max_pending = 32, max_wait = 0.05, save_image = cv.SaveImage):
+	self.folder = str(folder)
+	self.max_wait = max_wait
+	self.save_image = save_image
+	self.queue = Queue.Queue(max_pending)
+	self.lock = threading.Lock()
+	# frame counts, for reporting once recording stops
+	self.written = 0
+	self.dropped = 0
+	self.failed = 0
+	self.closed = False
+	self.threads = []
+	self.running = num_threads
+	for n in range(num_threads):
+	    worker = threading.Thread(target=self.run, name="FrameWriter-" + str(n))
+	    worker.start()
+	    self.threads.append(worker)
+
+    # where frame number index is saved
+    def frame_path(self, index):
+	return os.path.join(self.folder, "frame_" + str(index) + ".png")
+
+    # queue a copy of img to be saved as frame_<index>.png
+    # returns False if the frame had to be dropped
+    def write(self, index, img):
+	return self.enqueue(index, cv.CloneImage(img))
+
+    # queue item (owned by the writer from now on) to be stored as frame index
+    # returns False if it had to be dropped
+    def enqueue(self, index, item):
+	if self.closed:
+	    raise ValueError("write to a closed FrameWriter")
+	try:
+	    self.queue.put((index, item), True, self.max_wait)
+	except Queue.Full:
+	    self.lock.acquire()
+	    self.dropped += 1
+	    self.lock.release()
+	    return False
+	return True
+
+    # number of frames still waiting to be saved
+    def pending(self):
+	return self.queue.qsize()
+
+    # encoder thread: save frames until told to stop
+    def run(self):
+	while True:
+	    item = self.queue.get()
+	    if item is None:
+		break
+	    index, img = item
+	    try:
+		ok = self.store(index, img)
+	    except Exception:
+		ok = False
+	    self.lock.acquire()
+	    if ok is False:
+		self.failed += 1
+	    else:
+		self.written += 1
+	    self.lock.release()
+	# the last thread out finishes off the output
+	self.lock.acquire()
+	self.running -= 1
+	last = self.running == 0
+	self.lock.release()
+	if last:
+	    self.finish()
+
+    # save one frame, returning False on failure
+    # (cv.SaveImage returns None on success)
+    def store(self, index, img):
+	return self.save_image(self.frame_path(index), img)
+
+    # called once every queued frame has been stored
+    def finish(self):
+	pass
+
+    # stop accepting frames; queued frames are still saved
+    # unless wait is set, this returns right away and the threads finish in the background
+    def close(self, wait = False):
+	if not self.closed:
+	    self.closed = True
+	    for worker in self.threads:
+		self.queue.put(None)
+	if wait:
+	    self.join()
+
+    # wait for every queued frame to be saved
+    def join(self):
+	for worker in self.threads:
+	    worker.join()
+
+    # human-readable summary of the recording
+    def report(self):
+	return "%d frames saved, %d dropped, %d failed" % (self.written, self.dropped, self.failed)
@@ -0,0 +1,296 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import math
+import numpy
+
+###########################
+#   VECTORIZED KINEMATICS #
+###########################
+# every field stored in Speed.metrics, in the order display_video reads them
+METRIC_NAMES = ["x_pos", "y_pos", "v_x", "v_y", "a_x", "a_y", "distance", "time", "v_net", "a_net"]
+
+# computes every metric of a recording in one pass of whole-array operations
+# x and y hold the leading 0.0 that Speed starts with, so they are one
+# sample longer than t (t[n] is the time taken to move from x[n] to x[n + 1])
+# the result matches the old per-sample loop: each array starts with a 0.0
+# for the first timestep and has len(t) + 1 values
+# out may supply those arrays (or views) to be filled in place
+def compute_metrics(x, y, t, out=None):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    t = numpy.asarray(t, dtype=numpy.float64)
+    n = len(t)
+    metrics = out
+    if metrics is None:
+	metrics = {}
+	for p in METRIC_NAMES:
+	    metrics[p] = numpy.zeros(n + 1)
+    else:
+	for p in METRIC_NAMES:
+	    metrics[p][0] = 0.0
+    if n == 0:
+	return metrics
+    # position at the start of each timestep
+    metrics["x_pos"][1:] = x[:n]
+    metrics["y_pos"][1:] = y[:n]
+    # velocity is the difference in position divided by the amount of time
+    v_x = metrics["v_x"]
+    v_y = metrics["v_y"]
+    numpy.divide(x[1:n + 1] - x[:n], t, v_x[1:])
+    numpy.divide(y[1:n + 1] - y[:n], t, v_y[1:])
+    v_net = metrics["v_net"]
+    resultant(v_x[1:], v_y[1:], v_net[1:])
+    # acceleration is the difference in velocity divided by the amount of time
+    numpy.divide(numpy.diff(v_x), t, metrics["a_x"][1:])
+    numpy.divide(numpy.diff(v_y), t, metrics["a_y"][1:])
+    # as in the original loop, a_net is the resultant of the velocity components
+    metrics["a_net"][1:] = v_net[1:]
+    # approximate distance traveled in each timestep
+    # based on average of initial and final velocity in timestep
+    numpy.multiply((v_net[1:] + v_net[:-1]) / 2.0, t, metrics["distance"][1:])
+    metrics["time"][1:] = t
+    return metrics
+
+# returns (min, max)  of chosen sign (pos, neg, or all by default) values
+# for a given field (v_x, x_pos, etc.)
+def min_max(vals, which_field, which_vals = "all"):
+	# accounts for the initial zero in the vector: position isn't
+	# accurate until the first value, velocity until it compares two accurate positions
+	# (hence in the second value), and acceleration needs to accurate velocities
+	# (hence in the third value)
+	offset = 1
+	if which_field == "v_x" or which_field == "v_y" or which_field == "v_net":
+	    offset = 2
+	if which_field == "a_x" or which_field == "a_y" or which_field == "a_net":
+	    offset = 3
+	candidate_values = numpy.asarray(vals[offset:])
+	max_v = min_v = 0
+	# short tracks (or paths straight along one axis) may have nothing to choose from
+	if which_vals == "neg":
+	    candidate_values = candidate_values[candidate_values <= 0]
+	elif which_vals != "all":
+	    candidate_values = candidate_values[candidate_values > 0]
+	if not len(candidate_values):
+	    return [min_v, max_v]
+	# treating negative values as absolute values
+	if which_vals == "neg":
+	    max_v = candidate_values.min()
+	    min_v = candidate_values.max()
+	else:
+	    max_v = candidate_values.max()
+	    min_v = candidate_values.min()
+	return [min_v, max_v]
+
+###########################
+#     MOTION TRACKING     #
+###########################
+# rows of the buffer backing Speed; x, y and t are stored with a leading
+# pad so that x_pos, y_pos and time are views onto the same memory
+X_ROW, Y_ROW, T_ROW, VX_ROW, VY_ROW, AX_ROW, AY_ROW, VNET_ROW, DIST_ROW = range(9)
+NUM_ROWS = 9
+# metric -> row it is a view of (a_net mirrors v_net, see compute_metrics)
+METRIC_ROWS = {"x_pos": X_ROW, "y_pos": Y_ROW, "time": T_ROW, "v_x": VX_ROW, "v_y": VY_ROW,
+	       "a_x": AX_ROW, "a_y": AY_ROW, "v_net": VNET_ROW, "a_net": VNET_ROW, "distance": DIST_ROW}
+INITIAL_CAPACITY = 1024
+
+# data structure to store velocity, acceleration, distance traveled, and any other computer parameters
+# samples and metrics live in one contiguous float64 buffer that grows geometrically;
+# x, y, t and every entry in metrics are views onto it, valid until the next add_pos
+class Speed(object):
+    __slots__ = ["start_time", "stop_time", "out_folder", "streaming", "total_distance",
+		 "top_speed", "_buf", "_n", "_views", "_last_v"]
+
+    # minimum requirements to keep the speed object lightweight for the recording phase
+    # in streaming mode every metric is also updated as each sample arrives,
+    # so live values are available while recording and update() has nothing left to do
+    def __init__(self, streaming = False):
+	self.start_time = 0.0
+	self.stop_time = 0.0
+	# folder in which we will save this object
+	self.out_folder = ""
+	self.streaming = streaming
+	# running totals, matching the overall panel of the replay (see
+	# replay.StepValues)
+	self.total_distance = 0.0
+	self.top_speed = 0.0
+	self._buf = numpy.zeros((NUM_ROWS, INITIAL_CAPACITY))
+	# number of samples (timesteps) recorded
+	self._n = 0
+	self._views = None
+	# velocity of the newest sample, as floats for cheap streaming updates
+	self._last_v = (0.0, 0.0, 0.0)
+
+    # object's x-coordinate and y-coordinate (starting at 0.0), and time, respectively
+    @property
+    def x(self):
+	return self._buf[X_ROW, 1:self._n + 2]
+
+    @property
+    def y(self):
+	return self._buf[Y_ROW, 1:self._n + 2]
+
+    @property
+    def t(self):
+	return self._buf[T_ROW, 1:self._n + 1]
+
+    # views of every field in METRIC_NAMES, each with num_frames() values
+    @property
+    def metrics(self):
+	if self._views is None:
+	    views = {}
+	    for p in METRIC_NAMES:
+		views[p] = self._buf[METRIC_ROWS[p], :self._n + 1]
+	    self._views = views
+	return self._views
+
+    # number of recorded samples
+    def num_samples(self):
+	return self._n
+
+    # the used part of the backing buffer, one row per stored column
+    def buffer(self):
+	return self._buf[:, :self._n + 2]
+
+    # adopt an already computed buffer (such as a memory-mapped trial) without copying
+    # it is only copied if more samples are added
+    def use_buffer(self, buf, num_samples, total_distance, top_speed):
+	self._buf = buf
+	self._n = num_samples
+	self._views = None
+	self.total_distance = total_distance
+	self.top_speed = top_speed
+	self._last_v = (float(buf[VX_ROW, num_samples]), float(buf[VY_ROW, num_samples]),
+			float(buf[VNET_ROW, num_samples]))
+
+    # make room for at least size columns, doubling so appends are amortized O(1)
+    def reserve(self, size):
+	capacity = self._buf.shape[1]
+	if size <= capacity:
+	    return
+	while capacity < size:
+	    capacity *= 2
+	grown = numpy.zeros((NUM_ROWS, capacity))
+	grown[:, :self._n + 2] = self._buf[:, :self._n + 2]
+	self._buf = grown
+
+    # append values to the appropriate rows
+    def add_pos(self, x_val, y_val, timestep):
+	n = self._n
+	self.reserve(n + 3)
+	buf = self._buf
+	buf[X_ROW, n + 2] = x_val
+	buf[Y_ROW, n + 2] = y_val
+	buf[T_ROW, n + 1] = timestep
+	self._n = n + 1
+	self._views = None
+	if self.streaming:
+	    self.advance(float(x_val), float(y_val), float(timestep))
+
+    # constant-time update of every metric for the newest sample
+    # (the same arithmetic compute_metrics applies to whole arrays)
+    def advance(self, x_1, y_1, timestep):
+	buf = self._buf
+	k = self._n
+	last_vx, last_vy, last_v = self._last_v
+	# x and y velocity is the difference in position divided by the amount of time
+	curr_vx = (x_1 - buf[X_ROW, k]) / timestep
+	curr_vy = (y_1 - buf[Y_ROW, k]) / timestep
+	v_net = math.sqrt(curr_vx * curr_vx + curr_vy * curr_vy)
+	buf[VX_ROW, k] = curr_vx
+	buf[VY_ROW, k] = curr_vy
+	buf[VNET_ROW, k] = v_net
+	# x and y acceleration is the difference in velocity divided by the amount of time
+	buf[AX_ROW, k] = (curr_vx - last_vx) / timestep
+	buf[AY_ROW, k] = (curr_vy - last_vy) / timestep
+	# approximate distance traveled in that timestep
+	# based on average of initial and final velocity in timestep
+	step_dist = (v_net + last_v) / 2.0 * timestep
+	buf[DIST_ROW, k] = step_dist
+	self._last_v = (curr_vx, curr_vy, v_net)
+	# velocity is only accurate once it compares two accurate positions
+	# (see the offsets in min_max); like the replay's top speed, this
+	# leaves out the first three steps
+	if k > 1:
+	    self.total_distance += step_dist
+	if k > 3 and v_net > self.top_speed:
+	    self.top_speed = v_net
+
+    # based on the amount of time that has passed, update all fields
+    # timestep is a decimal amount of time in seconds
+    def update(self):
+	if not self.streaming:
+	    self.recompute()
+
+    # fill every derived row from the raw samples with whole-array operations
+    def recompute(self):
+	metrics = self.metrics
+	compute_metrics(self.x, self.y, self.t, metrics)
+	v_net = metrics["v_net"]
+	self.total_distance = float(metrics["distance"][2:].sum())
+	self.top_speed = 0.0
+	if len(v_net) > 4:
+	    self.top_speed = max(0.0, float(v_net[4:].max()))
+	if self._n:
+	    self._last_v = (float(metrics["v_x"][-1]), float(metrics["v_y"][-1]), float(v_net[-1]))
+
+    # helper methods for retrieving velocity/acceleration
+    # at a given time
+    def current_vx(self):
+	return self._buf[VX_ROW, self._n]
+
+    def current_vy(self):
+	return self._buf[VY_ROW, self._n]
+
+    # technically this is speed (always positive)
+    def current_v(self):
+	return math.sqrt(math.pow(self.current_vx(), 2) + math.pow(self.current_vy(), 2))
+
+    def current_ax(self):
+	return self._buf[AX_ROW, self._n]
+
+    def current_ay(self):
+	return self._buf[AY_ROW, self._n]
+
+    def current_a(self):
+	return math.sqrt(math.pow(self.current_ax(), 2) + math.pow(self.current_ay(), 2))
+
+    # movement expected over the next timestep at the current velocity, as (dx, dy)
+    # (None until two samples have been taken)
+    def next_step(self):
+	if self._n <= 1:
+	    return None
+	timestep = self._buf[T_ROW, self._n]
+	return (self.current_vx() * timestep, self.current_vy() * timestep)
+
+    # return number of frames
+    def num_frames(self):
+	return self._n + 1
+
+    # only the raw samples are pickled; every metric is recomputed on load
+    def __getstate__(self):
+	return {"start_time": self.start_time, "stop_time": self.stop_time,
+		"out_folder": self.out_folder, "streaming": self.streaming,
+		"x": self.x.copy(), "y": self.y.copy(), "t": self.t.copy()}
+
+    # also accepts the attribute dict of Speed objects pickled before the buffer
+    # layout (lists x, y and t, plus a metrics dict that is simply recomputed)
+    def __setstate__(self, state):
+	self.__init__(state.get("streaming", False))
+	self.start_time = state.get("start_time", 0.0)
+	self.stop_time = state.get("stop_time", 0.0)
+	self.out_folder = state.get("out_folder", "")
+	t = numpy.asarray(state["t"], dtype=numpy.float64)
+	n = len(t)
+	self.reserve(n + 2)
+	self._buf[X_ROW, 1:n + 2] = state["x"][:n + 1]
+	self._buf[Y_ROW, 1:n + 2] = state["y"][:n + 1]
+	self._buf[T_ROW, 1:n + 1] = t
+	self._n = n
+	self.recompute()
+
+# norm of two arrays of vector components, written into out if given
+def resultant(x, y, out=None):
+    out = numpy.multiply(x, x, out)
+    out += y * y
+    return numpy.sqrt(out, out)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+from kinematics import Speed
+
+###########################
+#  MULTI-OBJECT TRACKING  #
+###########################
+# follows several objects of the same color at once: every frame the mask is
+# split into blobs (detection.find_blobs), and each blob is handed to the track
+# it most likely continues
+# a track predicts where its object is now from its last position and
+# velocity; blobs are binned into a grid of gate-sized cells, so only the 3x3
+# cells around a prediction are looked at, and the closest (track, blob) pairs
+# within gate pixels are matched first, each track and blob at most once
+# per-frame cost grows with the number of blobs, not with tracks times blobs
+# blobs nobody claims start new tracks; a track that goes unmatched for more
+# than max_missed frames in a row ends
+
+# one object's samples
+class ObjectTrack(object):
+
+    def __init__(self, track_id, start_time):
+	self.id = track_id
+	self.speed = Speed(streaming = True)
+	self.speed.start_time = start_time
+	self.speed.stop_time = start_time
+	# recorded frame number of every sample, in order
+	self.frames = []
+	self.last = None
+	self.last_time = start_time
+	# frames in a row the object was not matched in
+	self.missed = 0
+	self.ended = False
+
+    # where the object should be at timestamp, going by its last velocity
+    def predict(self, timestamp):
+	x, y = self.last
+	if self.speed.num_samples() > 1:
+	    dt = timestamp - self.last_time
+	    x += self.speed.current_vx() * dt
+	    y += self.speed.current_vy() * dt
+	return x, y
+
+    def add(self, x, y, timestamp, frame):
+	self.speed.add_pos(x, y, timestamp - self.last_time)
+	self.speed.stop_time = timestamp
+	self.frames.append(frame)
+	self.last = (x, y)
+	self.last_time = timestamp
+	self.missed = 0
+
+class MultiTracker(object):
+
+    def __init__(self, gate = 60.0, max_missed = 10):
+	self.gate = gate
+	self.max_missed = max_missed
+	# every track so far, ended or not, in order of creation
+	self.tracks = []
+	self.active = []
+	self.next_id = 1
+	self.last_time = 0.0
+	# timestamp of the background frame, which the tracks' times are relative to
+	self.start_time = 0.0
+
+    # start a recording at timestamp (the background frame)
+    def start(self, timestamp):
+	self.tracks = []
+	self.active = []
+	self.next_id = 1
+	self.start_time = timestamp
+	self.last_time = timestamp
+
+    # (track index, blob index) pairs, closest first, each used at most once
+    def associate(self, blobs, timestamp):
+	cell = float(self.gate)
+	grid = {}
+	for n, blob in enumerate(blobs):
+	    key = (int(blob[0] // cell), int(blob[1] // cell))
+	    grid.setdefault(key, []).append(n)
+	gate_squared = self.gate * self.gate
+	candidates = []
+	for t, track in enumerate(self.active):
+	    x, y = track.predict(timestamp)
+	    cell_x = int(x // cell)
+	    cell_y = int(y // cell)
+	    for gx in (cell_x - 1, cell_x, cell_x + 1):
+		for gy in (cell_y - 1, cell_y, cell_y + 1):
+		    for n in grid.get((gx, gy), ()):
+			dx = blobs[n][0] - x
+			dy = blobs[n][1] - y
+			distance = dx * dx + dy * dy
+			if distance <= gate_squared:
+			    candidates.append((distance, t, n))
+	candidates.sort()
+	track_used = [False] * len(self.active)
+	blob_used = [False] * len(blobs)
+	pairs = []
+	for distance, t, n in candidates:
+	    if track_used[t] or blob_used[n]:
+		continue
+	    track_used[t] = True
+	    blob_used[n] = True
+	    pairs.append((t, n))
+	return pairs
+
+    # add one frame's blobs (as detection.find_blobs gives them), grabbed at
+    # timestamp and recorded as frame number frame
+    def update(self, blobs, timestamp, frame):
+	pairs = self.associate(blobs, timestamp)
+	matched = [False] * len(self.active)
+	claimed = [False] * len(blobs)
+	for t, n in pairs:
+	    x, y, area = blobs[n]
+	    self.active[t].add(x, y, timestamp, frame)
+	    matched[t] = True
+	    claimed[n] = True
+	still_active = []
+	for t, track in enumerate(self.active):
+	    if not matched[t]:
+		track.missed += 1
+		if track.missed > self.max_missed:
+		    track.ended = True
+		    continue
+	    still_active.append(track)
+	for n, blob in enumerate(blobs):
+	    if not claimed[n]:
+		# the first step of a new track spans the last frame interval
+		track = ObjectTrack(self.next_id, self.last_time)
+		self.next_id += 1
+		track.add(blob[0], blob[1], timestamp, frame)
+		self.tracks.append(track)
+		still_active.append(track)
+	self.active = still_active
+	self.last_time = timestamp
+
+    # compute every track's metrics (a no-op for their streaming trackers)
+    def finish(self):
+	for track in self.tracks:
+	    track.speed.update()
+
+    # the track with the most samples, or None if there are none
+    def primary(self):
+	best = None
+	for track in self.tracks:
+	    if best is None or track.speed.num_samples() > best.speed.num_samples():
+		best = track
+	return best
+
+    # (id, x, y) of every track matched in the latest frame
+    def positions(self):
+	return [(track.id, track.last[0], track.last[1]) for track in self.active if track.missed == 0]
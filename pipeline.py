@@ -0,0 +1,371 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import detection
+import math
+import os
+import threading
+import Queue
+import bufferpool
+import timing
+from timing import NO_TIMER
+
+###########################
+#   PIPELINED TRACKING    #
+###########################
+# track() split into three stages joined by bounded queues, so showing frames
+# never holds up grabbing or tracking them:
+#   capture thread:   grabs a frame, timestamps it right away (on the
+#                     monotonic clock) and copies it into a free slot
+#   detection thread: finds the object and, while recording, feeds
+#                     Speed.add_pos and the frame writer
+#   display:          whoever calls next_frame() (the Qt thread in track()),
+#                     shrinking and showing frames as fast as it can
+# frames travel in a fixed ring of preallocated slots; when display falls
+# behind, detection skips showing a frame (never tracking it), and capture
+# only drops a frame when detection is more than queue_size frames behind
+
+# pixels kept around each object when only the objects of a frame are saved
+# (see spritestore.py), so its edges and shadow come along
+SPRITE_MARGIN = 8
+
+# one frame on its way through the pipeline
+class FrameSlot(object):
+
+    def __init__(self, size):
+	self.frame = cv.CreateImage(size, 8, 3)
+	self.thresh = cv.CreateImage(size, 8, 1)
+	# set by the capture thread: capture number, grab time, and what the
+	# gap since the last grab says (see timing.FrameCadence)
+	self.index = 0
+	self.timestamp = 0.0
+	self.missed = 0
+	self.duplicate = False
+	# set by the detection thread: (x, y, area) (a list of them when tracking
+	# several objects), the live readout (velocity, acceleration, distance,
+	# top speed), None when not recording, and the (id, x, y) of every object
+	# matched while recording several
+	self.result = None
+	self.readout = None
+	self.objects = None
+
+class TrackingPipeline(object):
+
+    # detect(frame, hsv, thresh, displacement, params) returns (x, y, area), and is
+    # called on the detection thread with the params last passed to set_params()
+    # displacement is the movement expected since the last sample while recording
+    # (velocity * timestep from the tracker), None otherwise
+    # timer (a timing.StageTimer) times grabbing, copying, detecting and recording
+    # to track several objects, objects is a multitrack.MultiTracker and detect
+    # returns a list of blobs (see detection.find_blobs); tracker is then unused
+    def __init__(self, capture, detect, tracker, queue_size = 4, display_size = 2, max_wait = 0.05, clock = timing.monotonic, timer = NO_TIMER, objects = None):
+	self.capture = capture
+	self.detect = detect
+	self.tracker = tracker
+	self.objects = objects
+	self.timer = timer
+	self.max_wait = max_wait
+	self.clock = clock
+	self.detect_queue = Queue.Queue(queue_size)
+	self.display_queue = Queue.Queue(display_size)
+	# one slot for each queue place, and one held by each stage
+	self.num_slots = queue_size + display_size + 3
+	self.free = Queue.Queue()
+	self.allocated = 0
+	# detection's own scratch images (the display stage has its own)
+	self.scratch = bufferpool.BufferPool()
+	# guards params and pending_recording, which the display stage sets
+	self.lock = threading.Lock()
+	self.params = None
+	self.pending_recording = None
+	self.stopping = threading.Event()
+	self.finished = False
+	self.error = None
+	# recording state, only touched by the detection thread
+	self.recording = False
+	self.writer = None
+	self.frame_index = 0
+	self.last_time = 0.0
+	# every frame handled while recording (a timing.FrameLog), None before
+	self.frame_log = None
+	# frames the camera missed or repeated, judged by the capture thread
+	self.cadence = timing.FrameCadence()
+	# frame counts, for reporting
+	self.captured = 0
+	self.tracked = 0
+	self.dropped = 0
+	self.not_shown = 0
+	self.start_time = None
+	self.threads = []
+
+    def start(self):
+	self.start_time = self.clock()
+	for name, target in [("Capture", self.run_capture), ("Detection", self.run_detection)]:
+	    worker = threading.Thread(target=target, name="TrackingPipeline-" + name)
+	    worker.setDaemon(True)
+	    worker.start()
+	    self.threads.append(worker)
+
+    # detection settings for the frames captured from now on
+    def set_params(self, params):
+	self.lock.acquire()
+	self.params = params
+	self.lock.release()
+
+    # start recording with the next frame detected: it becomes the background
+    # (saved to folder, and as frame 0 if there is a writer of whole frames)
+    # and the start time
+    def start_recording(self, writer, folder):
+	self.lock.acquire()
+	self.pending_recording = (writer, folder)
+	self.lock.release()
+
+    # a free slot for a frame of the given size, or None if none came free in time
+    def take_slot(self, size):
+	try:
+	    return self.free.get_nowait()
+	except Queue.Empty:
+	    pass
+	if self.allocated < self.num_slots:
+	    self.allocated += 1
+	    return FrameSlot(size)
+	try:
+	    return self.free.get(True, self.max_wait)
+	except Queue.Empty:
+	    return None
+
+    # hand a slot back once a stage is done with it
+    def release(self, slot):
+	self.free.put(slot)
+
+    # capture thread: grab frames until stopped or the camera runs out
+    def run_capture(self):
+	index = 0
+	timer = self.timer
+	try:
+	    while not self.stopping.isSet():
+		started = timer.start()
+		frame = cv.QueryFrame(self.capture)
+		timestamp = self.clock()
+		if not frame:
+		    break
+		started = timer.lap("QueryFrame", started)
+		index += 1
+		self.captured += 1
+		missed, duplicate = self.cadence.observe(timestamp)
+		slot = self.take_slot(cv.GetSize(frame))
+		if slot is None:
+		    self.dropped += 1
+		    continue
+		cv.Copy(frame, slot.frame)
+		timer.stop("copy", started)
+		slot.index = index
+		slot.timestamp = timestamp
+		slot.missed = missed
+		slot.duplicate = duplicate
+		try:
+		    self.detect_queue.put(slot, True, self.max_wait)
+		except Queue.Full:
+		    self.dropped += 1
+		    self.release(slot)
+	finally:
+	    # detection always drains its queue, so this cannot block for long
+	    self.detect_queue.put(None)
+
+    # detection thread: track every frame captured, passing them on to be shown
+    def run_detection(self):
+	try:
+	    while True:
+		slot = self.detect_queue.get()
+		if slot is None:
+		    break
+		if self.error is not None:
+		    self.release(slot)
+		    continue
+		try:
+		    self.process(slot)
+		except Exception, e:
+		    # stop capturing, but keep draining the queue
+		    self.error = e
+		    self.stopping.set()
+		    self.release(slot)
+		    continue
+		try:
+		    self.display_queue.put_nowait(slot)
+		except Queue.Full:
+		    self.not_shown += 1
+		    self.release(slot)
+	finally:
+	    self.finish_display()
+
+    # tell the display stage there are no more frames, making room if needed
+    def finish_display(self):
+	while True:
+	    try:
+		self.display_queue.put_nowait(None)
+		return
+	    except Queue.Full:
+		try:
+		    slot = self.display_queue.get_nowait()
+		except Queue.Empty:
+		    continue
+		if slot is not None:
+		    self.not_shown += 1
+		    self.release(slot)
+
+    # expected movement since the last sample while recording (see Speed.next_step)
+    def expected_displacement(self):
+	if not self.recording or self.objects is not None:
+	    return None
+	return self.tracker.next_step()
+
+    def begin_recording(self, slot, writer, folder):
+	self.recording = True
+	self.writer = writer
+	self.last_time = slot.timestamp
+	self.tracker.start_time = slot.timestamp
+	if self.objects is not None:
+	    self.objects.start(slot.timestamp)
+	self.frame_log = timing.FrameLog()
+	cv.SaveImage(os.path.join(str(folder), "background.png"), slot.frame)
+	self.frame_index = 0
+	# sprites are pasted over background.png, so need no frame 0
+	if writer and not writer.sprites:
+	    writer.write(self.frame_index, slot.frame)
+
+    # find the object in one frame, and record it if recording
+    def process(self, slot):
+	self.lock.acquire()
+	params = self.params
+	pending = self.pending_recording
+	self.pending_recording = None
+	self.lock.release()
+	if pending is not None:
+	    self.begin_recording(slot, pending[0], pending[1])
+	self.scratch.fit(slot.frame)
+	hsv = self.scratch.frame_sized("hsv", 3)
+	timer = self.timer
+	started = timer.start()
+	slot.result = self.detect(slot.frame, hsv, slot.thresh, self.expected_displacement(), params)
+	started = timer.lap("detect", started)
+	self.tracked += 1
+	slot.readout = None
+	slot.objects = None
+	if not self.recording:
+	    return
+	# the first frame recorded is only the background; samples start with the next
+	sample = frame = 0
+	if pending is None:
+	    if self.objects is not None:
+		# samples are numbered once the track saved as Data.bin is known
+		# (see timing.FrameLog.assign_samples)
+		sample = -1
+		frame = self.record_objects(slot)
+	    else:
+		sample = frame = self.record_sample(slot)
+	self.frame_log.add(slot.index, slot.timestamp - self.tracker.start_time, self.clock() - slot.timestamp,
+			   sample, slot.missed, slot.duplicate, frame)
+	timer.stop("record", started)
+
+    # add the object's position in a recorded frame to the tracker (and the frame
+    # to the writer) if it was found
+    # returns the sample number it became, or -1 if it was not found
+    def record_sample(self, slot):
+	x, y, area = slot.result
+	tracker = self.tracker
+	sample = -1
+	if area > 0:
+	    tracker.add_pos(x, y, slot.timestamp - self.last_time)
+	    self.last_time = slot.timestamp
+	    sample = tracker.num_samples()
+	    if self.writer:
+		self.frame_index += 1
+		self.save_frame(self.frame_index, slot)
+	if tracker.num_samples():
+	    slot.readout = (tracker.current_v(), tracker.current_a(), tracker.total_distance, tracker.top_speed)
+	return sample
+
+    # hand the blobs found in a recorded frame to their tracks, recording the
+    # frame if there were any
+    # returns the frame number it was recorded as, or -1 if there were none
+    def record_objects(self, slot):
+	blobs = slot.result
+	frame = -1
+	if blobs:
+	    self.frame_index += 1
+	    frame = self.frame_index
+	    self.objects.update(blobs, slot.timestamp, frame)
+	    self.last_time = slot.timestamp
+	    if self.writer:
+		self.save_frame(frame, slot)
+	slot.objects = self.objects.positions()
+	primary = self.objects.primary()
+	if primary is not None:
+	    tracker = primary.speed
+	    slot.readout = (tracker.current_v(), tracker.current_a(), tracker.total_distance, tracker.top_speed)
+	return frame
+
+    # hand a recorded frame to the writer: all of it, or only the boxes around
+    # the objects found in it for writers of sprites
+    def save_frame(self, index, slot):
+	if self.writer.sprites:
+	    self.writer.write(index, slot.frame, self.object_boxes(slot))
+	else:
+	    self.writer.write(index, slot.frame)
+
+    # boxes (x, y, width, height) around the set pixels of a frame's mask, one
+    # around those near each blob when tracking several objects
+    def object_boxes(self, slot):
+	boxes = []
+	if self.objects is None:
+	    boxes.append(detection.mask_box(slot.thresh, SPRITE_MARGIN))
+	else:
+	    for x, y, area in slot.result:
+		# a few radii around the blob (whose area is in pixels), so
+		# objects far apart do not share one large box
+		reach = 2 * math.sqrt(area / math.pi) + SPRITE_MARGIN
+		window = (int(x - reach), int(y - reach), int(2 * reach) + 1, int(2 * reach) + 1)
+		boxes.append(detection.mask_box(slot.thresh, SPRITE_MARGIN, window))
+	return [box for box in boxes if box is not None]
+
+    # the next frame to show, or None if none was ready within timeout seconds
+    # call release() with it once shown; finished is set once frames run out
+    def next_frame(self, timeout):
+	if self.finished:
+	    return None
+	try:
+	    slot = self.display_queue.get(True, timeout)
+	except Queue.Empty:
+	    return None
+	if slot is None:
+	    self.finished = True
+	return slot
+
+    # stop capturing and wait for the frames already captured to be tracked
+    # the tracker may be read (and saved) once this returns
+    def stop(self):
+	self.stopping.set()
+	for worker in self.threads:
+	    worker.join()
+	self.threads = []
+
+    # frames tracked per second since start()
+    def fps(self):
+	if self.start_time is None:
+	    return 0.0
+	elapsed = self.clock() - self.start_time
+	if elapsed <= 0:
+	    return 0.0
+	return self.tracked / elapsed
+
+    # frame counts of the session, for saving with its timing report
+    def counts(self):
+	return {"captured": self.captured, "tracked": self.tracked, "dropped": self.dropped,
+		"not_shown": self.not_shown, "tracked_fps": self.fps(),
+		"camera_missed": self.cadence.missed, "camera_duplicates": self.cadence.duplicates,
+		"camera_fps": self.cadence.rate()}
+
+    # human-readable summary of the session
+    def report(self):
+	return "%d frames captured, %d tracked (%.1f fps), %d dropped, %d not shown, %d missed by the camera" % (self.captured, self.tracked, self.fps(), self.dropped, self.not_shown, self.cadence.missed)
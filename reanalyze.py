@@ -0,0 +1,130 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import csv
+import multiprocessing
+import numpy
+import optparse
+import os
+import time
+import trialdata
+
+###########################
+#   ARCHIVE RE-ANALYSIS   #
+###########################
+# recomputes the metrics of every trial in an archive on a pool of worker
+# processes and collects one summary row per trial into a single CSV table:
+#   python reanalyze.py [options] [Videos/ ...]
+# trials are independent and each one is read with a single memory map, so the
+# work spreads evenly across processes and scales with the number of cores
+TABLE_FILE = "summary.csv"
+TABLE_COLUMNS = ["trial", "num_samples", "duration", "total_distance", "top_speed",
+		 "x_min", "x_max", "y_min", "y_max", "conversion_factor",
+		 "total_distance_real", "top_speed_real", "achieved_rate", "sample_rate",
+		 "missed_frames", "dropped_frames", "duplicate_frames", "latency_mean", "latency_p99", "error"]
+
+# conversion factor a trial was tracked with, if it recorded one
+def recorded_conversion(folder):
+    if not os.path.exists(os.path.join(folder, trialdata.DATA_FILE)):
+	return None
+    header, offset = trialdata.read_header(folder)
+    return header.get("settings", {}).get("conversion_factor")
+
+# reload a trial and recompute its metrics from the raw samples
+# returns the recomputed Speed, which owns its buffer (the file is not mapped any more)
+def recompute_trial(folder):
+    speed = trialdata.open_trial(folder)
+    # memory-mapped trials are read-only, so work on a copy
+    n = speed.num_samples()
+    speed.use_buffer(numpy.array(speed.buffer()), n, speed.total_distance, speed.top_speed)
+    speed.recompute()
+    return speed
+
+# worker: the summary row of one trial, as a dict keyed by TABLE_COLUMNS
+# job is (folder, conversion factor or None to use the recorded one, whether
+# to write the recomputed metrics back to the trial's Data.bin)
+def analyze_trial(job):
+    folder, conversion_factor, save = job
+    row = {"trial": folder}
+    try:
+	if conversion_factor is None:
+	    conversion_factor = recorded_conversion(folder)
+	if conversion_factor is None:
+	    conversion_factor = 1.0
+	speed = recompute_trial(folder)
+	summary = trialdata.summarize(speed)
+	row["num_samples"] = summary["num_samples"]
+	row["duration"] = summary["duration"]
+	row["total_distance"] = summary["total_distance"]
+	row["top_speed"] = summary["top_speed"]
+	row["x_min"], row["x_max"] = summary["x_extent"]
+	row["y_min"], row["y_max"] = summary["y_extent"]
+	row["conversion_factor"] = conversion_factor
+	row["total_distance_real"] = summary["total_distance"] * conversion_factor
+	row["top_speed_real"] = summary["top_speed"] * conversion_factor
+	# how the recording kept up, for trials saved with a frame log
+	frame_log = trialdata.load_frame_log(folder, copy = save)
+	if frame_log is not None:
+	    frames = frame_log.summary()
+	    row["achieved_rate"] = frames["achieved_rate"]
+	    row["sample_rate"] = frames["sample_rate"]
+	    row["missed_frames"] = frames["missed"]
+	    row["dropped_frames"] = frames["dropped"]
+	    row["duplicate_frames"] = frames["duplicates"]
+	    row["latency_mean"] = frames["latency_mean"]
+	    row["latency_p99"] = frames["latency_p99"]
+	if save:
+	    settings = {}
+	    if os.path.exists(os.path.join(folder, trialdata.DATA_FILE)):
+		settings = trialdata.read_header(folder)[0].get("settings", {})
+	    settings["conversion_factor"] = conversion_factor
+	    trialdata.save_trial(speed, folder, settings, frame_log)
+    except Exception, e:
+	# one bad trial should not stop the whole archive
+	row["error"] = str(e)
+    return row
+
+# summary rows of every trial under paths, in trial order
+# jobs is the number of worker processes (every core if None, in this process if 1)
+def analyze_archive(paths, conversion_factor = None, save = False, jobs = None):
+    work = [(folder, conversion_factor, save) for folder in trialdata.find_trials(paths)]
+    if jobs == 1 or len(work) < 2:
+	rows = [analyze_trial(job) for job in work]
+    else:
+	pool = multiprocessing.Pool(jobs)
+	try:
+	    # small chunks keep every process busy when trial lengths differ
+	    rows = list(pool.imap_unordered(analyze_trial, work, 4))
+	finally:
+	    pool.close()
+	    pool.join()
+    rows.sort(key=lambda row: row["trial"])
+    return rows
+
+def write_table(rows, path):
+    f = open(path, 'wb')
+    try:
+	writer = csv.DictWriter(f, TABLE_COLUMNS)
+	writer.writerow(dict(zip(TABLE_COLUMNS, TABLE_COLUMNS)))
+	writer.writerows(rows)
+    finally:
+	f.close()
+
+def main():
+    parser = optparse.OptionParser(usage = "python reanalyze.py [options] [Videos/ ...]")
+    parser.add_option("--conversion", dest = "conversion_factor", type = "float", default = None, help = "meters per pixel for every trial (default: each trial's recorded factor, or 1)")
+    parser.add_option("--jobs", dest = "jobs", type = "int", default = None, help = "worker processes (default: one per core)")
+    parser.add_option("--table", dest = "table", default = None, help = "where to write the summary table (default: " + TABLE_FILE + " in the first folder)")
+    parser.add_option("--save", dest = "save", action = "store_true", default = False, help = "also write the recomputed metrics back to each trial")
+    options, paths = parser.parse_args()
+    paths = paths or ["Videos"]
+    table = options.table or os.path.join(paths[0], TABLE_FILE)
+    start = time.time()
+    rows = analyze_archive(paths, options.conversion_factor, options.save, options.jobs)
+    elapsed = time.time() - start
+    write_table(rows, table)
+    failed = len([row for row in rows if row.get("error")])
+    print "%d trials analyzed in %.1f s (%d failed), summary written to %s" % (len(rows), elapsed, failed, table)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,630 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import numpy
+from kinematics import min_max
+
+###########################
+#     REPLAY RENDERING    #
+###########################
+# everything is drawn into images of channels channels: 3 (BGR, as frames are
+# saved) or 4 (BGR and an unused byte, the layout of Qt's RGB32 images, so a
+# QImage can show them without copying; see replayview.py)
+
+# copy a saved frame into img, a replay image of the given channels
+def copy_frame(frame, img, channels):
+    if channels == 4:
+	cv.CvtColor(frame, img, cv.CV_BGR2BGRA)
+    else:
+	cv.Copy(frame, img)
+
+# persistent layer holding the path drawn so far in the "line", "v_path"
+# and "a_path" display modes
+# each frame only the newest segment is drawn into the layer, and the layer is
+# composited onto the frame through its mask, so the cost per frame does not
+# grow with the length of the trail; the whole trail is only redrawn when the
+# draw mode, marker width or object color change
+class TrailLayer(object):
+
+    def __init__(self, size, channels = 3):
+	self.image = cv.CreateImage(size, 8, channels)
+	self.mask = cv.CreateImage(size, 8, 1)
+	# (x_0, y_0, x_1, y_1, velocity color, acceleration color, own color or None)
+	self.segments = []
+	self.style = None
+	self.clear()
+
+    # forget the trail (when the video loops around)
+    def clear(self):
+	self.segments = []
+	cv.SetZero(self.image)
+	cv.SetZero(self.mask)
+
+    # color of a segment in a given draw mode
+    def segment_color(self, segment, draw_mode, object_color):
+	if draw_mode == "v_path":
+	    return segment[4]
+	elif draw_mode == "a_path":
+	    return segment[5]
+	elif segment[6] is not None:
+	    return segment[6]
+	return object_color
+
+    def draw_segment(self, segment, color, thickness):
+	start = (segment[0], segment[1])
+	end = (segment[2], segment[3])
+	cv.Line(self.image, start, end, color, thickness = thickness)
+	cv.Line(self.mask, start, end, cv.RealScalar(255), thickness = thickness)
+
+    # redraw every segment if the style changed since the last frame
+    def set_style(self, draw_mode, thickness, object_color):
+	style = (draw_mode, thickness, object_color)
+	if style == self.style:
+	    return
+	self.style = style
+	cv.SetZero(self.image)
+	cv.SetZero(self.mask)
+	for segment in self.segments:
+	    self.draw_segment(segment, self.segment_color(segment, draw_mode, object_color), thickness)
+
+    # add a segment (as StepValues.trail_segments gives them) in the current style
+    def add(self, segment):
+	self.segments.append(segment)
+	draw_mode, thickness, object_color = self.style
+	self.draw_segment(segment, self.segment_color(segment, draw_mode, object_color), thickness)
+
+    # add segments of steps that were skipped (not drawn themselves)
+    def extend(self, segments):
+	if self.style is None:
+	    self.segments.extend(segments)
+	    return
+	for segment in segments:
+	    self.add(segment)
+
+    # replace the trail with segments (after a jump), drawn at the next set_style
+    def set_segments(self, segments):
+	self.segments = segments
+	self.style = None
+
+    # composite the trail onto img
+    def draw_onto(self, img):
+	cv.Copy(self.image, img, self.mask)
+
+# max value should be max brightness, min value should be min brightness, etc.
+# val/val range = text_color/color_range
+# takes an array of values and gives the brightness of each, from min_level up
+# to min_level + interval
+def scale_levels(vals, min_, max_, min_level, interval):
+    val_offset = numpy.minimum(numpy.abs(vals - min_), max_)
+    # a field with a single value (or none) shows at full brightness
+    if max_ == min_:
+	val_ratio = numpy.ones(len(vals))
+    else:
+	val_ratio = numpy.clip(val_offset / float(abs(max_ - min_)), 0, 1)
+    scaled = min_level + (val_ratio * float(interval)).astype(int)
+    return numpy.minimum(scaled, 255)
+
+# every shade scale_levels can pick, made once
+RED_SHADES = [cv.CV_RGB(level, 0, 0) for level in range(256)]
+GREEN_SHADES = [cv.CV_RGB(0, level, 0) for level in range(256)]
+
+# display colors of an array of values: shades of red (from 120) where
+# negative is set, scaled to neg_range, and of green (from 50) elsewhere,
+# scaled to pos_range, each (min, max) as min_max gives them
+def scale_colors(vals, negative, neg_range, pos_range):
+    reds = scale_levels(vals, neg_range[0], neg_range[1], 120, 125)
+    greens = scale_levels(vals, pos_range[0], pos_range[1], 50, 205)
+    colors = []
+    for is_negative, red, green in zip(negative, reds, greens):
+	if is_negative:
+	    colors.append(RED_SHADES[red])
+	else:
+	    colors.append(GREEN_SHADES[green])
+    return colors
+
+# all parameters we want to track
+PARAMS = ["x_pos", "y_pos", "v_x", "v_y", "a_x", "a_y", "distance", "v_net", "a_net"]
+# values for which we want to scale display color with relative magnitude
+FIELDS = ["v_x", "v_y", "a_x", "a_y", "v_net", "a_net"]
+# lines of the velocity and acceleration panels: (panel, label, param, position)
+PANEL_LINES = [("speed", "Horizontal: ", "v_x", (10, 40)),
+	       ("speed", "Vertical: ", "v_y", (10, 80)),
+	       ("speed", "Net: ", "v_net", (10, 120)),
+	       ("accl", "Horizontal: ", "a_x", (10, 40)),
+	       ("accl", "Vertical: ", "a_y", (10, 80)),
+	       ("accl", "Net: ", "a_net", (10, 120))]
+PANEL_ROWS = [PARAMS.index(line[2]) for line in PANEL_LINES]
+
+# real-unit values, display colors and panel text of every step of one Speed
+# colors are red for negative values and green for positive ones, brighter the
+# closer a velocity or acceleration is to the trial's outliers (see min_max)
+# none of this changes while a trial is replayed, so it is all worked out once
+# here, a whole column at a time, and step() only looks it up
+class StepValues(object):
+
+    # conversion_factor turns pixels into real units
+    def __init__(self, data, conversion_factor = 1):
+	self.data = data
+	self.conversion_factor = conversion_factor
+	self.pos_color = cv.CV_RGB(0, 255, 0) # green
+	self.neg_color = cv.CV_RGB(255, 0, 0) # red
+	# for velocity and acceleration, there is min max for pos and neg
+	# returns (min, max)
+	self.neg_outliers = {}
+	self.pos_outliers = {}
+	for f in FIELDS:
+	    if f is not "v_net" and f is not "a_net":
+		self.neg_outliers[f] = min_max(data.metrics[f], f, which_vals = "neg")
+	    self.pos_outliers[f] = min_max(data.metrics[f], f, which_vals = "pos")
+	num_steps = data.num_samples() + 1
+	# one row per parameter, one column per step
+	self.values = numpy.empty((len(PARAMS), num_steps))
+	colors = []
+	for row, p in enumerate(PARAMS):
+	    raw_pixel_vals = numpy.asarray(data.metrics[p][:num_steps])
+	    vals = self.to_real_units(raw_pixel_vals)
+	    self.values[row] = vals
+	    if p == "x_pos" or p == "y_pos" or p == "distance":
+		colors.append([self.neg_color if val < 0 else self.pos_color for val in vals])
+	    else:
+		neg_range = self.neg_outliers.get(p, [0, 0])
+		colors.append(scale_colors(raw_pixel_vals, vals < 0, neg_range, self.pos_outliers[p]))
+	# per step, in PARAMS order
+	self.step_values = self.values.T.tolist()
+	self.step_colors = zip(*colors)
+	# per step, the number shown on each of the PANEL_LINES
+	lines = []
+	for row in PANEL_ROWS:
+	    lines.append([str(round(val, 1)) for val in self.values[row].tolist()])
+	self.step_text = zip(*lines)
+	# the distance and top speed shown after each step, as running totals,
+	# so any step can be shown without going through the ones before it
+	# distance counts from the second step on
+	distance = self.values[6].copy()
+	distance[:2] = 0
+	self.distance_so_far = numpy.cumsum(distance)
+	# top speed is the v_net furthest from zero after the first three steps
+	# (since these are less precise), the earliest one on ties
+	speeds = numpy.abs(self.values[7])
+	speeds[:4] = 0
+	fastest = numpy.maximum.accumulate(speeds)
+	record = numpy.zeros(num_steps, dtype=bool)
+	record[0] = speeds[0] > 0
+	record[1:] = speeds[1:] > fastest[:-1]
+	record_step = numpy.maximum.accumulate(numpy.where(record, numpy.arange(num_steps), 0))
+	self.top_speed_so_far = numpy.where(fastest > 0, self.values[7][record_step], 0.0)
+	self.step_overall = zip([str(round(val, 1)) for val in self.distance_so_far.tolist()],
+				[str(round(val, 1)) for val in self.top_speed_so_far.tolist()])
+
+    def to_real_units(self, pixels_per_second):
+	return pixels_per_second * self.conversion_factor
+
+    # (values, colors) of step img_index, each in PARAMS order
+    def step(self, img_index):
+	return self.step_values[img_index], self.step_colors[img_index]
+
+    # the PANEL_LINES numbers of step img_index
+    def text(self, img_index):
+	return self.step_text[img_index]
+
+    # (distance, top speed) text of the overall panel after step img_index
+    def overall(self, img_index):
+	return self.step_overall[img_index]
+
+    # the trail segment each step adds, from the step before to it, as
+    # (x_0, y_0, x_1, y_1, velocity color, acceleration color, color)
+    # None for the first step and for steps off a frame of size
+    # color, if given, replaces the object color in "line" mode (one per object
+    # when replaying several)
+    def trail_segments(self, size, color = None):
+	num_steps = self.data.num_samples() + 1
+	x = numpy.asarray(self.data.metrics["x_pos"][:num_steps])
+	y = numpy.asarray(self.data.metrics["y_pos"][:num_steps])
+	on_screen = (x < size[0]) & (y < size[1])
+	segments = [None] * num_steps
+	for k in (numpy.flatnonzero(on_screen[2:]) + 2).tolist():
+	    colors = self.step_colors[k]
+	    segments[k] = (int(x[k - 1]), int(y[k - 1]), int(x[k]), int(y[k]), colors[7], colors[8], color)
+	return segments
+
+WHITE = cv.CV_RGB(255, 255, 255)
+
+# pre-rendered pieces of text (single characters, or whole labels) in one
+# font, so changing text can be drawn by copying bitmaps instead of
+# rasterizing its strokes again
+# each piece is rendered once as a mask of the pixels it covers and once per
+# color it is drawn in (over white, so the anti-aliased edges blend as they
+# would on a panel)
+class GlyphCache(object):
+
+    # glyphs kept in all colors before the colored ones are dropped
+    MAX_TILES = 4096
+
+    def __init__(self, font, channels = 3):
+	self.font = font
+	self.channels = channels
+	(width, self.ascent), self.descent = cv.GetTextSize("0123456789-+.eE", font)
+	# room for the anti-aliased edges
+	self.pad = 2
+	self.height = self.ascent + self.descent + 2 * self.pad
+	# piece -> (mask, width, advance)
+	self.glyphs = {}
+	# (piece, color) -> glyph image
+	self.tiles = {}
+
+    # how far text moves the pen to the right
+    def advance(self, text):
+	# the width of a single string includes the stroke thickness once
+	return cv.GetTextSize(text + "0", self.font)[0][0] - cv.GetTextSize("0", self.font)[0][0]
+
+    def glyph(self, piece):
+	glyph = self.glyphs.get(piece)
+	if glyph is None:
+	    width = cv.GetTextSize(piece, self.font)[0][0] + 2 * self.pad
+	    mask = cv.CreateImage((width, self.height), 8, 1)
+	    cv.SetZero(mask)
+	    cv.PutText(mask, piece, (self.pad, self.pad + self.ascent), self.font, cv.RealScalar(255))
+	    glyph = (mask, width, self.advance(piece))
+	    self.glyphs[piece] = glyph
+	return glyph
+
+    def tile(self, piece, color):
+	key = (piece, tuple(color))
+	tile = self.tiles.get(key)
+	if tile is None:
+	    if len(self.tiles) >= self.MAX_TILES:
+		self.tiles = {}
+	    mask, width, advance = self.glyph(piece)
+	    tile = cv.CreateImage((width, self.height), 8, self.channels)
+	    cv.Set(tile, WHITE)
+	    cv.PutText(tile, piece, (self.pad, self.pad + self.ascent), self.font, color)
+	    self.tiles[key] = tile
+	return tile
+
+    # draw pieces of text one after the other, the baseline starting at
+    # origin, on a white part of img; pieces that would not fit inside img are
+    # left out
+    def draw(self, img, pieces, origin, color):
+	img_width, img_height = cv.GetSize(img)
+	x = origin[0] - self.pad
+	y = origin[1] - self.ascent - self.pad
+	if y < 0 or y + self.height > img_height:
+	    return
+	for piece in pieces:
+	    mask, width, advance = self.glyph(piece)
+	    if x < 0 or x + width > img_width:
+		break
+	    cv.SetImageROI(img, (x, y, width, self.height))
+	    cv.Copy(self.tile(piece, color), img, mask)
+	    x += advance
+	cv.ResetImageROI(img)
+
+# a line of text at a fixed place in an image, redrawn only when its text or
+# color change
+# prefix (such as a label) is drawn before the text, in the same color, as one
+# cached piece; the text is drawn a character at a time
+class TextField(object):
+
+    # the field covers width pixels from origin (the left end of its baseline)
+    def __init__(self, img, origin, width, glyphs, prefix = ""):
+	self.img = img
+	self.origin = origin
+	self.glyphs = glyphs
+	self.prefix = prefix
+	img_width, img_height = cv.GetSize(img)
+	top = max(0, origin[1] - glyphs.ascent - glyphs.pad)
+	bottom = min(img_height, origin[1] + glyphs.descent + glyphs.pad)
+	self.rect = (origin[0], top, min(width, img_width - origin[0]), bottom - top)
+	self.shown = ("", None)
+
+    def set(self, text, color):
+	if (text, color) == self.shown:
+	    return
+	self.erase()
+	pieces = list(text)
+	if self.prefix:
+	    pieces.insert(0, self.prefix)
+	self.glyphs.draw(self.img, pieces, self.origin, color)
+	self.shown = (text, color)
+
+    def erase(self):
+	if self.shown[1] is None:
+	    return
+	cv.SetImageROI(self.img, self.rect)
+	cv.Set(self.img, WHITE)
+	cv.ResetImageROI(self.img)
+	self.shown = ("", None)
+
+# the velocity, acceleration and overall text panels shown beside a replay,
+# with the distance and top speed so far
+# the panels are never cleared as a whole: each step only the lines that
+# changed are redrawn, from GlyphCache bitmaps, and the overall labels are
+# drawn once
+class ReplayPanels(object):
+
+    # title_font is for the line above the overall values (see title())
+    def __init__(self, font, title_font = None, channels = 3):
+	self.font = font
+	self.glyphs = GlyphCache(font, channels)
+	# white canvases for writing values
+	self.speed_img = cv.CreateImage((400, 140), 8, channels)
+	self.accl_img = cv.CreateImage((450, 140), 8, channels)
+	self.overall_img = cv.CreateImage((390, 140), 8, channels)
+	self.panel_images = {"speed": self.speed_img, "accl": self.accl_img}
+	for img in (self.speed_img, self.accl_img, self.overall_img):
+	    cv.Set(img, WHITE)
+	# one field per PANEL_LINES line, label included, as the label takes
+	# the color of the value
+	self.fields = []
+	for panel, label, p, position in PANEL_LINES:
+	    img = self.panel_images[panel]
+	    self.fields.append(TextField(img, position, cv.GetSize(img)[0] - position[0], self.glyphs, label))
+	self.dist_field = self.label_field(self.overall_img, "Distance: ", (10, 60))
+	self.top_speed_field = self.label_field(self.overall_img, "Top speed: ", (10, 120))
+	if title_font is None:
+	    title_font = font
+	self.title_field = TextField(self.overall_img, (10, 22), 380, GlyphCache(title_font, channels))
+
+    # draw label at position in img, and return a field for the value after it
+    def label_field(self, img, label, position):
+	cv.PutText(img, label, position, self.font, cv.Scalar(0, 255, 0))
+	x = position[0] + self.glyphs.advance(label)
+	return TextField(img, (x, position[1]), cv.GetSize(img)[0] - x, self.glyphs)
+
+    # leave only the labels
+    def clear(self):
+	for field in self.fields:
+	    field.erase()
+	self.dist_field.erase()
+	self.top_speed_field.erase()
+	self.title_field.erase()
+
+    # write step img_index of values (a StepValues)
+    def write(self, img_index, values):
+	data_for_step, colors_for_step = values.step(img_index)
+	# display all velocities/accelerations
+	for field, text, row in zip(self.fields, values.text(img_index), PANEL_ROWS):
+	    field.set(text, colors_for_step[row])
+	# add to overall window
+	dist_traveled, top_speed_so_far = values.overall(img_index)
+	self.dist_field.set(dist_traveled, cv.Scalar(0, 255, 0))
+	self.top_speed_field.set(top_speed_so_far, cv.Scalar(0, 255, 0))
+
+    # show text (such as which object the values are of) above the overall values
+    def title(self, text, color):
+	self.title_field.set(text, color)
+
+# the segments of trail_segments that are there, in order, and the step of each
+# (so the trail up to any step is a slice of them)
+def trail_order(segments):
+    steps = numpy.array([k for k, segment in enumerate(segments) if segment is not None], dtype=numpy.intp)
+    return [segments[k] for k in steps.tolist()], steps
+
+# draws each step of a replay: the frame with the object marked on it, and the
+# velocity, acceleration and overall text panels
+# (replayview.ReplayPlayer shows what this draws; benchmarks run it without
+# windows)
+class ReplayRenderer(object):
+
+    # data is the trial's Speed, background its first frame, and
+    # conversion_factor turns pixels into real units
+    # channels is that of the images drawn into (see copy_frame)
+    def __init__(self, data, background, conversion_factor = 1, channels = 3):
+	self.data = data
+	self.size = cv.GetSize(background)
+	self.channels = channels
+	self.values = StepValues(data, conversion_factor)
+	self.font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 1.0, 1.0, 0, 1, cv.CV_AA)
+	self.next_image = cv.CreateImage(self.size, 8, channels)
+	copy_frame(background, self.next_image, channels)
+	self.panels = ReplayPanels(self.font, channels = channels)
+	self.speed_img = self.panels.speed_img
+	self.accl_img = self.panels.accl_img
+	self.overall_img = self.panels.overall_img
+	# path drawn so far in the line display modes
+	self.trail = TrailLayer(self.size, channels)
+	# the segment each step adds to it
+	self.segments = self.values.trail_segments(self.size)
+	self.trail_segments, self.trail_steps = trail_order(self.segments)
+	self.restart()
+
+    # frames in the replay, the background included
+    def num_frames(self):
+	return self.data.num_frames()
+
+    # back to the start of the trial (when the video loops around)
+    def restart(self):
+	self.trail.clear()
+
+    # recorded time of each step, in seconds from the background
+    def step_times(self):
+	return numpy.cumsum(self.data.metrics["time"])
+
+    # get ready to render img_index right after a jump (from anywhere): the
+    # trail is set to the path up to the step before
+    # the panels need nothing, as they only depend on the step
+    def seek(self, img_index):
+	count = numpy.searchsorted(self.trail_steps, img_index)
+	self.trail.set_segments(self.trail_segments[:count])
+
+    # get ready to render img_index after last_index, skipping the steps
+    # between: the trail gets their segments
+    def skip(self, last_index, img_index):
+	start = numpy.searchsorted(self.trail_steps, last_index + 1)
+	stop = numpy.searchsorted(self.trail_steps, img_index)
+	self.trail.extend(self.trail_segments[start:stop])
+
+    # draw step img_index over frame (over the last step drawn if frame is None)
+    # returns whether the object is on screen, which is when display_video shows the step
+    def render(self, img_index, frame, draw_mode, marker_rad, object_color):
+	data = self.data
+	next_image = self.next_image
+	if frame is not None:
+	    # draw on a copy so cached frames stay clean
+	    copy_frame(frame, next_image, self.channels)
+
+	x_coord = data.metrics["x_pos"][img_index]
+	y_coord = data.metrics["y_pos"][img_index]
+	self.panels.write(img_index, self.values)
+	# if the object fits on the screen, display it as a green circle
+	if x_coord < self.size[0] and y_coord < self.size[1]:
+	    if draw_mode == "circle":
+		cv.Circle(next_image, (int(x_coord), int(y_coord)), marker_rad, object_color, thickness = -1)
+	    else:
+		# "line", "v_path" and "a_path" add the newest segment to the
+		# trail layer (colored by object, v_net or a_net respectively)
+		self.trail.set_style(draw_mode, marker_rad, object_color)
+		if img_index > 1:
+		    self.trail.add(self.segments[img_index])
+		self.trail.draw_onto(next_image)
+	    return True
+	return False
+
+# colors telling the objects of a multi-object replay apart, by track order
+TRACK_COLORS = [cv.CV_RGB(0, 255, 0), cv.CV_RGB(255, 0, 255), cv.CV_RGB(0, 255, 255), cv.CV_RGB(255, 128, 0),
+		cv.CV_RGB(255, 255, 0), cv.CV_RGB(0, 128, 255), cv.CV_RGB(255, 0, 0), cv.CV_RGB(128, 0, 255)]
+
+# replays every track of a multi-object trial (see multitrack.py) at once
+# each object is drawn in its own color and labeled with its id; "v_path" and
+# "a_path" still color each object's path by its own speed and acceleration
+# the text panels follow the object with the most samples
+class MultiReplayRenderer(object):
+
+    # tracks are (id, Speed, recorded frame of each sample), as trialdata.load_tracks gives them
+    # frame_times and start_time are what trialdata.frame_times and
+    # trialdata.recording_start give for the trial, if anything
+    def __init__(self, tracks, background, conversion_factor = 1, channels = 3, frame_times = None, start_time = None):
+	self.size = cv.GetSize(background)
+	self.channels = channels
+	self.font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 1.0, 1.0, 0, 1, cv.CV_AA)
+	self.label_font = cv.InitFont(cv.CV_FONT_HERSHEY_SIMPLEX, 0.5, 0.5, 0, 1, cv.CV_AA)
+	self.next_image = cv.CreateImage(self.size, 8, channels)
+	copy_frame(background, self.next_image, channels)
+	self.panels = ReplayPanels(self.font, self.label_font, channels)
+	self.speed_img = self.panels.speed_img
+	self.accl_img = self.panels.accl_img
+	self.overall_img = self.panels.overall_img
+	self.trail = TrailLayer(self.size, channels)
+	last_frame = 0
+	for track_id, data, frames in tracks:
+	    if len(frames):
+		last_frame = max(last_frame, int(frames[-1]))
+	self.frame_count = last_frame + 1
+	# (id, StepValues, sample shown at each frame (0 for none), color,
+	# segment each sample adds to the trail) per track
+	self.tracks = []
+	# every track's segments in the order playback draws them, by frame and
+	# then by track, with the frame each is drawn at
+	trail = []
+	self.focus = None
+	most_samples = -1
+	for n, (track_id, data, frames) in enumerate(tracks):
+	    frames = numpy.asarray(frames, dtype=numpy.intp)
+	    sample_at = numpy.zeros(self.frame_count, dtype=numpy.intp)
+	    sample_at[frames] = numpy.arange(1, len(frames) + 1)
+	    values = StepValues(data, conversion_factor)
+	    color = TRACK_COLORS[n % len(TRACK_COLORS)]
+	    # segments from each object's previous sample, in its own color
+	    # (the first object's follows object_color, as a single object's does)
+	    own_color = color
+	    if n == 0:
+		own_color = None
+	    segments = values.trail_segments(self.size, own_color)
+	    self.tracks.append((track_id, values, sample_at, color, segments))
+	    ordered, samples = trail_order(segments)
+	    trail.extend(zip(frames[samples - 1].tolist(), [n] * len(ordered), ordered))
+	    if data.num_samples() > most_samples:
+		most_samples = data.num_samples()
+		self.focus = n
+	trail.sort(key=lambda entry: entry[:2])
+	self.trail_segments = [entry[2] for entry in trail]
+	self.trail_frames = numpy.array([entry[0] for entry in trail], dtype=numpy.intp)
+	# recorded time of each frame, in seconds from the background: from
+	# the trial's frame log if given (see trialdata.frame_times), and
+	# otherwise from the tracks' samples, counted from start_time (the
+	# background's timestamp; the earliest track's start if not known),
+	# with the frames no object was matched in spaced evenly between
+	if frame_times is not None and len(frame_times) >= self.frame_count:
+	    self.frame_times = numpy.array(frame_times[:self.frame_count], dtype=numpy.float64)
+	else:
+	    self.frame_times = numpy.zeros(self.frame_count)
+	    known = numpy.zeros(self.frame_count, dtype=bool)
+	    known[0] = True
+	    if start_time is None and tracks:
+		start_time = min([data.start_time for track_id, data, frames in tracks])
+	    for track_id, data, frames in tracks:
+		frames = numpy.asarray(frames, dtype=numpy.intp)
+		sample_times = data.start_time - start_time + numpy.cumsum(data.metrics["time"])
+		self.frame_times[frames] = sample_times[1:len(frames) + 1]
+		known[frames] = True
+	    indices = numpy.arange(self.frame_count)
+	    self.frame_times = numpy.interp(indices, indices[known], self.frame_times[known])
+	self.restart()
+
+    # frames in the replay, the background included
+    def num_frames(self):
+	return self.frame_count
+
+    # back to the start of the trial (when the video loops around)
+    def restart(self):
+	self.trail.clear()
+
+    # recorded time of each frame, in seconds from the background
+    def step_times(self):
+	return self.frame_times
+
+    # get ready to render frame img_index right after a jump, as
+    # ReplayRenderer.seek does
+    def seek(self, img_index):
+	count = numpy.searchsorted(self.trail_frames, img_index)
+	self.trail.set_segments(self.trail_segments[:count])
+
+    # get ready to render frame img_index after last_index, skipping the
+    # frames between, as ReplayRenderer.skip does
+    def skip(self, last_index, img_index):
+	start = numpy.searchsorted(self.trail_frames, last_index + 1)
+	stop = numpy.searchsorted(self.trail_frames, img_index)
+	self.trail.extend(self.trail_segments[start:stop])
+
+    # draw frame img_index over frame (over the last one drawn if frame is None),
+    # in the same way as ReplayRenderer.render, with every object seen in it
+    # object_color is only used for the path of the first object in "line" mode
+    # returns whether any object is on screen
+    def render(self, img_index, frame, draw_mode, marker_rad, object_color):
+	next_image = self.next_image
+	if frame is not None:
+	    # draw on a copy so cached frames stay clean
+	    copy_frame(frame, next_image, self.channels)
+	if draw_mode != "circle":
+	    self.trail.set_style(draw_mode, marker_rad, object_color)
+	labels = []
+	focus_shown = False
+	for n, (track_id, values, sample_at, color, segments) in enumerate(self.tracks):
+	    sample = sample_at[img_index]
+	    if not sample:
+		continue
+	    if n == 0:
+		color = object_color
+	    metrics = values.data.metrics
+	    x_coord = metrics["x_pos"][sample]
+	    y_coord = metrics["y_pos"][sample]
+	    if n == self.focus:
+		self.panels.write(sample, values)
+		self.panels.title("Object " + str(track_id), color)
+		focus_shown = True
+	    if x_coord >= self.size[0] or y_coord >= self.size[1]:
+		continue
+	    if draw_mode == "circle":
+		cv.Circle(next_image, (int(x_coord), int(y_coord)), marker_rad, color, thickness = -1)
+	    elif sample > 1:
+		self.trail.add(segments[sample])
+	    labels.append((str(track_id), (int(x_coord) + marker_rad + 2, int(y_coord) - marker_rad - 2), color))
+	# the panels stay blank while the focus object is out of sight
+	if not focus_shown:
+	    self.panels.clear()
+	if draw_mode != "circle":
+	    self.trail.draw_onto(next_image)
+	for text, position, color in labels:
+	    cv.PutText(next_image, text, position, self.label_font, color)
+	return len(labels) > 0
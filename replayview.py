@@ -0,0 +1,210 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import math
+import numpy
+import timing
+# interface libraries
+from PySide.QtCore import *
+from PySide.QtGui import *
+
+###########################
+#      REPLAY DISPLAY     #
+###########################
+# replays run on the Qt event loop: a single-shot QTimer wakes up when the
+# next step is due (see timing.PlaybackScheduler), and the Replay, Velocity,
+# Acceleration and Overall windows are Qt widgets, so the controls stay
+# responsive while a video plays
+
+# a window showing an image the replay renderer draws into
+# the renderer draws 4-channel images (see replay.copy_frame), which have the
+# byte layout of a QImage in RGB32 format, so the QImage is made once, over
+# the image's own pixels: each step is shown by repainting, without copying
+# the image anywhere first
+class ImageView(QWidget):
+
+    # on_key, if given, is called with the Qt key code of every key pressed
+    def __init__(self, title, img, on_key = None):
+	super(ImageView, self).__init__()
+	self.setWindowTitle(title)
+	self.on_key = on_key
+	# keeps the image's pixels alive for as long as the QImage reads them
+	self.pixels = numpy.asarray(cv.GetMat(img))
+	height, width = self.pixels.shape[:2]
+	self.image = QImage(self.pixels.data, width, height, self.pixels.strides[0], QImage.Format_RGB32)
+	self.setFixedSize(width, height)
+	# the image covers the whole window, so there is no background to clear
+	self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    def paintEvent(self, event):
+	painter = QPainter(self)
+	painter.drawImage(0, 0, self.image)
+	painter.end()
+
+    def keyPressEvent(self, event):
+	if self.on_key:
+	    self.on_key(event.key())
+	else:
+	    super(ImageView, self).keyPressEvent(event)
+
+# plays a replay (a replay.ReplayRenderer or MultiReplayRenderer drawing
+# 4-channel images) in ImageView windows
+# frames is a frameloader.FrameSource for trials saved in full, or None when
+# only the positions were saved (markers are then drawn over the background)
+# style() gives the (draw mode, marker radius, object color) to draw each step in
+# steps are shown at their recorded times, sped up by speed; steps that are
+# overdue when the replay falls behind are skipped
+# moved is emitted with the step shown after every step or jump, and rates
+# about once a second while playing with (steps shown per second, steps per
+# second the recording calls for, steps skipped so far)
+class ReplayPlayer(QObject):
+
+    moved = Signal(int)
+    rates = Signal(float, float, int)
+    closed = Signal()
+
+    # seconds between rates reports
+    REPORT_INTERVAL = 1.0
+
+    def __init__(self, renderer, background, frames, style, speed = 1.0, clock = timing.monotonic):
+	super(ReplayPlayer, self).__init__()
+	self.renderer = renderer
+	self.background = background
+	self.frames = frames
+	self.style = style
+	self.num_frames = renderer.num_frames()
+	# ignore the first values for everything
+	# (since velocity/acceleration will not be accurate)
+	self.img_index = 1
+	self.last_frame = background
+	# hand-tuned, apologies
+	self.views = []
+	for title, img, position in (("Velocity", renderer.speed_img, (0, 590)),
+				     ("Acceleration", renderer.accl_img, (415, 590)),
+				     ("Replay", renderer.next_image, (610, 20)),
+				     ("Overall", renderer.overall_img, (880, 590))):
+	    view = ImageView(title, img, self.key)
+	    view.move(position[0], position[1])
+	    self.views.append(view)
+	self.clock = clock
+	self.scheduler = timing.PlaybackScheduler(renderer.step_times(), speed, clock = clock)
+	self.last_report = 0.0
+	self.timer = QTimer(self)
+	self.timer.setSingleShot(True)
+	self.timer.timeout.connect(self.advance)
+	self.active = False
+
+    def show(self):
+	for view in self.views:
+	    view.show()
+
+    # repaint every window (once Qt gets back to its event loop)
+    def display(self):
+	for view in self.views:
+	    view.update()
+
+    def play(self):
+	if self.active or self.num_frames < 2:
+	    return
+	self.active = True
+	self.scheduler.start(self.img_index)
+	self.schedule()
+
+    def pause(self):
+	self.active = False
+	self.timer.stop()
+
+    def playing(self):
+	return self.active
+
+    # change the speed multiplier (1 plays in real time)
+    def set_speed(self, speed):
+	self.scheduler.set_speed(speed, self.img_index)
+	if self.active:
+	    self.schedule()
+
+    # wake up when the step after the one shown is due
+    def schedule(self):
+	step, wait = self.scheduler.next(self.img_index, self.num_frames - 1)
+	# rounded up, so the timer does not fire just before the step is due
+	self.timer.start(int(math.ceil(wait * 1000)))
+
+    def render(self, frame):
+	draw_mode, marker_rad, object_color = self.style()
+	return self.renderer.render(self.img_index, frame, draw_mode, marker_rad, object_color)
+
+    # show the step that is due (skipping any that are overdue), looping
+    # around when the video is done, and wait for the next
+    def advance(self):
+	if not self.active:
+	    return
+	# loop around when video done
+	if self.img_index >= self.num_frames - 1:
+	    self.img_index = 0
+	    self.renderer.restart()
+	    self.scheduler.start(0)
+	step, wait = self.scheduler.next(self.img_index, self.num_frames - 1)
+	if wait > 0:
+	    self.timer.start(int(math.ceil(wait * 1000)))
+	    return
+	skipped = step - self.img_index - 1
+	self.renderer.skip(self.img_index, step)
+	self.img_index = step
+	next_frame = None
+	if self.frames:
+	    # frames dropped while recording repeat the previous one
+	    self.last_frame = self.frames.latest(step) or self.last_frame
+	    next_frame = self.last_frame
+	if self.render(next_frame):
+	    self.display()
+	self.scheduler.shown(step, skipped)
+	self.moved.emit(step)
+	now = self.clock()
+	if now - self.last_report >= self.REPORT_INTERVAL:
+	    self.last_report = now
+	    achieved, target = self.scheduler.rates()
+	    self.rates.emit(achieved, target, self.scheduler.skipped)
+	self.schedule()
+
+    # show step img_index straight away (see ReplayRenderer.seek), playing on
+    # from there if playing
+    def seek(self, img_index):
+	if self.num_frames < 2:
+	    return
+	self.img_index = min(max(img_index, 1), self.num_frames - 1)
+	self.renderer.seek(self.img_index)
+	# markers of the steps after this one are dropped
+	frame = self.background
+	if self.frames:
+	    self.last_frame = self.frames.latest(self.img_index) or self.background
+	    frame = self.last_frame
+	self.render(frame)
+	self.display()
+	self.moved.emit(self.img_index)
+	if self.active:
+	    self.scheduler.start(self.img_index)
+	    self.schedule()
+
+    # pause and move steps steps back or forward
+    def step(self, steps):
+	self.pause()
+	self.seek(self.img_index + steps)
+
+    # q or escape closes the replay; , and . step back and forward
+    def key(self, key):
+	if key == Qt.Key_Q or key == Qt.Key_Escape:
+	    self.close()
+	elif key == Qt.Key_Comma:
+	    self.step(-1)
+	elif key == Qt.Key_Period:
+	    self.step(1)
+
+    def close(self):
+	self.pause()
+	for view in self.views:
+	    view.close()
+	if self.frames:
+	    self.frames.close()
+	    self.frames = None
+	self.closed.emit()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import numpy
+import os
+from framewriter import FrameWriter
+
+###########################
+#    SPRITE-ONLY FRAMES   #
+###########################
+# frames of a trial stored as only the boxes around the objects in them
+# (sprites), to be pasted back over background.png: near full-video replay
+# for a small fraction of the disk space (and of the memory frames take
+# while queued to be saved)
+# the sprites are PNG images back to back in sprites.bin, with an index
+# (sprites.idx: int64 rows of frame number, byte offset, byte length, and
+# the box x, y, width and height); a frame saved with no objects in it has
+# a row of length 0, so it is told apart from one that was dropped
+SPRITE_FILE = "sprites.bin"
+SPRITE_INDEX_FILE = "sprites.idx"
+BACKGROUND_FILE = "background.png"
+INDEX_COLUMNS = 7
+
+# whether a trial folder stores its frames as sprites
+def has_sprites(folder):
+    return os.path.exists(os.path.join(str(folder), SPRITE_INDEX_FILE))
+
+# FrameWriter that keeps the boxes of each frame given to write(), and
+# encodes them on its encoder threads
+class SpriteWriter(FrameWriter):
+
+    sprites = True
+
+    def __init__(self, folder, **kwargs):
+	self.stream = open(os.path.join(str(folder), SPRITE_FILE), 'wb')
+	self.offset = 0
+	self.index = []
+	FrameWriter.__init__(self, folder, **kwargs)
+
+    # queue copies of the parts of img inside boxes (each an (x, y, width,
+    # height)) to be saved as frame index
+    # returns False if the frame had to be dropped
+    def write(self, index, img, boxes):
+	sprites = []
+	for box in boxes:
+	    sprites.append((box, cv.CloneMat(cv.GetSubRect(img, box))))
+	return self.enqueue(index, sprites)
+
+    def store(self, index, sprites):
+	encoded = []
+	for box, sprite in sprites:
+	    encoded.append((box, cv.EncodeImage(".png", sprite).tostring()))
+	self.lock.acquire()
+	try:
+	    if not encoded:
+		self.index.append((index, self.offset, 0, 0, 0, 0, 0))
+	    for box, data in encoded:
+		self.stream.write(data)
+		self.index.append((index, self.offset, len(data)) + tuple(box))
+		self.offset += len(data)
+	finally:
+	    self.lock.release()
+
+    # the index is written once all frames are in, so sprites with an index
+    # are always complete
+    def finish(self):
+	self.stream.close()
+	index = numpy.array(sorted(self.index), dtype=numpy.int64).reshape(-1, INDEX_COLUMNS)
+	index.tofile(os.path.join(self.folder, SPRITE_INDEX_FILE))
+
+# random access to the sprites of a trial
+class SpriteReader(object):
+
+    def __init__(self, folder):
+	self.folder = str(folder)
+	index = numpy.fromfile(os.path.join(self.folder, SPRITE_INDEX_FILE), dtype=numpy.int64).reshape(-1, INDEX_COLUMNS)
+	# rows are sorted by frame, so each frame's rows are one slice
+	self.rows = index
+	self.frames = index[:, 0]
+	self.background = cv.LoadImage(os.path.join(self.folder, BACKGROUND_FILE))
+	self.stream = open(os.path.join(self.folder, SPRITE_FILE), 'rb')
+
+    # number of frame slots (including dropped frames and the background)
+    def num_frames(self):
+	if not len(self.frames):
+	    return 1
+	return int(self.frames[-1]) + 1
+
+    # whether frame index was saved (the background, frame 0, always is)
+    def has_frame(self, index):
+	if index == 0:
+	    return True
+	position = numpy.searchsorted(self.frames, index)
+	return position < len(self.frames) and self.frames[position] == index
+
+    # decode the sprites of frame index, as a list of ((x, y, width, height),
+    # image), or return None if it was not saved
+    def read(self, index):
+	if index == 0:
+	    return []
+	start = numpy.searchsorted(self.frames, index)
+	stop = numpy.searchsorted(self.frames, index, "right")
+	if start == stop:
+	    return None
+	sprites = []
+	for frame, offset, length, x, y, width, height in self.rows[start:stop]:
+	    if length <= 0:
+		continue
+	    self.stream.seek(int(offset))
+	    data = self.stream.read(int(length))
+	    mat = cv.CreateMatHeader(1, int(length), cv.CV_8UC1)
+	    cv.SetData(mat, data, int(length))
+	    sprites.append(((int(x), int(y), int(width), int(height)), cv.DecodeImageM(mat, cv.CV_LOAD_IMAGE_COLOR)))
+	return sprites
+
+    # a new image of the background with sprites (a read() result) pasted over it
+    def compose(self, sprites):
+	img = cv.CloneImage(self.background)
+	for box, sprite in sprites:
+	    cv.Copy(sprite, cv.GetSubRect(img, box))
+	return img
+
+    def close(self):
+	self.stream.close()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python2.6
+
+# matching blobs to tracks, and multi-object trials saved to and loaded from disk
+# usage: python tests/test_multitrack.py
+import numpy
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import multitrack
+import trialdata
+
+# blobs (as detection.find_blobs gives them) of two objects crossing paths:
+# one moving right, one moving left, 4 pixels apart vertically
+def crossing_blobs(n):
+    return [(100.0 + 10 * n, 100.0, 50.0), (300.0 - 10 * n, 104.0, 50.0)]
+
+def track_crossing(frames = 21, dt = 0.04):
+    objects = multitrack.MultiTracker(gate = 20)
+    objects.start(0.0)
+    for n in range(frames):
+	# blobs come largest first, which says nothing about which is which
+	blobs = crossing_blobs(n)
+	if n % 2:
+	    blobs.reverse()
+	objects.update(blobs, (n + 1) * dt, n + 1)
+    objects.finish()
+    return objects
+
+class MultiTrackerTest(unittest.TestCase):
+
+    def test_crossing_tracks_keep_their_objects(self):
+	objects = track_crossing()
+	self.assertEqual(len(objects.tracks), 2)
+	right, left = objects.tracks
+	self.assertTrue(numpy.all(numpy.diff(right.speed.x[1:]) > 0))
+	self.assertTrue(numpy.all(numpy.diff(left.speed.x[1:]) < 0))
+	self.assertTrue(numpy.all(right.speed.y[1:] == 100.0))
+	self.assertTrue(numpy.all(left.speed.y[1:] == 104.0))
+	self.assertEqual(right.frames, range(1, 22))
+	# 10 pixels every 0.04 s, once two positions are known
+	self.assertTrue(numpy.allclose(right.speed.metrics["v_x"][2:], 250.0))
+	self.assertTrue(numpy.allclose(left.speed.metrics["v_x"][2:], -250.0))
+
+    def test_associate_closest_within_gate(self):
+	objects = multitrack.MultiTracker(gate = 20)
+	objects.start(0.0)
+	objects.update([(100.0, 100.0, 50.0), (200.0, 100.0, 50.0)], 0.04, 1)
+	# the first blob is closer to the first track than to the second, the
+	# second is out of reach of both
+	pairs = objects.associate([(190.0, 110.0, 50.0), (105.0, 100.0, 50.0), (150.0, 150.0, 50.0)], 0.08)
+	self.assertEqual(sorted(pairs), [(0, 1), (1, 0)])
+
+    def test_new_and_ended_tracks(self):
+	objects = multitrack.MultiTracker(gate = 20, max_missed = 2)
+	objects.start(0.0)
+	objects.update([(100.0, 100.0, 50.0)], 0.04, 1)
+	# too far to be the same object
+	objects.update([(400.0, 100.0, 50.0)], 0.08, 2)
+	self.assertEqual([track.id for track in objects.tracks], [1, 2])
+	for n in range(3, 6):
+	    objects.update([(400.0, 100.0, 50.0)], n * 0.04, n)
+	self.assertTrue(objects.tracks[0].ended)
+	self.assertEqual([track.id for track in objects.active], [2])
+	self.assertEqual(objects.primary().id, 2)
+	self.assertEqual(objects.positions(), [(2, 400.0, 100.0)])
+
+class SavedTracksTest(unittest.TestCase):
+
+    def setUp(self):
+	self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+	shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+	objects = track_crossing()
+	trialdata.save_tracks(objects.tracks, self.folder, {"multi_object": True})
+	self.assertEqual(trialdata.track_ids(self.folder), [1, 2])
+	tracks = trialdata.load_tracks(self.folder)
+	for track, (track_id, speed, frames) in zip(objects.tracks, tracks):
+	    self.assertEqual(track_id, track.id)
+	    self.assertEqual(frames.tolist(), track.frames)
+	    self.assertTrue(numpy.array_equal(speed.x, track.speed.x))
+	    self.assertTrue(numpy.array_equal(speed.metrics["v_net"], track.speed.metrics["v_net"]))
+	    self.assertEqual(speed.start_time, track.speed.start_time)
+	# older trials did not save when the recording started
+	self.assertEqual(trialdata.recording_start(self.folder), None)
+
+    def test_recording_start(self):
+	objects = track_crossing()
+	trialdata.save_tracks(objects.tracks, self.folder, None, objects.start_time)
+	self.assertEqual(trialdata.recording_start(self.folder), 0.0)
+
+    # the primary track saved as Data.bin has fewer samples than frames, so
+    # frame times come from the frame log, not its timesteps
+    def test_frame_times_of_a_track(self):
+	objects = track_crossing()
+	primary = objects.primary()
+	frames = numpy.arange(22, dtype=numpy.float64)
+	log = trialdata.FrameTable(["timestamp", "frame"], {"timestamp": frames * 0.04, "frame": frames}, {})
+	trialdata.save_trial(primary.speed, self.folder, {"primary_track": primary.id}, log)
+	self.assertTrue(numpy.allclose(trialdata.frame_times(self.folder), frames * 0.04))
+	trialdata.save_trial(primary.speed, self.folder, {"primary_track": primary.id})
+	self.assertEqual(trialdata.frame_times(self.folder), None)
+
+if __name__ == '__main__':
+    unittest.main()
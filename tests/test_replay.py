@@ -0,0 +1,39 @@
+#!/usr/bin/env python2.6
+
+# values the replay shows, against the totals Speed keeps
+# usage: python tests/test_replay.py
+import numpy
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import replay
+from kinematics import Speed
+
+# a path that starts fast (from where the camera first saw the object) and
+# then slows down
+def fast_start(streaming = False):
+    speed = Speed(streaming)
+    for x in [0.0, 50.0, 100.0, 101.0, 102.0, 103.0, 103.5, 104.0]:
+	speed.add_pos(x, 0.0, 0.04)
+    speed.update()
+    return speed
+
+class OverallPanelTest(unittest.TestCase):
+
+    def test_top_speed_matches_replay(self):
+	for streaming in (False, True):
+	    speed = fast_start(streaming)
+	    values = replay.StepValues(speed)
+	    self.assertAlmostEqual(speed.top_speed, values.top_speed_so_far[-1])
+	    self.assertAlmostEqual(speed.top_speed, 25.0)
+
+    def test_total_distance_matches_replay(self):
+	for streaming in (False, True):
+	    speed = fast_start(streaming)
+	    values = replay.StepValues(speed)
+	    self.assertAlmostEqual(speed.total_distance, values.distance_so_far[-1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python2.6
+
+# frame logs and playback scheduling
+# usage: python tests/test_timing.py
+import numpy
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import timing
+
+class FrameLogTest(unittest.TestCase):
+
+    # a multi-object recording: frames 1 to 5 were recorded, and the track
+    # saved as Data.bin was matched in frames 2, 3 and 5
+    def test_assign_samples(self):
+	log = timing.FrameLog()
+	log.add(1, 0.0, 0.01, 0, 0, False, 0)
+	for n in range(1, 6):
+	    log.add(n + 1, n * 0.04, 0.01, -1, 0, False, n)
+	# a frame nothing was found in
+	log.add(7, 0.24, 0.01, -1, 0, False, -1)
+	log.assign_samples([2, 3, 5])
+	columns = log.columns()
+	self.assertEqual(columns["sample"].tolist(), [0, -1, 1, 2, -1, 3, -1])
+	self.assertEqual(columns["frame"].tolist(), [0, 1, 2, 3, 4, 5, -1])
+	self.assertEqual(log.summary()["samples"], 3)
+
+# a clock that only moves when told to
+class FakeClock(object):
+
+    def __init__(self):
+	self.now = 100.0
+
+    def __call__(self):
+	return self.now
+
+class PlaybackSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+	self.clock = FakeClock()
+	# steps 0.1 s apart, with a 0.5 s gap before step 6
+	self.times = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 1.0, 1.1]
+	self.scheduler = timing.PlaybackScheduler(self.times, clock = self.clock)
+	self.scheduler.start(0)
+
+    def test_waits_for_the_next_step(self):
+	index, wait = self.scheduler.next(0, 7)
+	self.assertEqual(index, 1)
+	self.assertAlmostEqual(wait, 0.1)
+	self.clock.now += 0.05
+	index, wait = self.scheduler.next(0, 7)
+	self.assertEqual(index, 1)
+	self.assertAlmostEqual(wait, 0.05)
+	# the recording's own gaps are kept
+	self.assertAlmostEqual(self.scheduler.due(6) - self.scheduler.due(5), 0.5)
+
+    def test_skips_to_the_latest_due_step_when_behind(self):
+	self.clock.now += 0.35
+	self.assertEqual(self.scheduler.next(0, 7), (3, 0.0))
+	# never past the last step
+	self.clock.now += 10.0
+	self.assertEqual(self.scheduler.next(3, 7), (7, 0.0))
+	self.assertEqual(self.scheduler.next(3, 5), (5, 0.0))
+
+    def test_set_speed_starts_from_the_step_shown(self):
+	self.clock.now += 0.2
+	self.scheduler.set_speed(2.0, 2)
+	index, wait = self.scheduler.next(2, 7)
+	self.assertEqual(index, 3)
+	self.assertAlmostEqual(wait, 0.05)
+	self.assertAlmostEqual(self.scheduler.due(6) - self.clock.now, 0.4)
+
+    def test_rates(self):
+	self.assertEqual(self.scheduler.rates(), (0.0, 0.0))
+	# at half speed, every other step is shown, at 10 per second
+	self.scheduler.set_speed(0.5, 0)
+	for index in (2, 4):
+	    self.clock.now += 0.1
+	    self.scheduler.shown(index, 1)
+	shown, target = self.scheduler.rates()
+	self.assertAlmostEqual(shown, 10.0)
+	self.assertAlmostEqual(target, 5.0)
+	self.assertEqual(self.scheduler.skipped, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python2.6
+
+# Speed's streaming and batch modes, and trials saved to and loaded from disk
+# usage: python tests/test_trialdata.py
+import numpy
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import trialdata
+from kinematics import METRIC_NAMES, Speed
+
+# a wandering path of n samples with uneven timesteps
+def random_path(n, seed = 0):
+    rng = numpy.random.RandomState(seed)
+    x = numpy.cumsum(rng.normal(0, 5, n)) + 320
+    y = numpy.cumsum(rng.normal(0, 5, n)) + 240
+    t = rng.uniform(0.02, 0.05, n)
+    return x, y, t
+
+def make_speed(x, y, t, streaming = False):
+    speed = Speed(streaming)
+    speed.start_time = 12.5
+    speed.stop_time = 12.5 + t.sum()
+    for n in range(len(t)):
+	speed.add_pos(x[n], y[n], t[n])
+    speed.update()
+    return speed
+
+# the (old-style) Speed class of versions that pickled it, with list attributes
+OldSpeed = types.ClassType("Speed", (), {"__module__": "__main__"})
+
+class SpeedModesTest(unittest.TestCase):
+
+    def test_streaming_matches_batch(self):
+	x, y, t = random_path(200)
+	batch = make_speed(x, y, t)
+	streaming = make_speed(x, y, t, streaming = True)
+	for p in METRIC_NAMES:
+	    self.assertTrue(numpy.allclose(batch.metrics[p], streaming.metrics[p]), p)
+	self.assertAlmostEqual(batch.total_distance, streaming.total_distance)
+	self.assertAlmostEqual(batch.top_speed, streaming.top_speed)
+
+    def test_growing_past_initial_capacity(self):
+	x, y, t = random_path(3000)
+	speed = make_speed(x, y, t)
+	self.assertEqual(speed.num_samples(), 3000)
+	self.assertTrue(numpy.array_equal(speed.x[1:], x))
+	self.assertTrue(numpy.array_equal(speed.t, t))
+
+class TrialFileTest(unittest.TestCase):
+
+    def setUp(self):
+	self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+	shutil.rmtree(self.folder)
+
+    def assertSameSpeed(self, expected, actual):
+	self.assertEqual(expected.num_samples(), actual.num_samples())
+	for p in METRIC_NAMES:
+	    self.assertTrue(numpy.allclose(expected.metrics[p], actual.metrics[p]), p)
+	self.assertAlmostEqual(expected.total_distance, actual.total_distance)
+	self.assertAlmostEqual(expected.top_speed, actual.top_speed)
+
+    def test_round_trip(self):
+	x, y, t = random_path(100)
+	speed = make_speed(x, y, t)
+	trialdata.save_trial(speed, self.folder, {"low_color": 2})
+	loaded = trialdata.load_trial(self.folder)
+	self.assertSameSpeed(speed, loaded)
+	self.assertEqual(loaded.start_time, speed.start_time)
+	self.assertEqual(loaded.stop_time, speed.stop_time)
+	header, offset = trialdata.read_header(self.folder)
+	self.assertEqual(offset % trialdata.ALIGNMENT, 0)
+	self.assertEqual(header["settings"], {"low_color": 2})
+	self.assertEqual(header["summary"]["num_samples"], 100)
+	# nothing was saved with it
+	self.assertEqual(trialdata.load_frame_log(self.folder), None)
+
+    def test_empty_trial(self):
+	speed = Speed()
+	speed.update()
+	trialdata.save_trial(speed, self.folder)
+	loaded = trialdata.load_trial(self.folder)
+	self.assertEqual(loaded.num_samples(), 0)
+	self.assertEqual(loaded.num_frames(), 1)
+
+    def test_frame_log_section(self):
+	x, y, t = random_path(20)
+	speed = make_speed(x, y, t)
+	names = ["index", "timestamp"]
+	columns = {"index": numpy.arange(25, dtype=numpy.float64),
+		   "timestamp": numpy.linspace(0.0, 1.0, 25)}
+	log = trialdata.FrameTable(names, columns, {"frames": 25})
+	trialdata.save_trial(speed, self.folder, None, log)
+	loaded = trialdata.load_frame_log(self.folder, copy = True)
+	self.assertEqual(loaded.column_names, names)
+	self.assertEqual(len(loaded), 25)
+	self.assertEqual(loaded.summary(), {"frames": 25})
+	for name in names:
+	    self.assertTrue(numpy.array_equal(loaded.columns()[name], columns[name]), name)
+	# the samples before it are unaffected
+	self.assertSameSpeed(speed, trialdata.load_trial(self.folder))
+
+    def test_load_pickled_lists(self):
+	x, y, t = random_path(50)
+	old = OldSpeed()
+	old.start_time = 3.0
+	old.stop_time = 4.0
+	old.out_folder = "Videos/Trial_3.0"
+	old.x = [0.0] + x.tolist()
+	old.y = [0.0] + y.tolist()
+	old.t = t.tolist()
+	# recomputed on load, so its contents do not matter
+	old.metrics = {"v_x": [0.0]}
+	path = os.path.join(self.folder, trialdata.PICKLE_FILE)
+	f = open(path, 'wb')
+	pickle.dump(old, f)
+	f.close()
+	loaded = trialdata.open_trial(self.folder)
+	self.assertSameSpeed(make_speed(x, y, t), loaded)
+	self.assertEqual(loaded.out_folder, "Videos/Trial_3.0")
+	# and converted to Data.bin once
+	self.assertTrue(trialdata.convert_trial(self.folder))
+	self.assertFalse(trialdata.convert_trial(self.folder))
+	self.assertSameSpeed(loaded, trialdata.load_trial(self.folder))
+
+if __name__ == '__main__':
+    unittest.main()
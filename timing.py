@@ -0,0 +1,500 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import bisect
+import ctypes
+import ctypes.util
+import cv
+import json
+import numpy
+import os
+import sys
+import threading
+import time
+
+###########################
+#     MONOTONIC CLOCK     #
+###########################
+# time.time() jumps whenever the system clock is set, and time.clock() is CPU
+# time on Linux, so neither can time frames; Python 2 has no time.monotonic(),
+# so clock_gettime(CLOCK_MONOTONIC) is called through ctypes, falling back to
+# time.time() where the C library does not have it
+if sys.platform == "darwin":
+    CLOCK_MONOTONIC = 6
+else:
+    CLOCK_MONOTONIC = 1
+
+class timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+# clock_gettime from librt or libc, or None if neither has a working one
+def find_clock_gettime():
+    for name in [ctypes.util.find_library("rt"), ctypes.util.find_library("c")]:
+	if not name:
+	    continue
+	try:
+	    clock_gettime = ctypes.CDLL(name).clock_gettime
+	except (OSError, AttributeError):
+	    continue
+	clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+	if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec())) == 0:
+	    return clock_gettime
+    return None
+
+clock_gettime = find_clock_gettime()
+# whether monotonic() really is monotonic
+HAVE_MONOTONIC = clock_gettime is not None
+
+# seconds since an arbitrary point, never going backwards
+# (only differences between two calls mean anything)
+if HAVE_MONOTONIC:
+    def monotonic():
+	now = timespec()
+	clock_gettime(CLOCK_MONOTONIC, ctypes.byref(now))
+	return now.tv_sec + now.tv_nsec * 1e-9
+else:
+    monotonic = time.time
+
+###########################
+#    STAGE INSTRUMENTS    #
+###########################
+# per-stage timing of the capture loops (capture, CvtColor, InRangeS, Moments,
+# Resize, ShowImage, WaitKey, ...), to find out which one a slow loop is waiting on
+# a stage is timed by bracketing it:
+#   started = timer.start()
+#   cv.CvtColor(...)
+#   started = timer.lap("CvtColor", started)
+#   cv.InRangeS(...)
+#   timer.stop("InRangeS", started)
+# a disabled timer hands out None from start(), and lap() and stop() return as
+# soon as they see it, so instrumented code costs a few calls per stage when off
+# each stage keeps its latest durations (for rolling percentiles and the live
+# overlay) and a histogram of every duration since the last reset (for the report)
+# one timer may be shared by the pipeline threads and the display loop: every
+# stage is created, added to and read under the timer's lock
+TIMING_FILE = "Timing.json"
+# upper bounds of the histogram bins, in milliseconds (the last bin is open)
+BIN_EDGES_MS = [0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+BIN_EDGES = [edge / 1000.0 for edge in BIN_EDGES_MS]
+
+# durations of one stage (not thread-safe by itself, see StageTimer)
+class StageStats(object):
+
+    def __init__(self, window):
+	# ring of the latest durations, in seconds
+	self.recent = [0.0] * window
+	self.next = 0
+	self.count = 0
+	self.total = 0.0
+	self.worst = 0.0
+	self.histogram = [0] * (len(BIN_EDGES) + 1)
+
+    def add(self, seconds):
+	self.recent[self.next] = seconds
+	self.next += 1
+	if self.next == len(self.recent):
+	    self.next = 0
+	self.count += 1
+	self.total += seconds
+	if seconds > self.worst:
+	    self.worst = seconds
+	self.histogram[bisect.bisect_left(BIN_EDGES, seconds)] += 1
+
+    # latest durations, oldest first
+    def latest(self):
+	if self.count < len(self.recent):
+	    return self.recent[:self.count]
+	return self.recent[self.next:] + self.recent[:self.next]
+
+    # q-th percentile (0 to 100) of the latest durations, in seconds
+    def percentile(self, q):
+	values = sorted(self.latest())
+	if not values:
+	    return 0.0
+	index = min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))
+	return values[index]
+
+    # mean of the latest durations, in seconds
+    def recent_mean(self):
+	values = self.latest()
+	if not values:
+	    return 0.0
+	return sum(values) / len(values)
+
+    # machine-readable summary, durations in milliseconds
+    def summary(self):
+	mean = 0.0
+	if self.count:
+	    mean = self.total / self.count
+	return {"count": self.count,
+		"total_ms": self.total * 1000.0,
+		"mean_ms": mean * 1000.0,
+		"max_ms": self.worst * 1000.0,
+		"recent_p50_ms": self.percentile(50) * 1000.0,
+		"recent_p90_ms": self.percentile(90) * 1000.0,
+		"recent_p99_ms": self.percentile(99) * 1000.0,
+		"histogram": self.histogram[:]}
+
+class StageTimer(object):
+
+    # window is how many of the latest durations each stage keeps
+    def __init__(self, enabled = True, window = 120, clock = monotonic):
+	self.enabled = enabled
+	self.window = window
+	self.clock = clock
+	# guards the stages, which the pipeline threads and the display loop
+	# record into and read at the same time
+	self.lock = threading.Lock()
+	self.reset()
+
+    # forget every duration (at the start of a trial)
+    def reset(self):
+	self.lock.acquire()
+	try:
+	    self.stages = {}
+	    # stage names in the order they were first seen, for display
+	    self.order = []
+	    self.started = self.clock()
+	    self.last_tick = None
+	finally:
+	    self.lock.release()
+
+    # the current time if enabled, None otherwise
+    def start(self):
+	if self.enabled:
+	    return self.clock()
+	return None
+
+    # record the time since started under stage, and return the current time
+    # (the start of the next stage)
+    def lap(self, stage, started):
+	if started is None:
+	    return None
+	now = self.clock()
+	self.record(stage, now - started)
+	return now
+
+    # record the time since started under stage
+    def stop(self, stage, started):
+	if started is not None:
+	    self.record(stage, self.clock() - started)
+
+    # mark the end of one pass of a loop; the time since the last mark is
+    # recorded as the "frame" stage, which fps() goes by
+    def tick(self):
+	if not self.enabled:
+	    return
+	now = self.clock()
+	if self.last_tick is not None:
+	    self.record("frame", now - self.last_tick)
+	self.last_tick = now
+
+    def record(self, stage, seconds):
+	self.lock.acquire()
+	try:
+	    stats = self.stages.get(stage)
+	    if stats is None:
+		stats = StageStats(self.window)
+		self.stages[stage] = stats
+		self.order.append(stage)
+	    stats.add(seconds)
+	finally:
+	    self.lock.release()
+
+    # loop passes per second over the latest "frame" durations (see tick)
+    def fps(self):
+	self.lock.acquire()
+	try:
+	    return self.frame_rate()
+	finally:
+	    self.lock.release()
+
+    # fps(), with the lock held
+    def frame_rate(self):
+	stats = self.stages.get("frame")
+	if stats is None:
+	    return 0.0
+	mean = stats.recent_mean()
+	if mean <= 0:
+	    return 0.0
+	return 1.0 / mean
+
+    # one line per stage for the live overlay: rolling p50 / p99 in milliseconds
+    def overlay_lines(self):
+	self.lock.acquire()
+	try:
+	    lines = ["%.1f fps" % self.frame_rate()]
+	    for stage in self.order:
+		if stage == "frame":
+		    continue
+		stats = self.stages[stage]
+		lines.append("%s %.1f / %.1f ms" % (stage, stats.percentile(50) * 1000.0, stats.percentile(99) * 1000.0))
+	    return lines
+	finally:
+	    self.lock.release()
+
+    # machine-readable report of every stage since the last reset
+    # extra holds anything else worth keeping with it (frame counts, say)
+    def report(self, extra = None):
+	self.lock.acquire()
+	try:
+	    stages = {}
+	    for stage in self.order:
+		stages[stage] = self.stages[stage].summary()
+	    report = {"duration": self.clock() - self.started,
+		      "fps": self.frame_rate(),
+		      "order": self.order[:],
+		      "bin_edges_ms": BIN_EDGES_MS,
+		      "stages": stages}
+	finally:
+	    self.lock.release()
+	if extra:
+	    report.update(extra)
+	return report
+
+    # write the report to TIMING_FILE in folder (beside the trial's Data.bin)
+    def save(self, folder, extra = None):
+	f = open(os.path.join(str(folder), TIMING_FILE), 'w')
+	try:
+	    json.dump(self.report(extra), f, indent = 1, sort_keys = True)
+	finally:
+	    f.close()
+
+# the timer instrumented code uses when none is given: always disabled
+NO_TIMER = StageTimer(enabled = False)
+
+# draw the timer's overlay lines onto the bottom left of img
+# header lines (if any) come first
+def draw_overlay(img, timer, font, header = None):
+    lines = (header or []) + timer.overlay_lines()
+    color = cv.CV_RGB(255, 255, 0)
+    height = cv.GetSize(img)[1]
+    top = height - 8 - 14 * (len(lines) - 1)
+    for n, text in enumerate(lines):
+	cv.PutText(img, text, (10, top + 14 * n), font, color)
+
+# report saved with a trial, or None if it has none
+def load_report(folder):
+    path = os.path.join(str(folder), TIMING_FILE)
+    if not os.path.exists(path):
+	return None
+    f = open(path, 'r')
+    try:
+	return json.load(f)
+    finally:
+	f.close()
+
+###########################
+#    FRAME ACCOUNTING     #
+###########################
+# infers frames the camera never delivered, or delivered twice, from the gaps
+# between grab timestamps
+# the camera's frame interval is taken as the median of the latest gaps; a gap of
+# about k intervals means k - 1 frames were missed, and a gap well under one
+# interval means the driver handed back a frame it had already delivered
+class FrameCadence(object):
+
+    def __init__(self, window = 31, late_factor = 1.5, early_factor = 0.25, min_gaps = 5):
+	self.window = window
+	self.late_factor = late_factor
+	self.early_factor = early_factor
+	# gaps needed before judging any
+	self.min_gaps = min_gaps
+	self.gaps = []
+	self.next = 0
+	self.first = None
+	self.last = None
+	self.frames = 0
+	self.missed = 0
+	self.duplicates = 0
+
+    # median of the latest gaps, or None before there are enough of them
+    def interval(self):
+	if len(self.gaps) < self.min_gaps:
+	    return None
+	gaps = sorted(self.gaps)
+	return gaps[len(gaps) / 2]
+
+    # note a frame grabbed at timestamp
+    # returns (frames missed just before it, whether it repeats the last frame)
+    def observe(self, timestamp):
+	self.frames += 1
+	if self.last is None:
+	    self.first = self.last = timestamp
+	    return 0, False
+	gap = timestamp - self.last
+	self.last = timestamp
+	interval = self.interval()
+	missed = 0
+	duplicate = False
+	if interval:
+	    if gap > self.late_factor * interval:
+		missed = int(round(gap / interval)) - 1
+	    elif gap < self.early_factor * interval:
+		duplicate = True
+	self.missed += missed
+	if duplicate:
+	    self.duplicates += 1
+	    return missed, duplicate
+	# late gaps still count, so the interval follows a camera that slows down
+	if len(self.gaps) < self.window:
+	    self.gaps.append(gap)
+	else:
+	    self.gaps[self.next] = gap
+	    self.next = (self.next + 1) % self.window
+	return missed, duplicate
+
+    # frames per second actually delivered so far
+    def rate(self):
+	if self.frames < 2 or self.last <= self.first:
+	    return 0.0
+	return (self.frames - 1) / (self.last - self.first)
+
+# one row per frame handled while recording, saved with the trial (see
+# trialdata.save_trial):
+#   index      capture number (gaps are frames captured but dropped before tracking)
+#   timestamp  grab time, in seconds since the trial started
+#   latency    seconds from grab until the frame was tracked and recorded
+#   sample     sample number of the trial's tracker the frame became (0 for the
+#              background, -1 if the object was not found); when tracking several
+#              objects, the tracker is the track saved as Data.bin, whose samples
+#              are filled in once it is known (see assign_samples)
+#   missed     frames the camera missed just before this one (see FrameCadence)
+#   duplicate  1 if the camera handed this frame over twice
+#   frame      frame number it was recorded as (0 for the background, -1 if it
+#              was not recorded); the same as sample when tracking one object
+# (logs saved before the frame column have only the columns before it)
+FRAME_COLUMNS = ["index", "timestamp", "latency", "sample", "missed", "duplicate", "frame"]
+
+class FrameLog(object):
+    column_names = FRAME_COLUMNS
+
+    def __init__(self):
+	self.rows = []
+
+    def add(self, index, timestamp, latency, sample, missed, duplicate, frame):
+	self.rows.append((index, timestamp, latency, sample, missed, int(duplicate), frame))
+
+    # number the samples of the track saved as the trial's tracker, given the
+    # frame each of its samples was recorded in (see multitrack.ObjectTrack)
+    def assign_samples(self, frames):
+	sample_of = {0: 0}
+	for n, frame in enumerate(frames):
+	    sample_of[frame] = n + 1
+	rows = []
+	for row in self.rows:
+	    rows.append(row[:3] + (sample_of.get(row[6], -1),) + row[4:])
+	self.rows = rows
+
+    def __len__(self):
+	return len(self.rows)
+
+    # one float64 array per entry of FRAME_COLUMNS
+    def columns(self):
+	table = numpy.array(self.rows, dtype=numpy.float64).reshape(-1, len(FRAME_COLUMNS))
+	columns = {}
+	for n, name in enumerate(FRAME_COLUMNS):
+	    columns[name] = table[:, n]
+	return columns
+
+    # achieved rate, frame losses and latency over the whole log
+    def summary(self):
+	return summarize_frames(self.columns())
+
+# summary of a frame log's columns (as FrameLog.columns or trialdata.load_frame_log give them)
+def summarize_frames(columns):
+    index = columns["index"]
+    timestamp = columns["timestamp"]
+    latency = columns["latency"]
+    summary = {"frames": len(index),
+	       "samples": int((columns["sample"] > 0).sum()),
+	       "missed": int(columns["missed"].sum()),
+	       "duplicates": int(columns["duplicate"].sum()),
+	       "dropped": 0,
+	       "achieved_rate": 0.0,
+	       "sample_rate": 0.0,
+	       "latency_mean": 0.0,
+	       "latency_p50": 0.0,
+	       "latency_p99": 0.0,
+	       "latency_max": 0.0}
+    if not len(index):
+	return summary
+    summary["dropped"] = int((numpy.diff(index) - 1).clip(0).sum())
+    span = float(timestamp[-1] - timestamp[0])
+    if span > 0:
+	summary["achieved_rate"] = (len(index) - 1) / span
+	summary["sample_rate"] = summary["samples"] / span
+    summary["latency_mean"] = float(latency.mean())
+    summary["latency_p50"] = float(numpy.percentile(latency, 50))
+    summary["latency_p99"] = float(numpy.percentile(latency, 99))
+    summary["latency_max"] = float(latency.max())
+    return summary
+
+###########################
+#   PLAYBACK SCHEDULING   #
+###########################
+# times a replay by the recording: step k is due when the wall clock has moved
+# on (times[k] - times[start]) / speed seconds from when the start step was
+# shown, times being each step's recorded time in seconds
+# when showing a step takes longer than the gap to the next, the steps that
+# are already overdue are skipped, straight to the latest one due, so the
+# replay keeps to the recording's pace instead of drifting behind it
+class PlaybackScheduler(object):
+
+    # window is the number of latest steps shown the rates are taken over
+    def __init__(self, times, speed = 1.0, window = 30, clock = monotonic):
+	self.times = numpy.asarray(times, dtype=numpy.float64)
+	self.speed = speed
+	self.window = window
+	self.clock = clock
+	self.anchor = None
+	# (wall time, step) of the latest steps shown
+	self.history = []
+	self.skipped = 0
+
+    # step index is shown now; time the steps after it from here
+    def start(self, index):
+	self.anchor = (self.clock(), self.times[index])
+	self.history = [(self.anchor[0], index)]
+
+    # change the speed multiplier, keeping step index (shown last) where it is
+    def set_speed(self, speed, index):
+	self.speed = speed
+	self.start(index)
+
+    # wall clock time at which step index is due
+    def due(self, index):
+	wall, recorded = self.anchor
+	return wall + (self.times[index] - recorded) / self.speed
+
+    # (step to show after step index, seconds to wait before showing it)
+    # the step is index + 1 unless later ones are already due (up to last)
+    def next(self, index, last):
+	now = self.clock()
+	following = min(index + 1, last)
+	wait = self.due(following) - now
+	if wait > 0:
+	    return following, wait
+	wall, recorded = self.anchor
+	latest = numpy.searchsorted(self.times, recorded + (now - wall) * self.speed, "right") - 1
+	return max(following, min(int(latest), last)), 0.0
+
+    # note that step index was shown, skipped steps after the one shown before it
+    def shown(self, index, skipped):
+	self.history.append((self.clock(), index))
+	if len(self.history) > self.window:
+	    del self.history[0]
+	self.skipped += skipped
+
+    # (steps shown per second, steps per second the recording calls for at
+    # this speed) over the latest steps shown
+    def rates(self):
+	if len(self.history) < 2:
+	    return 0.0, 0.0
+	first_wall, first_index = self.history[0]
+	last_wall, last_index = self.history[-1]
+	elapsed = last_wall - first_wall
+	recorded = (self.times[last_index] - self.times[first_index]) / self.speed
+	if elapsed <= 0 or recorded <= 0:
+	    return 0.0, 0.0
+	return (len(self.history) - 1) / elapsed, (last_index - first_index) / recorded
@@ -0,0 +1,297 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cPickle
+import json
+import numpy
+import os
+import re
+import struct
+import sys
+from kinematics import Speed
+
+###########################
+#   COLUMNAR TRIAL DATA   #
+###########################
+# each trial folder holds a Data.bin file laid out as:
+#   magic "MTRK", format version (uint16), header length (uint32)
+#   a JSON header with the trial summary, the column layout and (optionally)
+#   the settings it was tracked with
+#   one contiguous little-endian float64 column per row of the Speed buffer,
+#   starting at a 64-byte aligned offset
+#   optionally, a frame log: one float64 column per entry of the header's
+#   "frame_log" columns, each as long as its "length", right after the Speed
+#   columns (files without one, and readers that do not know it, are unaffected)
+# the columns are memory-mapped on load, so opening a trial takes the same
+# time whatever its length
+DATA_FILE = "Data.bin"
+# name of the pickled Speed object written by older versions
+PICKLE_FILE = "Data"
+# each object of a multi-object trial, by track id (see multitrack.py), in the
+# same format as Data.bin, whose frame log gives the recorded frame of every sample
+TRACK_FILE = "Track_%d.bin"
+MAGIC = "MTRK"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<4sHI")
+ALIGNMENT = 64
+# buffer row -> column name (a_net is stored once, as v_net)
+COLUMNS = ["x", "y", "t", "v_x", "v_y", "a_x", "a_y", "v_net", "distance"]
+
+# summary of a trial, as stored in the header
+def summarize(speed):
+    n = speed.num_samples()
+    x = speed.x[1:]
+    y = speed.y[1:]
+    summary = {"num_samples": n,
+	       "start_time": speed.start_time,
+	       "stop_time": speed.stop_time,
+	       "duration": float(speed.t.sum()),
+	       "out_folder": speed.out_folder,
+	       "streaming": speed.streaming,
+	       "total_distance": speed.total_distance,
+	       "top_speed": speed.top_speed,
+	       "x_extent": [0.0, 0.0],
+	       "y_extent": [0.0, 0.0]}
+    if n:
+	summary["x_extent"] = [float(x.min()), float(x.max())]
+	summary["y_extent"] = [float(y.min()), float(y.max())]
+    return summary
+
+# write the trial (metrics must be up to date) to folder/Data.bin
+# settings optionally records how the trial was tracked (color range,
+# conversion factor, source footage), stored with the header as is; a
+# "primary_track" entry says the samples are those of one track of a
+# multi-object trial, taken only from the frames it was matched in (the frame
+# log's frame column gives the frame of each), so sample k is not frame k
+# frame_log optionally adds the per-frame timing of the recording (a timing.FrameLog,
+# or anything else with column_names, columns() and summary())
+# file_name is DATA_FILE unless saving one object's track
+def save_trial(speed, folder, settings = None, frame_log = None, file_name = DATA_FILE):
+    summary = summarize(speed)
+    n = speed.num_samples()
+    header = {"version": FORMAT_VERSION,
+	      "summary": summary,
+	      "dtype": "<f8",
+	      "columns": COLUMNS,
+	      "aliases": {"a_net": "v_net"},
+	      "column_length": n + 2}
+    if settings:
+	header["settings"] = settings
+    frame_columns = None
+    if frame_log is not None:
+	frame_columns = frame_log.columns()
+	header["frame_log"] = {"columns": frame_log.column_names,
+			       "length": len(frame_log),
+			       "summary": frame_log.summary()}
+    header_text = json.dumps(header)
+    data_offset = PREAMBLE.size + len(header_text)
+    data_offset += (ALIGNMENT - data_offset % ALIGNMENT) % ALIGNMENT
+    header_text = header_text.ljust(data_offset - PREAMBLE.size)
+    buf = speed.buffer()
+    f = open(os.path.join(str(folder), file_name), 'wb')
+    try:
+	f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_text)))
+	f.write(header_text)
+	for row in range(len(COLUMNS)):
+	    f.write(buf[row].astype("<f8").tostring())
+	if frame_columns is not None:
+	    for name in frame_log.column_names:
+		f.write(frame_columns[name].astype("<f8").tostring())
+    finally:
+	f.close()
+
+# read only the header of folder/Data.bin (or of another file in its format)
+# returns (header dict, offset of the first column)
+def read_header(folder, file_name = DATA_FILE):
+    f = open(os.path.join(str(folder), file_name), 'rb')
+    try:
+	magic, version, header_size = PREAMBLE.unpack(f.read(PREAMBLE.size))
+	if magic != MAGIC:
+	    raise ValueError("not a trial data file: " + str(folder))
+	if version > FORMAT_VERSION:
+	    raise ValueError("trial data version " + str(version) + " is newer than this program")
+	header = json.loads(f.read(header_size))
+    finally:
+	f.close()
+    return header, PREAMBLE.size + header_size
+
+# open folder/Data.bin as a read-only Speed whose columns are memory-mapped
+def load_trial(folder, file_name = DATA_FILE):
+    header, offset = read_header(folder, file_name)
+    summary = header["summary"]
+    buf = numpy.memmap(os.path.join(str(folder), file_name), dtype=header["dtype"], mode='r',
+		       offset=offset, shape=(len(header["columns"]), header["column_length"]))
+    speed = Speed(summary["streaming"])
+    speed.start_time = summary["start_time"]
+    speed.stop_time = summary["stop_time"]
+    speed.out_folder = summary["out_folder"]
+    speed.use_buffer(buf, summary["num_samples"], summary["total_distance"], summary["top_speed"])
+    return speed
+
+# a frame log read back from a trial, which save_trial can write out again
+class FrameTable(object):
+
+    def __init__(self, column_names, columns, summary):
+	self.column_names = column_names
+	self.table = columns
+	self.stored_summary = summary
+
+    def __len__(self):
+	return len(self.table[self.column_names[0]])
+
+    # name -> column
+    def columns(self):
+	return self.table
+
+    def summary(self):
+	return self.stored_summary
+
+# the frame log saved with a trial (see timing.FrameLog) as a FrameTable, or
+# None if the trial has none
+# its columns are memory-mapped unless copy is set (copy before saving the trial
+# again, since that rewrites the file they are mapped from)
+def load_frame_log(folder, copy = False, file_name = DATA_FILE):
+    if not os.path.exists(os.path.join(str(folder), file_name)):
+	return None
+    header, offset = read_header(folder, file_name)
+    log = header.get("frame_log")
+    if log is None:
+	return None
+    names = log["columns"]
+    offset += len(header["columns"]) * header["column_length"] * numpy.dtype(header["dtype"]).itemsize
+    if log["length"]:
+	table = numpy.memmap(os.path.join(str(folder), file_name), dtype=header["dtype"], mode='r',
+			     offset=offset, shape=(len(names), log["length"]))
+	if copy:
+	    table = numpy.array(table)
+    else:
+	table = numpy.zeros((len(names), 0))
+    columns = {}
+    for n, name in enumerate(names):
+	columns[name] = table[n]
+    return FrameTable(names, columns, log["summary"])
+
+# recorded time of every frame of the trial in folder, in seconds from the
+# background (frame 0), or None if they are not known
+# they come from the frame log where it has a frame column, and otherwise from
+# the timesteps of Data.bin, unless its samples are not one per frame
+def frame_times(folder):
+    log = load_frame_log(folder)
+    if log is not None and "frame" in log.column_names:
+	columns = log.columns()
+	recorded = columns["frame"] >= 0
+	frames = columns["frame"][recorded].astype(numpy.intp)
+	if not len(frames):
+	    return None
+	times = numpy.zeros(frames.max() + 1)
+	times[frames] = columns["timestamp"][recorded]
+	return times
+    if os.path.exists(os.path.join(str(folder), DATA_FILE)):
+	settings = read_header(folder)[0].get("settings") or {}
+	if "primary_track" in settings or settings.get("multi_object"):
+	    return None
+    return numpy.concatenate(([0.0], numpy.cumsum(open_trial(folder).t)))
+
+# save every track of a multitrack.MultiTracker (metrics must be up to date) as
+# folder/Track_<id>.bin
+# start_time is the timestamp of the recording's background frame (the
+# tracker's start_time), which every track's frame summary keeps
+def save_tracks(tracks, folder, settings = None, start_time = None):
+    for track in tracks:
+	summary = {"track": track.id, "samples": len(track.frames)}
+	if start_time is not None:
+	    summary["recording_start"] = start_time
+	frames = FrameTable(["frame"], {"frame": numpy.array(track.frames, dtype=numpy.float64)}, summary)
+	save_trial(track.speed, folder, settings, frames, TRACK_FILE % track.id)
+
+# timestamp of the background frame of the multi-object trial in folder (the
+# time its tracks' start_time are counted from), or None if it was not saved
+def recording_start(folder):
+    for track_id in track_ids(folder):
+	summary = load_frame_log(folder, file_name = TRACK_FILE % track_id).summary()
+	return summary.get("recording_start")
+    return None
+
+# ids of the tracks saved in folder, in order
+def track_ids(folder):
+    ids = []
+    for name in os.listdir(str(folder)):
+	match = re.match(r"^Track_(\d+)\.bin$", name)
+	if match:
+	    ids.append(int(match.group(1)))
+    ids.sort()
+    return ids
+
+# every track saved in folder as (id, Speed, recorded frame of each sample),
+# with memory-mapped columns; empty for single-object trials
+def load_tracks(folder):
+    tracks = []
+    for track_id in track_ids(folder):
+	file_name = TRACK_FILE % track_id
+	frames = load_frame_log(folder, file_name = file_name).columns()["frame"]
+	tracks.append((track_id, load_trial(folder, file_name), frames))
+    return tracks
+
+# load a Speed pickled by older versions (as __main__.Speed or kinematics.Speed)
+def load_pickled(path):
+    f = open(path, 'rb')
+    try:
+	unpickler = cPickle.Unpickler(f)
+	unpickler.find_global = find_speed_class
+	return unpickler.load()
+    finally:
+	f.close()
+
+def find_speed_class(module, name):
+    if name == "Speed":
+	return Speed
+    __import__(module)
+    return getattr(sys.modules[module], name)
+
+# load whichever data file the trial folder has
+def open_trial(folder):
+    if os.path.exists(os.path.join(str(folder), DATA_FILE)):
+	return load_trial(folder)
+    return load_pickled(os.path.join(str(folder), PICKLE_FILE))
+
+# write Data.bin next to the pickled Data file of a trial
+# returns False if the trial has already been converted
+def convert_trial(folder, overwrite = False):
+    if os.path.exists(os.path.join(str(folder), DATA_FILE)) and not overwrite:
+	return False
+    speed = load_pickled(os.path.join(str(folder), PICKLE_FILE))
+    save_trial(speed, folder)
+    return True
+
+# whether path is a trial folder with data in either format
+def is_trial(path):
+    return os.path.exists(os.path.join(path, DATA_FILE)) or os.path.exists(os.path.join(path, PICKLE_FILE))
+
+# trial folders under each path (a path may itself be a trial folder)
+def find_trials(paths):
+    trials = []
+    for path in paths:
+	if is_trial(path):
+	    trials.append(path)
+	elif os.path.isdir(path):
+	    for name in sorted(os.listdir(path)):
+		sub = os.path.join(path, name)
+		if os.path.isdir(sub) and is_trial(sub):
+		    trials.append(sub)
+    return trials
+
+# convert pickled trials: python trialdata.py [--overwrite] Videos/ [Videos/Trial_x ...]
+def main():
+    args = sys.argv[1:]
+    overwrite = "--overwrite" in args
+    paths = [a for a in args if a != "--overwrite"] or ["Videos"]
+    for folder in find_trials(paths):
+	if not os.path.exists(os.path.join(folder, PICKLE_FILE)):
+	    continue
+	if convert_trial(folder, overwrite):
+	    print "converted " + folder
+	else:
+	    print "skipped " + folder + " (already converted)"
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python2.6
+
+# computation libraries
+import cv
+import numpy
+import os
+from framewriter import FrameWriter
+
+###########################
+#  SINGLE-FILE VIDEO FILE #
+###########################
+# frames of a trial stored as one MJPEG stream (frames.mjpg: JPEG images
+# back to back) plus an index (frames.idx: int64 rows of frame number,
+# byte offset and byte length), so any frame can be read without
+# scanning the stream or listing thousands of PNG files
+CONTAINER_FILE = "frames.mjpg"
+INDEX_FILE = "frames.idx"
+DEFAULT_QUALITY = 90
+
+# whether a trial folder stores its frames in a container
+def has_container(folder):
+    return os.path.exists(os.path.join(str(folder), INDEX_FILE))
+
+# FrameWriter that encodes JPEGs on its encoder threads and appends them to
+# the container; frames may land in any order, the index says where each one is
+class ContainerWriter(FrameWriter):
+
+    def __init__(self, folder, quality = DEFAULT_QUALITY, **kwargs):
+	self.quality = quality
+	self.stream = open(os.path.join(str(folder), CONTAINER_FILE), 'wb')
+	self.offset = 0
+	self.index = []
+	FrameWriter.__init__(self, folder, **kwargs)
+
+    def store(self, index, img):
+	data = cv.EncodeImage(".jpg", img, [cv.CV_IMWRITE_JPEG_QUALITY, self.quality]).tostring()
+	self.lock.acquire()
+	try:
+	    self.stream.write(data)
+	    self.index.append((index, self.offset, len(data)))
+	    self.offset += len(data)
+	finally:
+	    self.lock.release()
+
+    # the index is written once all frames are in, so a container with an
+    # index is always complete
+    def finish(self):
+	self.stream.close()
+	index = numpy.array(sorted(self.index), dtype=numpy.int64).reshape(-1, 3)
+	index.tofile(os.path.join(self.folder, INDEX_FILE))
+
+# random access to the frames of a container
+class ContainerReader(object):
+
+    def __init__(self, folder):
+	index = numpy.fromfile(os.path.join(str(folder), INDEX_FILE), dtype=numpy.int64).reshape(-1, 3)
+	size = 0
+	if len(index):
+	    size = int(index[:, 0].max()) + 1
+	# frame number -> (offset, length), length -1 for frames that were dropped
+	self.offsets = numpy.zeros(size, dtype=numpy.int64)
+	self.lengths = numpy.zeros(size, dtype=numpy.int64) - 1
+	self.offsets[index[:, 0]] = index[:, 1]
+	self.lengths[index[:, 0]] = index[:, 2]
+	self.stream = open(os.path.join(str(folder), CONTAINER_FILE), 'rb')
+
+    # number of frame slots (including dropped frames)
+    def num_frames(self):
+	return len(self.offsets)
+
+    # whether frame index was saved
+    def has_frame(self, index):
+	return 0 <= index < len(self.lengths) and self.lengths[index] >= 0
+
+    # decode frame index, or return None if it was not saved
+    def read(self, index):
+	if not self.has_frame(index):
+	    return None
+	length = int(self.lengths[index])
+	self.stream.seek(int(self.offsets[index]))
+	data = self.stream.read(length)
+	mat = cv.CreateMatHeader(1, length, cv.CV_8UC1)
+	cv.SetData(mat, data, length)
+	return cv.DecodeImage(mat, cv.CV_LOAD_IMAGE_COLOR)
+
+    def close(self):
+	self.stream.close()